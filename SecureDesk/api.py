@@ -0,0 +1,196 @@
+"""
+Versioned JSON API (/api/v1) over notes and password entries
+
+List endpoints take ``fields`` (comma-separated columns to return; only
+those are selected from the database), ``limit`` and ``cursor``. Items are
+ordered newest first by id; ``next_cursor`` in a response fetches the
+following page and is null on the last one. Lists are streamed as they are
+read, so even the largest page is never built in memory; with ``content``,
+each note is written a chunk at a time. Password values are never returned
+here.
+
+Clients authenticate with a personal access token (see utils/tokens.py) or a
+browser session.
+"""
+
+import base64
+import binascii
+from flask import Blueprint, Response, request, current_app, stream_with_context
+from flask_login import login_required, current_user
+from werkzeug.exceptions import HTTPException, BadRequest, NotFound
+from models import db, Note, NoteChunk, PasswordEntry
+from utils.replication import read_replica
+from utils.serialization import dumps
+from utils.tokens import require_scope
+
+# Create API blueprint
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+NOTE_FIELDS = ('id', 'title', 'snippet', 'size', 'content', 'folder_id', 'revision_count', 'created_at', 'updated_at')
+NOTE_DEFAULT_FIELDS = ('id', 'title', 'snippet', 'folder_id', 'created_at', 'updated_at')
+PASSWORD_FIELDS = ('id', 'service_name', 'username', 'folder_id', 'created_at', 'updated_at')
+PASSWORD_DEFAULT_FIELDS = PASSWORD_FIELDS
+
+# Rows read from the database per streamed chunk
+STREAM_BATCH = 500
+# Note chunks (64K characters each) read at a time when writing content
+CONTENT_BATCH = 4
+
+def _json(payload, status=200) -> Response:
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+# Codes with app-wide HTML handlers need their own entry to take precedence
+@api_bp.errorhandler(HTTPException)
+@api_bp.errorhandler(404)
+@api_bp.errorhandler(429)
+@api_bp.errorhandler(500)
+@api_bp.errorhandler(503)
+def api_error(error):
+    """Errors as JSON instead of HTML pages"""
+    if error.code >= 500:
+        db.session.rollback()
+    response = _json({'error': {'status': error.code, 'message': error.description}}, error.code)
+    if getattr(error, 'retry_after', None):
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def _parse_fields(allowed: tuple, default: tuple) -> tuple:
+    """Requested fields in the order given, validated against ``allowed``"""
+    raw = request.args.get('fields')
+    if not raw:
+        return default
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown) or '(none)'}; choose from {', '.join(allowed)}")
+    return fields
+
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except (ValueError, binascii.Error):
+        raise BadRequest("Invalid cursor")
+
+def _page_limit() -> int:
+    maximum = current_app.config.get('API_MAX_PAGE_SIZE', 5000)
+    limit = request.args.get('limit', current_app.config.get('API_PAGE_SIZE', 100), type=int)
+    if not 1 <= limit <= maximum:
+        raise BadRequest(f"limit must be between 1 and {maximum}")
+    return limit
+
+def _select(model, fields: tuple):
+    """SELECT of only the requested columns (plus id) of the user's rows"""
+    columns = [getattr(model, name) for name in fields if name not in ('id', 'content')]
+    return db.select(model.id, *columns).where(model.user_id == current_user.id)
+
+def _note_chunks(note_id: int):
+    """Decompressed chunks of a note's content, in order, read a few at a time"""
+    result = db.session.execute(
+        db.select(NoteChunk.data).where(NoteChunk.note_id == note_id)
+        .order_by(NoteChunk.seq).execution_options(yield_per=CONTENT_BATCH)
+    )
+    yield from result.scalars()
+
+def _items(model, fields: tuple, rows) -> list:
+    """Response objects for a batch of rows from ``_select``"""
+    names = ['id'] + [name for name in fields if name not in ('id', 'content')]
+    items = [dict(zip(names, row)) for row in rows]
+    if 'content' in fields:
+        for item in items:
+            item['content'] = ''.join(_note_chunks(item['id']))
+    return [{name: item[name] for name in fields} for item in items]
+
+def _stream_note(fields: tuple, row):
+    """JSON of one note from ``_select``, its content encoded chunk by chunk"""
+    names = ['id'] + [name for name in fields if name not in ('id', 'content')]
+    item = dict(zip(names, row))
+    for i, name in enumerate(fields):
+        yield (b',' if i else b'{') + dumps(name) + b':'
+        if name == 'content':
+            # Each piece is a complete JSON string; drop its quotes to join them into one
+            yield b'"'
+            for data in _note_chunks(item['id']):
+                yield dumps(data)[1:-1]
+            yield b'"'
+        else:
+            yield dumps(item[name])
+    yield b'}'
+
+def _stream_list(model, fields: tuple) -> Response:
+    """Stream one page of the user's rows as {"data": [...], "next_cursor": ...}"""
+    limit = _page_limit()
+    query = _select(model, fields)
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.where(model.id < _decode_cursor(cursor))
+    # One row beyond the page tells whether another page follows
+    query = query.order_by(model.id.desc()).limit(limit + 1)
+
+    def generate():
+        yield b'{"data":['
+        result = db.session.execute(query.execution_options(yield_per=STREAM_BATCH))
+        sent, last_id, more = 0, None, False
+        for rows in result.partitions():
+            if len(rows) > limit - sent:
+                rows, more = rows[:limit - sent], True
+            if not rows:
+                break
+            if sent:
+                yield b','
+            if 'content' in fields:
+                # Notes can be megabytes each; never hold more than one chunk of one
+                for i, row in enumerate(rows):
+                    if i:
+                        yield b','
+                    yield from _stream_note(fields, row)
+            else:
+                yield b','.join(dumps(item) for item in _items(model, fields, rows))
+            sent += len(rows)
+            last_id = rows[-1][0]
+        result.close()
+        yield b'],"next_cursor":' + dumps(_encode_cursor(last_id) if more else None) + b'}'
+
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+def _detail(model, item_id: int, fields: tuple) -> Response:
+    row = db.session.execute(_select(model, fields).where(model.id == item_id)).first()
+    if row is None:
+        raise NotFound("No such item")
+    return _json({'data': _items(model, fields, [row])[0]})
+
+@api_bp.route('/notes')
+@login_required
+@require_scope('notes')
+@read_replica
+def list_notes():
+    """List the user's notes"""
+    return _stream_list(Note, _parse_fields(NOTE_FIELDS, NOTE_DEFAULT_FIELDS))
+
+@api_bp.route('/notes/<int:note_id>')
+@login_required
+@require_scope('notes')
+@read_replica
+def get_note(note_id):
+    """One note (including its content unless ``fields`` says otherwise)"""
+    return _detail(Note, note_id, _parse_fields(NOTE_FIELDS, NOTE_DEFAULT_FIELDS + ('content',)))
+
+@api_bp.route('/passwords')
+@login_required
+@require_scope('passwords')
+@read_replica
+def list_passwords():
+    """List the user's password entries (without their passwords)"""
+    return _stream_list(PasswordEntry, _parse_fields(PASSWORD_FIELDS, PASSWORD_DEFAULT_FIELDS))
+
+@api_bp.route('/passwords/<int:password_id>')
+@login_required
+@require_scope('passwords')
+@read_replica
+def get_password(password_id):
+    """One password entry (without its password)"""
+    return _detail(PasswordEntry, password_id, _parse_fields(PASSWORD_FIELDS, PASSWORD_DEFAULT_FIELDS))
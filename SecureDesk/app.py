@@ -1,7 +1,9 @@
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, Request, render_template, redirect, url_for, flash, request, session, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_required, current_user
 import os
+import hmac
+from datetime import datetime
 from config import config
 from markupsafe import Markup
 
@@ -18,21 +20,90 @@ import sys
 if 'PYTEST_CURRENT_TEST' in os.environ or 'pytest' in sys.modules:
     app.config.from_object(config['testing'])
 
+class AppRequest(Request):
+    """Request class allowing form fields as large as the biggest note"""
+    max_form_memory_size = app.config.get('MAX_FORM_MEMORY_SIZE')
+
+app.request_class = AppRequest
+
 # Import models and initialize db
 from models import db, User, Note, PasswordEntry
 
 # Initialize extensions
+from utils.dbpool import configure_pool, label_pools, record_pool_gauges
+from utils.metrics import metrics
+configure_pool(app)
 db.init_app(app)
+label_pools(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
+from utils.ratelimit import limiter
+limiter.init_app(app)
+
+# Server-side sessions and periodic background workers
+from utils.sessions import init_sessions
+from utils.background import init_background
+init_sessions(app)
+init_background(app)
+
+from utils.jobs import runner
+runner.init_app(app)
+
+from utils.compression import configure_compression
+configure_compression(app)
+
+from utils.blobstore import init_blob_store
+init_blob_store(app)
+
+from utils.strength import init_strength
+init_strength(app)
+
+from utils.replication import init_replication, read_replica
+init_replication(app)
+
+from utils.sharding import init_sharding
+init_sharding(app)
+
+from utils.auditlog import init_audit_log
+init_audit_log(app)
+
+from utils.lastseen import init_last_seen
+init_last_seen(app)
+
+# Personal access tokens authenticate API clients without a session
+from utils.tokens import init_tokens
+init_tokens(app, login_manager)
+
+from utils.rotation import init_rotation, due_rotations
+init_rotation(app)
+
+from utils.trash import init_trash
+init_trash(app)
+
+# Sampled per-request profiles, downloadable from /profiles
+from utils.profiler import init_profiler, get_profiler, authorized as profile_authorized, format_folded
+init_profiler(app)
+
+# flask synthetic load: bulk test data for load tests (see benchmarks/loadtest_app.py)
+from utils.synthetic import synthetic_cli
+app.cli.add_command(synthetic_cli)
+
 @login_manager.user_loader
 def load_user(user_id):
+    # Server-side sessions fetch the user row together with the session data
+    user = getattr(session, 'user', None)
+    if user is not None and user.id == int(user_id):
+        return user
     return User.query.get(int(user_id))
 
+# Cache compiled template bytecode on disk so new workers skip recompilation
+from utils.templates import configure_template_cache
+configure_template_cache(app)
+
 # Template filters
 @app.template_filter('nl2br')
 def nl2br_filter(text):
@@ -51,6 +122,7 @@ def index():
 
 @app.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
     """Main dashboard showing overview of user's notes and password entries"""
     # Get recent notes and password entries for dashboard
@@ -65,22 +137,76 @@ def dashboard():
                          recent_notes=recent_notes,
                          recent_passwords=recent_passwords,
                          total_notes=total_notes,
-                         total_passwords=total_passwords)
+                         total_passwords=total_passwords,
+                         due_rotations=due_rotations(current_user.id),
+                         now=datetime.utcnow())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for scrapers presenting the METRICS_TOKEN bearer token"""
+    token = app.config.get('METRICS_TOKEN')
+    supplied = request.headers.get('Authorization', '')
+    if not token or not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+        abort(404)
+    record_pool_gauges(app)
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/profiles/')
+@app.route('/profiles/<endpoint>.folded')
+def profiles(endpoint=None):
+    """Profiled endpoints, or one endpoint's aggregate collapsed stacks, for PROFILE_TOKEN holders"""
+    if not profile_authorized(request.headers.get('Authorization', ''), prefix='Bearer '):
+        abort(404)
+    profiler = get_profiler()
+    if endpoint is None:
+        return ''.join(f'{name}\n' for name in profiler.endpoints()), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    counts = profiler.profile(endpoint) if endpoint in app.view_functions else None
+    if not counts:
+        abort(404)
+    return format_folded(counts), 200, {
+        'Content-Type': 'text/plain; charset=utf-8',
+        'Content-Disposition': f'attachment; filename="{endpoint}.folded"',
+    }
 
 # Register blueprints
 from auth import auth_bp
 from notes import notes_bp
 from passwords import passwords_bp
+from jobs import jobs_bp
+from vaults import vaults_bp
+from api import api_bp
+from trash import trash_bp
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(notes_bp)
 app.register_blueprint(passwords_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(vaults_bp)
+app.register_blueprint(api_bp)
+app.register_blueprint(trash_bp)
+# API clients get a 401 instead of a redirect to the login page
+login_manager.blueprint_login_views['api'] = None
 
 # Error handlers
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
+@app.errorhandler(429)
+def too_many_requests_error(error):
+    response = app.make_response((render_template('errors/429.html'), 429))
+    if error.retry_after:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.errorhandler(503)
+def service_unavailable_error(error):
+    db.session.rollback()
+    response = app.make_response((render_template('errors/503.html', description=error.description), 503))
+    if getattr(error, 'retry_after', None):
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @app.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
@@ -4,14 +4,22 @@ Authentication routes and logic
 
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
-from models import db, User
-from utils.forms import RegistrationForm, LoginForm
+from models import db, User, AuditEvent, AccessToken
+from utils.forms import RegistrationForm, LoginForm, AccessTokenForm, DeleteConfirmationForm, DeleteAccountForm
+from utils.ratelimit import limiter
+from utils.sessions import revoke_user_sessions
+from utils.auditlog import audit, get_audit_log, ACTION_LABELS
+from utils.lastseen import record_login, effective_times
+from utils.tokens import issue_token, revoke_token, get_token_cache, SCOPES
+from utils.jobs import runner, job_handler
+from utils.trash import delete_account_data
 from datetime import datetime
 
 # Create authentication blueprint
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@limiter.limit()
 def register():
     """User registration route"""
     # Redirect if already authenticated
@@ -44,6 +52,7 @@ def register():
     return render_template('register.html', form=form)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@limiter.limit()
 def login():
     """User login route"""
     # Redirect if already authenticated
@@ -56,13 +65,14 @@ def login():
         # Find user by email
         user = User.query.filter_by(email=form.email.data.lower().strip()).first()
         
-        # Check credentials
-        if user and user.check_password(form.password.data):
-            # Update last login time
-            user.update_last_login()
+        # Check credentials; deleted accounts stay refused while their data is removed
+        if user and user.deleted_at is None and user.check_password(form.password.data):
+            # Buffered; written with the next last-seen flush
+            record_login(user.id)
             
             # Log in user
             login_user(user, remember=False)
+            audit('login')
             
             flash(f'Welcome back, {user.email}!', 'success')
             
@@ -72,6 +82,8 @@ def login():
                 return redirect(next_page)
             return redirect(url_for('dashboard'))
         else:
+            if user:
+                audit('login_failed', user_id=user.id)
             flash('Invalid email or password. Please try again.', 'error')
     
     return render_template('login.html', form=form)
@@ -80,12 +92,102 @@ def login():
 @login_required
 def logout():
     """User logout route"""
+    audit('logout')
     logout_user()
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('auth.login'))
 
+@auth_bp.route('/logout-all', methods=['POST'])
+@login_required
+def logout_all():
+    """Log out of every device by revoking all server-side sessions"""
+    revoke_user_sessions(current_user.id)
+    audit('logout_all')
+    logout_user()
+    flash('You have been logged out on all devices.', 'info')
+    return redirect(url_for('auth.login'))
+
+@auth_bp.route('/activity')
+@login_required
+def activity():
+    """Paginated audit log of the user's sign-ins, reveals and deletions"""
+    page = request.args.get('page', 1, type=int)
+    # Show events still waiting in the queue too
+    get_audit_log().flush()
+    events = AuditEvent.query.filter_by(user_id=current_user.id).order_by(AuditEvent.id.desc()).paginate(
+        page=page, per_page=25, error_out=False, max_per_page=100
+    )
+    return render_template('activity.html', events=events, labels=ACTION_LABELS)
+
 @auth_bp.route('/profile')
 @login_required
 def profile():
     """User profile page"""
-    return render_template('profile.html', user=current_user)
\ No newline at end of file
+    last_login, last_seen = effective_times(current_user)
+    return render_template('profile.html', user=current_user, last_login=last_login, last_seen=last_seen,
+                           delete_form=DeleteAccountForm(formdata=None))
+
+@auth_bp.route('/delete-account', methods=['POST'])
+@login_required
+@limiter.limit()
+def delete_account():
+    """Delete the user's account: sign out everywhere now, remove the data in the background"""
+    form = DeleteAccountForm()
+    if not form.validate_on_submit() or not current_user.check_password(form.password.data):
+        flash('Incorrect password. Your account was not deleted.', 'error')
+        return redirect(url_for('auth.profile'))
+    
+    user_id = current_user.id
+    current_user.deleted_at = datetime.utcnow()
+    AccessToken.query.filter_by(user_id=user_id).delete()
+    db.session.commit()
+    get_token_cache().revoked()
+    revoke_user_sessions(user_id)
+    logout_user()
+    
+    # A system job, since the user (and so their jobs) is about to disappear
+    runner.submit('delete_account', account_id=user_id)
+    flash('Your account has been deleted.', 'info')
+    return redirect(url_for('auth.login'))
+
+@job_handler('delete_account')
+def delete_account_job(ctx, account_id, batch_size=None):
+    """Delete a deleted user's rows in small transactions, then the user"""
+    return delete_account_data(account_id, batch_size=batch_size, progress=ctx.progress)
+
+@auth_bp.route('/tokens', methods=['GET', 'POST'])
+@login_required
+def tokens():
+    """List and create personal access tokens for the API"""
+    form = AccessTokenForm()
+    new_token = None
+    
+    if form.validate_on_submit():
+        try:
+            _, new_token = issue_token(current_user.id, form.name.data.strip(), form.scopes.data,
+                                       expires_in_days=int(form.expires.data))
+            db.session.commit()
+            audit('token_created', form.name.data.strip())
+            flash('Token created. Copy it now; it will not be shown again.', 'success')
+            form = AccessTokenForm(formdata=None)
+        except Exception as e:
+            db.session.rollback()
+            flash('An error occurred while creating the token. Please try again.', 'error')
+    
+    user_tokens = AccessToken.query.filter_by(user_id=current_user.id).order_by(AccessToken.created_at.desc()).all()
+    # The new token is rendered once and never stored in the session
+    return render_template('tokens.html', form=form, tokens=user_tokens, new_token=new_token,
+                           revoke_form=DeleteConfirmationForm(), scopes=SCOPES, now=datetime.utcnow())
+
+@auth_bp.route('/tokens/<int:token_id>/revoke', methods=['POST'])
+@login_required
+def revoke(token_id):
+    """Revoke a personal access token"""
+    token = AccessToken.query.filter_by(id=token_id, user_id=current_user.id).first_or_404()
+    form = DeleteConfirmationForm()
+    if form.validate_on_submit():
+        name = token.name
+        if revoke_token(token_id, current_user.id):
+            audit('token_revoked', name)
+            flash('Token revoked.', 'info')
+    return redirect(url_for('auth.tokens'))
\ No newline at end of file
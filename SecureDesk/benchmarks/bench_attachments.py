@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory and throughput of encrypted attachment upload/download
+
+Streams attachments of growing size into the blob store as raw request
+bodies and back out again, reporting the Python heap peak (tracemalloc) and
+throughput for each direction. Peaks should not grow with the file size.
+
+Usage:
+    python benchmarks/bench_attachments.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from app import app, db
+from models import User, Note
+
+SIZES_MB = [1, 8, 32, 96]
+
+def make_file(size):
+    """Random file of the given size on disk (so the upload body is never in memory)"""
+    f = tempfile.TemporaryFile()
+    for _ in range(size // (1024 * 1024)):
+        f.write(os.urandom(1024 * 1024))
+    f.seek(0)
+    return f
+
+def traced(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024
+
+def main():
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com')
+        user.set_password('BenchPassword123')
+        db.session.add(user)
+        db.session.commit()
+        note = Note(title='Files', content='', user_id=user.id)
+        db.session.add(note)
+        db.session.commit()
+        note_id = note.id
+
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'bench@example.com', 'password': 'BenchPassword123'})
+
+    for size_mb in SIZES_MB:
+        size = size_mb * 1024 * 1024
+        body = make_file(size)
+
+        def upload():
+            return client.post(f'/notes/{note_id}/attachments', input_stream=body,
+                               headers={'Content-Type': 'application/octet-stream',
+                                        'X-Filename': f'{size_mb}.bin'})
+        response, up_time, up_peak = traced(upload)
+        body.close()
+        attachment_id = response.json['attachment']['id']
+
+        def download():
+            response = client.get(f'/notes/{note_id}/attachments/{attachment_id}', buffered=False)
+            received = sum(len(part) for part in response.response)
+            response.close()
+            return received
+        received, down_time, down_peak = traced(download)
+        assert received == size
+
+        print(f"{size_mb:3d} MB: upload {size_mb / up_time:6.1f} MB/s, peak heap {up_peak:7.0f} KiB | "
+              f"download {size_mb / down_time:6.1f} MB/s, peak heap {down_peak:7.0f} KiB")
+
+    with app.app_context():
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
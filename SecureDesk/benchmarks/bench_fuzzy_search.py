@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fuzzy service-name search and autocomplete on a large vault
+
+Loads a synthetic 10k-entry vault into an in-memory database, times the cold
+build of the user's trigram index and reports latency percentiles for
+typo-tolerant searches and prefix suggestions, including the per-call version
+check against the database.
+
+Usage:
+    python benchmarks/bench_fuzzy_search.py [entries]
+"""
+
+import os
+import sys
+import time
+import random
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from app import app, db
+from models import User, PasswordEntry
+from utils.search import fuzzy_search, suggest_service_names, get_index
+
+SERVICES = [
+    'Gmail', 'Google Drive', 'Amazon', 'Amazon Web Services', 'GitHub', 'GitLab',
+    'Facebook', 'Instagram', 'Twitter', 'LinkedIn', 'Netflix', 'Spotify', 'Dropbox',
+    'Slack', 'Zoom', 'Microsoft Outlook', 'Azure Portal', 'PayPal', 'Stripe', 'Chase Bank',
+    'Wells Fargo', 'Bank of America', 'Coinbase', 'Reddit', 'Discord', 'Steam', 'Epic Games',
+    'Jira', 'Confluence', 'Atlassian', 'DigitalOcean', 'Heroku', 'Cloudflare', 'Namecheap',
+    'Apple ID', 'iCloud', 'Adobe Creative Cloud', 'Figma', 'Notion', 'Trello', 'Asana',
+]
+SUFFIXES = ['', ' Work', ' Personal', ' Staging', ' Prod', ' Backup', ' Admin', ' Team']
+QUERIES = ['gmial', 'amaz', 'githib', 'netflx', 'bank', 'dropbx', 'cloud', 'micro soft']
+PREFIXES = ['g', 'am', 'git', 'net', 'ba', 'cl', 'stri', 'zo']
+
+def load_vault(entries):
+    """Create one user with the given number of password entries"""
+    user = User(email='bench@example.com')
+    user.password_hash = 'x'
+    db.session.add(user)
+    db.session.commit()
+
+    rng = random.Random(42)
+    rows = [{
+        'service_name': f'{rng.choice(SERVICES)}{rng.choice(SUFFIXES)} {i}',
+        'username': f'user{i}@example.com',
+        'encrypted_password': 'x',
+        'user_id': user.id,
+    } for i in range(entries)]
+    db.session.execute(PasswordEntry.__table__.insert(), rows)
+    db.session.commit()
+    return user.id
+
+def percentiles(func, args_list, repeat=20):
+    """Run func over args_list repeatedly and return (p50, p99) in ms"""
+    timings = []
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            func(*args)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with app.app_context():
+        db.create_all()
+        user_id = load_vault(entries)
+
+        start = time.perf_counter()
+        get_index(user_id)
+        print(f"Cold index build for {entries} entries: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        p50, p99 = percentiles(fuzzy_search, [(user_id, q) for q in QUERIES])
+        print(f"  fuzzy_search          : p50 {p50:6.2f} ms  p99 {p99:6.2f} ms")
+
+        p50, p99 = percentiles(suggest_service_names, [(user_id, p) for p in PREFIXES])
+        print(f"  suggest_service_names : p50 {p50:6.2f} ms  p99 {p99:6.2f} ms")
+
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
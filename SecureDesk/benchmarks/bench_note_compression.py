@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: at-rest size of note bodies with and without compression
+
+Builds a mixed corpus of the kinds of notes users keep (pasted application
+logs, markdown runbooks, JSON config snippets, free prose and short
+reminders), stores it once per codec and reports the bytes held in the
+content column and the database size, plus read/write cost per note.
+
+Usage:
+    python benchmarks/bench_note_compression.py [notes]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from app import app, db
+from models import User, Note, NoteChunk
+from utils import compression
+
+WORDS = ('the server was restarted after the deploy and the backup job finished '
+         'review budget meeting with client about roadmap invoice schedule next week '
+         'remember to rotate keys update the password for staging database').split()
+
+def log_note(rng):
+    levels = ['INFO', 'INFO', 'INFO', 'WARN', 'ERROR', 'DEBUG']
+    paths = ['/api/login', '/api/notes', '/healthz', '/api/passwords/42', '/static/app.js']
+    return ''.join(
+        f'2024-03-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:'
+        f'{rng.randint(0, 59):02d}Z {rng.choice(levels):5} web.{rng.randint(1, 4)} '
+        f'GET {rng.choice(paths)} status={rng.choice([200, 200, 200, 302, 404, 500])} '
+        f'duration_ms={rng.randint(1, 900)}\n'
+        for _ in range(rng.randint(20, 45))
+    )
+
+def markdown_note(rng):
+    sections = []
+    for i in range(rng.randint(3, 6)):
+        steps = ''.join(f'{j + 1}. ' + ' '.join(rng.choice(WORDS) for _ in range(8)) + '\n'
+                        for j in range(rng.randint(2, 5)))
+        sections.append(f'## Step {i + 1}: {rng.choice(WORDS).title()}\n\n{steps}\n'
+                        f'```bash\nsudo systemctl restart {rng.choice(WORDS)}.service\n```\n')
+    return '# Runbook\n\n' + '\n'.join(sections)
+
+def json_note(rng):
+    items = ',\n'.join(
+        f'  {{"name": "{rng.choice(WORDS)}", "enabled": {rng.choice(["true", "false"])}, '
+        f'"timeout": {rng.randint(1, 60)}, "retries": {rng.randint(0, 5)}}}'
+        for _ in range(rng.randint(10, 30))
+    )
+    return '{\n "services": [\n' + items + '\n ]\n}\n'
+
+def prose_note(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(60, 300))) + '\n'
+
+def short_note(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+
+def corpus(count):
+    rng = random.Random(11)
+    makers = [log_note, log_note, markdown_note, json_note, prose_note, short_note, short_note]
+    return [rng.choice(makers)(rng)[:5000] for _ in range(count)]
+
+def measure(codec, texts):
+    compression._settings['codec'] = codec
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com')
+        user.password_hash = 'x'
+        db.session.add(user)
+        db.session.commit()
+
+        start = time.perf_counter()
+        for i, text in enumerate(texts):
+            db.session.add(Note(title=f'Note {i}', content=text, user_id=user.id))
+        db.session.commit()
+        write_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+        db.session.expunge_all()
+        start = time.perf_counter()
+        for note in Note.query.options(db.selectinload(Note.chunks)).all():
+            note.content
+        read_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+        column = db.session.execute(db.select(db.func.sum(db.func.length(NoteChunk.data)))).scalar()
+        db.session.execute(db.text('VACUUM'))
+        pages = db.session.execute(db.text('PRAGMA page_count')).scalar()
+        page_size = db.session.execute(db.text('PRAGMA page_size')).scalar()
+        db.drop_all()
+    return column, pages * page_size, write_ms, read_ms
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    texts = corpus(count)
+    plain = sum(len(t.encode()) for t in texts)
+    print(f"{count} notes, {plain / 1024:.0f} KiB of plaintext")
+
+    codecs = ['none', 'zlib'] + (['zstd'] if compression.zstandard else [])
+    baseline = None
+    for codec in codecs:
+        column, database, write_ms, read_ms = measure(codec, texts)
+        baseline = baseline or database
+        print(f"  {codec:5}: content {column / 1024:7.0f} KiB  database {database / 1024:7.0f} KiB "
+              f"({database / baseline:.0%})  write {write_ms:.3f} ms/note  read {read_ms:.3f} ms/note")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: storage overhead and rebuild time of note revision history
+
+Edits a ~4 KB note many times with small, realistic changes (a word changed,
+a line appended, a paragraph removed), then compares the bytes stored in
+note_revisions against keeping a full copy per edit and times rebuilding the
+oldest revisions.
+
+Usage:
+    python benchmarks/bench_note_revisions.py [edits]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from app import app, db
+from models import User, Note, NoteRevision
+
+WORDS = ('alpha beta gamma delta meeting budget deploy release review backup '
+         'server invoice client roadmap draft schedule notes password').split()
+
+def random_line(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))) + '\n'
+
+def edit(rng, lines):
+    """Apply one small random edit to a list of lines"""
+    action = rng.random()
+    if action < 0.5 and lines:
+        i = rng.randrange(len(lines))
+        words = lines[i].split()
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+        lines[i] = ' '.join(words) + '\n'
+    elif action < 0.8 or len(lines) < 10:
+        lines.insert(rng.randrange(len(lines) + 1), random_line(rng))
+    else:
+        del lines[rng.randrange(len(lines))]
+    # Stay under the 5000 character limit
+    while sum(map(len, lines)) > 4800:
+        lines.pop(0)
+
+def main():
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = random.Random(7)
+
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com')
+        user.password_hash = 'x'
+        db.session.add(user)
+        db.session.commit()
+
+        lines = [random_line(rng) for _ in range(50)]
+        note = Note(title='Bench', content=''.join(lines), user_id=user.id)
+        db.session.add(note)
+        db.session.commit()
+
+        full_copies = 0
+        start = time.perf_counter()
+        for _ in range(edits):
+            full_copies += len(note.content.encode())
+            edit(rng, lines)
+            note.update_content(title='Bench', content=''.join(lines))
+            db.session.commit()
+        elapsed = time.perf_counter() - start
+
+        stored = db.session.execute(
+            db.select(db.func.sum(db.func.length(NoteRevision.data)))
+        ).scalar()
+        snapshots = NoteRevision.query.filter_by(is_snapshot=True).count()
+
+        print(f"{edits} edits of a {len(note.content)}-char note "
+              f"(snapshot every {NoteRevision.SNAPSHOT_INTERVAL}, {snapshots} snapshots)")
+        print(f"  full copies    : {full_copies:8d} bytes  ({full_copies / edits:7.1f} per edit)")
+        print(f"  revision store : {stored:8d} bytes  ({stored / edits:7.1f} per edit, "
+              f"{stored / full_copies:.1%} of full copies)")
+        print(f"  save per edit  : {elapsed / edits * 1000:.2f} ms")
+
+        timings = []
+        for number in range(1, NoteRevision.SNAPSHOT_INTERVAL + 1):
+            start = time.perf_counter()
+            note.revision_content(number)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"  rebuild oldest : max {max(timings):.2f} ms "
+              f"(at most {NoteRevision.SNAPSHOT_INTERVAL - 1} deltas applied)")
+
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: note write and read throughput with 1, 2 and 4 SQLite shards
+
+Each run spreads the same users over the shards and has worker processes
+(like the app's server workers) save notes and list them for random users,
+as the note views do. SQLite admits one writer per database file, so writes
+for users on different shards proceed in parallel instead of queueing on a
+single lock; the gain needs as many free cores as workers.
+
+Usage:
+    python benchmarks/bench_sharding.py [seconds_per_run] [workers]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from flask import Flask
+from models import db, User, Note
+from utils.compression import configure_compression
+from utils import sharding
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+WORKERS = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+USERS = 200
+SHARD_COUNTS = (1, 2, 4)
+
+def make_app(directory, shard_count):
+    app = Flask(f'bench_{shard_count}')
+    app.config.update(
+        SECRET_KEY='bench',
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{directory}/primary.db',
+        SQLALCHEMY_BINDS={f'shard{i}': f'sqlite:///{directory}/shard{i}.db' for i in range(shard_count)},
+        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}},
+    )
+    db.init_app(app)
+    configure_compression(app)
+    sharding.init_sharding(app)
+    return app
+
+def worker(directory, shard_count, user_ids, deadline, counts, seed):
+    app = make_app(directory, shard_count)
+    rng = random.Random(seed)
+    writes = 0
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(user_ids)
+            with sharding.use_user_shard(user_id):
+                db.session.add(Note(title=f'Note {writes}', content='benchmark ' * 50, user_id=user_id))
+                db.session.commit()
+                Note.query.filter_by(user_id=user_id).order_by(Note.updated_at.desc()).limit(20).all()
+            db.session.remove()
+            writes += 1
+    counts.put(writes)
+
+def run(shard_count):
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app(directory, shard_count)
+        try:
+            with app.app_context():
+                db.create_all()
+                users = [User(email=f'bench{i}@example.com', password_hash='x') for i in range(USERS)]
+                db.session.add_all(users)
+                db.session.commit()
+                user_ids = [user.id for user in users]
+                spread = sorted(sharding.get_shards().ring.shard_for(user_id) for user_id in user_ids)
+
+            counts = multiprocessing.Queue()
+            deadline = time.perf_counter() + SECONDS
+            workers = [multiprocessing.Process(target=worker, args=(directory, shard_count, user_ids, deadline, counts, i))
+                       for i in range(WORKERS)]
+            for process in workers:
+                process.start()
+            writes = sum(counts.get() for _ in workers)
+            for process in workers:
+                process.join()
+
+            users_per_shard = ', '.join(str(spread.count(key)) for key in sorted(set(spread)))
+            print(f"{shard_count} shard(s): {writes / SECONDS:8.0f} note saves+lists/s "
+                  f"({WORKERS} workers; users per shard: {users_per_shard})")
+        finally:
+            with app.app_context():
+                db.session.remove()
+                for engine in db.engines.values():
+                    engine.dispose()
+            for i in range(shard_count):
+                db.metadatas.pop(f'shard{i}', None)
+
+def main():
+    # Workers build their own app and engines; fork keeps the benchmark's imports
+    multiprocessing.set_start_method('fork')
+    for shard_count in SHARD_COUNTS:
+        run(shard_count)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: near-duplicate lookups on a user with 100k notes
+
+Fills one user with synthetic notes (a share of them lightly edited copies
+of others), then compares the banded index lookup behind the "similar notes"
+panel with a linear scan over every fingerprint, and times the dedupe report.
+
+Usage:
+    python benchmarks/bench_simhash.py [note_count]
+"""
+
+import os
+import sys
+import time
+import random
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from app import app, db
+from models import User, Note
+from utils import simhash
+
+NOTE_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+DUPLICATE_PAIRS = NOTE_COUNT // 40
+LOOKUPS = 1000
+VOCABULARY = [f'word{i}' for i in range(20_000)]
+
+def synthetic_fingerprints(count, rng):
+    """
+    (title, fingerprint) for each synthetic note
+
+    Most notes are unrelated filler whose fingerprints are uniformly random,
+    as those of unrelated texts are. DUPLICATE_PAIRS 200-word texts are
+    fingerprinted for real together with a copy that has one word changed.
+    """
+    notes = []
+    for i in range(DUPLICATE_PAIRS):
+        words = rng.choices(VOCABULARY, k=200)
+        notes.append((f'Draft {i}', simhash.fingerprint(f'Draft {i}\n' + ' '.join(words))))
+        words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+        notes.append((f'Draft {i}', simhash.fingerprint(f'Draft {i}\n' + ' '.join(words))))
+    notes += [(f'Note {i}', rng.getrandbits(simhash.BITS)) for i in range(count - len(notes))]
+    return notes
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+def main():
+    rng = random.Random(36)
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com')
+        user.set_password('BenchPassword123')
+        db.session.add(user)
+        db.session.commit()
+
+        start = time.perf_counter()
+        notes = synthetic_fingerprints(NOTE_COUNT, rng)
+        fingerprint_time = time.perf_counter() - start
+        now = datetime.utcnow()
+        rows = []
+        for title, value in notes:
+            row = {'title': title, 'user_id': user.id, 'created_at': now, 'updated_at': now,
+                   'simhash': simhash.to_signed(value)}
+            row.update({f'simhash_b{b}': band for b, band in enumerate(simhash.bands(value))})
+            rows.append(row)
+        for i in range(0, len(rows), 10_000):
+            db.session.execute(db.insert(Note.__table__), rows[i:i + 10_000])
+        db.session.commit()
+        print(f"{NOTE_COUNT} notes, {2 * DUPLICATE_PAIRS} of them fingerprinted in {fingerprint_time:.1f}s "
+              f"({fingerprint_time / (2 * DUPLICATE_PAIRS) * 1e6:.0f} us per 200-word note)")
+
+        sample = rng.sample(range(1, NOTE_COUNT + 1), LOOKUPS)
+        indexed, found = [], 0
+        for note_id in sample:
+            note = db.session.get(Note, note_id)
+            start = time.perf_counter()
+            found += bool(note.similar_notes())
+            indexed.append(time.perf_counter() - start)
+            db.session.expunge(note)
+
+        scanned = []
+        for note_id in sample[:50]:
+            start = time.perf_counter()
+            target = simhash.to_unsigned(db.session.get(Note, note_id).simhash)
+            all_rows = db.session.execute(
+                db.select(Note.id, Note.simhash).where(Note.user_id == user.id, Note.id != note_id)
+            ).all()
+            sorted(d for d in (simhash.distance(target, simhash.to_unsigned(v)) for _, v in all_rows)
+                   if d <= simhash.MAX_DISTANCE)
+            scanned.append(time.perf_counter() - start)
+
+        print(f"Banded lookup: p50 {percentile(indexed, 0.5) * 1000:.2f} ms, "
+              f"p99 {percentile(indexed, 0.99) * 1000:.2f} ms ({found}/{LOOKUPS} sampled notes had matches)")
+        print(f"Linear scan:   p50 {percentile(scanned, 0.5) * 1000:.2f} ms, "
+              f"p99 {percentile(scanned, 0.99) * 1000:.2f} ms")
+
+        start = time.perf_counter()
+        all_rows = db.session.execute(
+            db.select(Note.id, Note.simhash).where(Note.user_id == user.id)
+        ).all()
+        groups = simhash.group_near_duplicates((i, simhash.to_unsigned(v)) for i, v in all_rows)
+        print(f"Dedupe report: {len(groups)}/{DUPLICATE_PAIRS} edited drafts found in {time.perf_counter() - start:.2f}s")
+
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark: password strength estimation latency
+
+Times the pattern-based estimator on common, patterned and random
+passwords (p50/p99 per check), plus compiling the dictionaries and
+memory-mapping an already compiled copy, as a second worker would.
+
+Usage:
+    python benchmarks/bench_strength.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import passgen
+from utils.strength import StrengthEstimator, DICTIONARIES, load_trie
+
+SAMPLES = {
+    'common': ['password', 'Password1!', 'qwerty123', 'iloveyou', 'letmein1', 'p@ssw0rd', 'dragon', 'monkey1'],
+    'patterned': ['jennifer1990', 'asdfghjkl;', '12/03/1990', 'abcabcabc', 'Summer2024!', 'zaq1xsw2cde3',
+                  'correcthorsebatterystaple', 'TestPassword123'],
+    'random': passgen.generate_batch(200, 'random', length=16),
+    'passphrase': passgen.generate_batch(200, 'passphrase'),
+}
+ROUNDS = 20
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+def load(cache_dir):
+    start = time.perf_counter()
+    estimator = StrengthEstimator({name: load_trie(path, cache_dir) for name, path in DICTIONARIES.items()})
+    return estimator, time.perf_counter() - start
+
+def main():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        _, compile_time = load(cache_dir)
+        estimator, map_time = load(cache_dir)
+        print(f"Compile dictionaries: {compile_time * 1000:.1f} ms, map compiled copy: {map_time * 1000:.2f} ms")
+
+        for kind, passwords in SAMPLES.items():
+            timings = []
+            for _ in range(ROUNDS):
+                for password in passwords:
+                    start = time.perf_counter()
+                    estimator.estimate(password)
+                    timings.append(time.perf_counter() - start)
+            scores = [estimator.estimate(password)['score'] for password in passwords]
+            print(f"{kind:10s}: p50 {percentile(timings, 0.5) * 1e6:6.0f} us, p99 {percentile(timings, 0.99) * 1e6:6.0f} us, "
+                  f"mean score {sum(scores) / len(scores):.1f}")
+
+if __name__ == '__main__':
+    main()
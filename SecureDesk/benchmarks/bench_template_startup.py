@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark: template startup cost with and without the bytecode cache
+
+Simulates a freshly started worker by building a new Jinja environment from
+the app's settings and compiling every template, first from source and then
+from a populated on-disk bytecode cache.
+
+Usage:
+    python benchmarks/bench_template_startup.py [rounds]
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import FileSystemBytecodeCache
+from app import app
+from utils.templates import precompile_templates
+
+def fresh_environment(bytecode_cache=None):
+    """Create a Jinja environment the way a new worker would"""
+    env = app.create_jinja_environment()
+    env.filters.update(app.jinja_env.filters)
+    env.bytecode_cache = bytecode_cache
+    return env
+
+def measure(rounds, bytecode_cache=None):
+    """Return per-round warmup timings in milliseconds"""
+    timings = []
+    for _ in range(rounds):
+        count, elapsed = precompile_templates(app, env=fresh_environment(bytecode_cache))
+        timings.append(elapsed * 1000)
+    return count, timings
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    cache_dir = tempfile.mkdtemp(prefix='securedesk-bench-')
+
+    try:
+        with app.app_context():
+            count, cold = measure(rounds)
+
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+            precompile_templates(app, env=fresh_environment(bytecode_cache))
+            _, warm = measure(rounds, bytecode_cache)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"Templates per worker: {count} ({rounds} rounds)")
+    print(f"  compile from source : median {statistics.median(cold):7.2f} ms  max {max(cold):7.2f} ms")
+    print(f"  load from bytecode  : median {statistics.median(warm):7.2f} ms  max {max(warm):7.2f} ms")
+    print(f"  speedup             : {statistics.median(cold) / statistics.median(warm):.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Load test: mixed read/write/reveal traffic against the whole app
+
+Virtual users log in as synthetic users and run weighted scenarios (listing
+and searching notes, the dashboard, reading and editing notes, revealing
+passwords, ...) back to back through the app's WSGI interface for a fixed
+time. Throughput and latency percentiles are reported per scenario; the run
+fails if any request failed.
+
+Load data first (same DATABASE_URL), e.g. 1M notes and 100k entries:
+
+    DATABASE_URL=sqlite:///loadtest.db FLASK_ENV=production \\
+        flask --app app synthetic load --users 50 --notes 20000 --passwords 2000
+
+Without synthetic users a small data set is loaded automatically.
+
+Usage:
+    DATABASE_URL=sqlite:///loadtest.db python benchmarks/loadtest_app.py [virtual users] [seconds] [mix]
+
+``mix`` is one of read, write, reveal or mixed (default).
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_ENV', 'production')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///loadtest.db')
+
+from app import app, db
+from models import User, Note, PasswordEntry
+from utils.synthetic import load, SYNTHETIC_PASSWORD, WORDS, SERVICES
+
+VIRTUAL_USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+MIX = sys.argv[3] if len(sys.argv) > 3 else 'mixed'
+EMAIL_PREFIX = 'synthetic'
+
+# Scenario weights per traffic mix
+MIXES = {
+    'read': {'dashboard': 20, 'list_notes': 25, 'search_notes': 15, 'view_note': 20,
+             'list_passwords': 10, 'search_passwords': 10},
+    'write': {'create_note': 40, 'edit_note': 40, 'create_password': 20},
+    'reveal': {'reveal_password': 80, 'list_passwords': 20},
+    'mixed': {'dashboard': 15, 'list_notes': 15, 'search_notes': 10, 'view_note': 15, 'list_passwords': 10,
+              'search_passwords': 5, 'reveal_password': 10, 'create_note': 5, 'edit_note': 10, 'create_password': 5},
+}
+
+class VirtualUser:
+    """One logged-in client with a sample of its user's item ids"""
+
+    def __init__(self, user_id, email, rng):
+        self.rng = rng
+        self.client = app.test_client()
+        response = self.client.post('/auth/login', data={'email': email, 'password': SYNTHETIC_PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f"Could not log in as {email}")
+        with app.app_context():
+            self.note_ids = db.session.execute(
+                db.select(Note.id).where(Note.user_id == user_id).order_by(Note.id.desc()).limit(200)
+            ).scalars().all()
+            self.entry_ids = db.session.execute(
+                db.select(PasswordEntry.id).where(PasswordEntry.user_id == user_id).order_by(PasswordEntry.id.desc()).limit(200)
+            ).scalars().all()
+
+    def words(self, count):
+        return ' '.join(self.rng.choices(WORDS, k=count))
+
+    # Scenarios return the response of their one request
+    def dashboard(self):
+        return self.client.get('/dashboard')
+
+    def list_notes(self):
+        return self.client.get('/notes/', query_string={'page': self.rng.randint(1, 5)})
+
+    def search_notes(self):
+        return self.client.get('/notes/', query_string={'q': self.rng.choice(WORDS)})
+
+    def view_note(self):
+        return self.client.get(f'/notes/{self.rng.choice(self.note_ids)}')
+
+    def list_passwords(self):
+        return self.client.get('/passwords/')
+
+    def search_passwords(self):
+        return self.client.get('/passwords/', query_string={'q': self.rng.choice(SERVICES)[:4].lower()})
+
+    def reveal_password(self):
+        return self.client.post(f'/passwords/{self.rng.choice(self.entry_ids)}/reveal')
+
+    def create_note(self):
+        return self.client.post('/notes/new', data={'title': self.words(3), 'content': self.words(150)})
+
+    def edit_note(self):
+        return self.client.post(f'/notes/{self.rng.choice(self.note_ids)}/edit',
+                                data={'title': self.words(3), 'content': self.words(150)})
+
+    def create_password(self):
+        return self.client.post('/passwords/new', data={
+            'service_name': self.rng.choice(SERVICES), 'username': f'{self.words(1)}@example.com',
+            'password': f'Load-{self.rng.randrange(10 ** 9)}!x', 'rotation_days': 0,
+        })
+
+def seed():
+    """Synthetic users to log in as, loading a small data set if there are none"""
+    users = db.session.execute(
+        db.select(User.id, User.email).where(User.email.like(f'{EMAIL_PREFIX}%@example.com'))
+    ).all()
+    if not users:
+        print("No synthetic users; loading 20 users with 500 notes and 100 password entries each")
+        load(20, 500, 100, email_prefix=EMAIL_PREFIX)
+        return seed()
+    return users
+
+def worker(user, seed_value, deadline, results):
+    rng = random.Random(seed_value)
+    vuser = VirtualUser(user.id, user.email, rng)
+    names, weights = zip(*MIXES[MIX].items())
+    timings = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        response = getattr(vuser, name)()
+        # Streamed pages are only rendered as their body is read
+        response.get_data()
+        response.close()
+        timings[name].append(time.perf_counter() - start)
+        # Form posts redirect on success
+        if response.status_code >= 400:
+            errors[name] += 1
+    results.append((timings, errors))
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)] * 1000
+
+def main():
+    if MIX not in MIXES:
+        sys.exit(f"Unknown mix {MIX!r}; choose from {', '.join(MIXES)}")
+    app.config.update(WTF_CSRF_ENABLED=False, RATELIMIT_ENABLED=False)
+    with app.app_context():
+        db.create_all()
+        users = seed()
+
+    rng = random.Random(0)
+    results = []
+    deadline = time.perf_counter() + SECONDS
+    threads = [threading.Thread(target=worker, args=(rng.choice(users), i, deadline, results))
+               for i in range(VIRTUAL_USERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"{app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]}: {VIRTUAL_USERS} virtual users, "
+          f"{SECONDS:.0f}s, '{MIX}' mix")
+    print(f"  {'scenario':<17} {'requests':>8} {'req/s':>7} {'errors':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    every, failed = [], 0
+    for name in MIXES[MIX]:
+        timings = sorted(t for result, _ in results for t in result[name])
+        errors = sum(error[name] for _, error in results)
+        failed += errors
+        every.extend(timings)
+        if timings:
+            print(f"  {name:<17} {len(timings):>8} {len(timings) / SECONDS:>7.1f} {errors:>6} "
+                  f"{percentile(timings, 0.5):>8.1f} {percentile(timings, 0.9):>8.1f} "
+                  f"{percentile(timings, 0.99):>8.1f} {timings[-1] * 1000:>8.1f}")
+    every.sort()
+    if every:
+        print(f"  {'total':<17} {len(every):>8} {len(every) / SECONDS:>7.1f} {failed:>6} "
+              f"{percentile(every, 0.5):>8.1f} {percentile(every, 0.9):>8.1f} "
+              f"{percentile(every, 0.99):>8.1f} {every[-1] * 1000:>8.1f}")
+
+    print(f"FAIL: {failed} requests failed" if failed else "OK: no failed requests")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
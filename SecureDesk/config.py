@@ -6,8 +6,100 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///secure_web_app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool of each database engine (ignored for in-memory SQLite)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))  # whole seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # replace connections older than this
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'  # test connections on checkout
+    # Audit events are queued in memory and inserted in batches by a background thread
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))  # events per insert transaction
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 2))  # seconds between flushes
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))  # requests flush inline beyond this
+    # Events that could not be written at shutdown (relative paths live under instance/)
+    AUDIT_SPILL_PATH = os.environ.get('AUDIT_SPILL_PATH', 'audit_spill.jsonl')
+    # Seconds between bulk writes of buffered last_login/last_seen timestamps
+    LAST_SEEN_FLUSH_INTERVAL = float(os.environ.get('LAST_SEEN_FLUSH_INTERVAL', 60))
+    # Password rotation: how far ahead the dashboard warns, and seconds between reminder runs
+    ROTATION_WARNING_DAYS = int(os.environ.get('ROTATION_WARNING_DAYS', 14))
+    ROTATION_CHECK_INTERVAL = float(os.environ.get('ROTATION_CHECK_INTERVAL', 3600))
+    # Trash: days before deleted items are purged, items per purge transaction, seconds between purges
+    TRASH_RETENTION_DAYS = int(os.environ.get('TRASH_RETENTION_DAYS', 30))
+    TRASH_PURGE_BATCH = int(os.environ.get('TRASH_PURGE_BATCH', 100))
+    TRASH_PURGE_INTERVAL = float(os.environ.get('TRASH_PURGE_INTERVAL', 3600))
+    # Items per /api/v1 list page by default, and the most a client may ask for
+    API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+    API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 5000))
+    # Personal access tokens: keyed-hash key (defaults to SECRET_KEY), verified tokens cached per
+    # process, and the file whose changes tell other processes a token was revoked (under instance/)
+    TOKEN_HASH_KEY = os.environ.get('TOKEN_HASH_KEY')
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+    TOKEN_REVOCATION_PATH = os.environ.get('TOKEN_REVOCATION_PATH', 'token_revocations')
+    # Bearer token required by /metrics (the endpoint is disabled without one)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Sampling profiler: share of requests profiled (0-1), plus requests sending X-Profile: <PROFILE_TOKEN>;
+    # the token also unlocks /profiles. Seconds between stack samples and between writes to PROFILE_DIR
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+    PROFILE_FLUSH_INTERVAL = float(os.environ.get('PROFILE_FLUSH_INTERVAL', 60))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')  # under instance/
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=30)
     WTF_CSRF_ENABLED = True
+    # 'database' keeps session data server-side behind a session-id cookie; 'cookie' uses Flask's signed cookie
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'database')
+    SESSION_SWEEP_INTERVAL = 300  # seconds between expired-session sweeps
+    BACKGROUND_WORKERS_ENABLED = True
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))  # background job threads per process
+    JOBS_EAGER = False  # run jobs inline in the submitting request (tests)
+    NOTE_COMPRESSION = os.environ.get('NOTE_COMPRESSION', 'zlib')  # zlib, zstd or none
+    NOTE_COMPRESSION_MIN_SIZE = 256  # bytes; shorter note bodies are stored raw
+    # Notes may be several MB (Werkzeug would otherwise reject form fields over 500 KB)
+    MAX_FORM_MEMORY_SIZE = 24 * 1024 * 1024
+    # Attachments are encrypted into a blob store (relative paths live under instance/)
+    ATTACHMENT_STORAGE_DIR = os.environ.get('ATTACHMENT_STORAGE_DIR', 'blobs')
+    ATTACHMENT_MAX_SIZE = 100 * 1024 * 1024
+    BLOB_PURGE_INTERVAL = 3600  # seconds between orphaned blob purges
+    MAX_CONTENT_LENGTH = ATTACHMENT_MAX_SIZE + 1024 * 1024
+    # Jinja bytecode cache shared by all workers (relative paths live under instance/)
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR', 'jinja_cache')
+    
+    # Read replicas (comma-separated URLs) serving views marked @read_replica, and
+    # shards (comma-separated URLs) holding users' notes and password entries
+    SQLALCHEMY_BINDS = {
+        **{f'replica{i}': url.strip()
+           for i, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')))},
+        **{f'shard{i}': url.strip()
+           for i, url in enumerate(filter(None, os.environ.get('SHARD_DATABASE_URLS', '').split(',')))},
+    }
+    # A user's requests read from the primary for this long after they write
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    # Local testing only: copy a SQLite primary onto SQLite replicas this often (simulated lag)
+    REPLICA_SYNC_INTERVAL = float(os.environ.get('REPLICA_SYNC_INTERVAL', 0)) or None
+    # Seconds a shard move waits for in-flight requests while the user's writes are paused
+    SHARD_LOCK_GRACE = float(os.environ.get('SHARD_LOCK_GRACE', 2))
+    
+    # Rate limiting, checked before any password hashing or decryption
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY', 'sliding-window')  # or 'token-bucket'
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE', 'memory')  # or 'sqlite' to share across local workers
+    RATELIMIT_STORAGE_PATH = os.environ.get('RATELIMIT_STORAGE_PATH', 'ratelimit.sqlite')
+    # Endpoint -> list of (rate, key) rules; key is 'ip', 'user' or 'endpoint'
+    RATELIMIT_ROUTES = {
+        'auth.login': [('20/minute', 'ip'), ('5/minute', 'user')],
+        'auth.register': [('5/minute', 'ip')],
+        'passwords.reveal_password': [('30/minute', 'user')],
+        'vaults.reveal_entry': [('30/minute', 'user')],
+        'auth.delete_account': [('5/minute', 'user')],
+        'passwords.generate_password': [('60/minute', 'user')],
+        'passwords.generate_batch': [('10/minute', 'user')],
+    }
+    # Compiled strength dictionaries, memory-mapped by every worker (relative paths live under instance/)
+    STRENGTH_DICTIONARY_DIR = os.environ.get('STRENGTH_DICTIONARY_DIR', 'strength')
+    # Lowest strength score (0-4) accepted for account passwords
+    MIN_PASSWORD_SCORE = int(os.environ.get('MIN_PASSWORD_SCORE', 2))
+    # Largest batch accepted by /passwords/generate/batch
+    PASSWORD_BATCH_MAX = int(os.environ.get('PASSWORD_BATCH_MAX', 10000))
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -19,6 +111,17 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    TEMPLATE_BYTECODE_CACHE_DIR = None
+    BACKGROUND_WORKERS_ENABLED = False
+    JOBS_EAGER = True
+    ATTACHMENT_STORAGE_DIR = None  # throwaway temporary directory
+    STRENGTH_DICTIONARY_DIR = None  # compiled in memory
+    SQLALCHEMY_BINDS = {}
+    REPLICA_SYNC_INTERVAL = None
+    RATELIMIT_ENABLED = False
+    AUDIT_SPILL_PATH = None
+    TOKEN_REVOCATION_PATH = None
+    PROFILE_DIR = None  # profiles stay in memory
 
 class ProductionConfig(Config):
     """Production configuration"""
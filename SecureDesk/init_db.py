@@ -13,6 +13,12 @@ def init_database():
         db.create_all()
         print("Database tables created successfully!")
         
+        # Add the columns newer versions added to existing tables
+        from utils.migrations import migrate_database
+        added = migrate_database()
+        if added:
+            print(f"Database upgraded: added {', '.join(added)}")
+        
         # Verify tables were created
         tables = db.engine.table_names()
         print(f"Created tables: {', '.join(tables)}")
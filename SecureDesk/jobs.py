@@ -0,0 +1,48 @@
+"""
+Background job status routes
+"""
+
+from flask import Blueprint, jsonify, url_for
+from flask_login import login_required, current_user
+from models import db, BackgroundJob
+from utils.jobs import runner, job_result
+
+# Create jobs blueprint
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+def _get_job_or_404(job_id, with_result=False):
+    """Fetch one of the current user's jobs, leaving out the (possibly large) result unless asked"""
+    query = BackgroundJob.query.filter_by(id=job_id, user_id=current_user.id)
+    if not with_result:
+        query = query.options(db.defer(BackgroundJob.result))
+    return query.first_or_404()
+
+@jobs_bp.route('/<job_id>')
+@login_required
+def job_status(job_id):
+    """Poll a job's status and progress; the result is fetched separately once it succeeds"""
+    job = _get_job_or_404(job_id)
+
+    payload = job.to_dict()
+    if job.status == 'succeeded':
+        payload['result_url'] = url_for('jobs.job_result_view', job_id=job.id)
+    return jsonify({'status': 'success', 'job': payload})
+
+@jobs_bp.route('/<job_id>/result')
+@login_required
+def job_result_view(job_id):
+    """Result of a succeeded job"""
+    job = _get_job_or_404(job_id, with_result=True)
+
+    if job.status != 'succeeded':
+        return jsonify({'status': 'error', 'message': 'Job has not finished successfully'}), 409
+    return jsonify({'status': 'success', 'result': job_result(job)})
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    """Request cancellation of a queued or running job"""
+    job = _get_job_or_404(job_id)
+    runner.cancel(job)
+
+    return jsonify({'status': 'success', 'job': job.to_dict()})
@@ -1,10 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+from utils.deltas import make_delta, apply_delta, compress_text, decompress_text
+from utils.compression import CompressedText
+from utils import simhash
+from utils.replication import RoutingSession
 
-# Initialize db here to avoid circular imports
-db = SQLAlchemy()
+# Initialize db here to avoid circular imports; reads may be routed to replicas
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     """User model for authentication and user management"""
@@ -14,11 +18,19 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(128), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Written in batches by utils/lastseen.py; may lag by LAST_SEEN_FLUSH_INTERVAL
     last_login = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+    # Bumped on every password entry write so cached search indexes can detect staleness
+    search_version = db.Column(db.Integer, default=0, nullable=False)
+    # Set when the user deletes their account; the delete_account job removes the rest
+    deleted_at = db.Column(db.DateTime)
     
     # Relationships
     notes = db.relationship('Note', backref='user', lazy=True, cascade='all, delete-orphan')
     password_entries = db.relationship('PasswordEntry', backref='user', lazy=True, cascade='all, delete-orphan')
+    tags = db.relationship('Tag', lazy=True, cascade='all, delete-orphan', order_by='Tag.name')
+    folders = db.relationship('Folder', lazy=True, cascade='all, delete-orphan', order_by='Folder.name')
     
     def set_password(self, password):
         """Hash and set the user's password"""
@@ -28,47 +40,300 @@ class User(UserMixin, db.Model):
         """Check if provided password matches the hash"""
         return check_password_hash(self.password_hash, password)
     
-    def update_last_login(self):
-        """Update the last login timestamp"""
-        self.last_login = datetime.utcnow()
-        db.session.commit()
-    
     def __repr__(self):
         return f'<User {self.email}>'
 
+class Folder(db.Model):
+    """Folder grouping a user's notes and password entries"""
+    __tablename__ = 'folders'
+    __table_args__ = (db.UniqueConstraint('user_id', 'name'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    
+    def __repr__(self):
+        return f'<Folder {self.name}>'
+
+class Tag(db.Model):
+    """
+    User tag whose membership is stored as compressed bitmaps of row ids
+    
+    Updates use optimistic locking on ``version`` so concurrent edits of the
+    same tag cannot silently drop each other's changes.
+    """
+    __tablename__ = 'tags'
+    __table_args__ = (db.UniqueConstraint('user_id', 'name'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    note_ids = db.Column(db.LargeBinary)
+    entry_ids = db.Column(db.LargeBinary)
+    version = db.Column(db.Integer, nullable=False)
+    
+    __mapper_args__ = {'version_id_col': version}
+    
+    def __repr__(self):
+        return f'<Tag {self.name}>'
+
 class Note(db.Model):
     """Note model for storing user notes"""
     __tablename__ = 'notes'
+    __table_args__ = tuple(
+        db.Index(f'ix_notes_user_simhash_b{i}', 'user_id', f'simhash_b{i}') for i in range(simhash.BANDS)
+    ) + (db.Index('ix_notes_user_id_id', 'user_id', 'id'),)
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text)
+    # Content lives in NoteChunk rows; listings use the plaintext snippet
+    snippet = db.Column(db.String(120), default='', nullable=False)
+    size = db.Column(db.Integer, default=0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    revision_count = db.Column(db.Integer, default=0, nullable=False)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), index=True)
+    # In the trash since (see utils/trash.py)
+    deleted_at = db.Column(db.DateTime, index=True)
+    # SimHash fingerprint of title and content, plus its bands for near-duplicate lookups
+    simhash = db.Column(db.BigInteger)
+    simhash_b0 = db.Column(db.Integer)
+    simhash_b1 = db.Column(db.Integer)
+    simhash_b2 = db.Column(db.Integer)
+    simhash_b3 = db.Column(db.Integer)
+    
+    folder = db.relationship('Folder')
+    revisions = db.relationship('NoteRevision', backref='note', lazy='dynamic',
+                                cascade='all, delete-orphan', order_by='NoteRevision.number.desc()')
+    chunks = db.relationship('NoteChunk', lazy='select', cascade='all, delete-orphan',
+                             order_by='NoteChunk.seq')
+    attachments = db.relationship('Attachment', backref='note', lazy=True,
+                                  cascade='all, delete-orphan', order_by='Attachment.created_at')
+    
+    # Maximum content length in characters
+    MAX_LENGTH = 5 * 1024 * 1024
     
     def __init__(self, title, content, user_id):
+        # Validate content length
+        if content and len(content) > Note.MAX_LENGTH:
+            raise ValueError("Note content cannot exceed 5 MB")
         self.title = title
         self.content = content
         self.user_id = user_id
-        # Validate content length
-        if content and len(content) > 5000:
-            raise ValueError("Note content cannot exceed 5000 characters")
+        self._refresh_fingerprint()
+    
+    @property
+    def content(self):
+        """Full note text (loads every chunk; use iter_content for large notes)"""
+        return ''.join(chunk.data for chunk in self.chunks)
+    
+    @content.setter
+    def content(self, content):
+        content = content or ''
+        size = NoteChunk.CHUNK_SIZE
+        parts = [content[i:i + size] for i in range(0, len(content), size)]
+        
+        # Rewrite chunks in place so unchanged ones are not updated
+        chunks = self.chunks
+        for seq, part in enumerate(parts):
+            if seq < len(chunks):
+                if chunks[seq].data != part:
+                    chunks[seq].data = part
+            else:
+                chunks.append(NoteChunk(seq=seq, data=part))
+        del chunks[len(parts):]
+        
+        self.size = len(content)
+        self.snippet = content[:120]
+    
+    def iter_content(self, start=0, end=None):
+        """
+        Yield the text between two character offsets one chunk at a time
+        
+        Only the chunks overlapping the range are read, and they are fetched
+        from the database as iteration proceeds.
+        """
+        size = NoteChunk.CHUNK_SIZE
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return
+        
+        rows = db.session.execute(
+            db.select(NoteChunk.seq, NoteChunk.data)
+            .where(
+                NoteChunk.note_id == self.id,
+                NoteChunk.seq >= start // size,
+                NoteChunk.seq <= (end - 1) // size
+            )
+            .order_by(NoteChunk.seq)
+            .execution_options(yield_per=1)
+        )
+        for seq, data in rows:
+            offset = seq * size
+            yield data[max(start - offset, 0):end - offset]
     
     def update_content(self, title, content):
-        """Update note content with validation"""
-        if content and len(content) > 5000:
-            raise ValueError("Note content cannot exceed 5000 characters")
+        """Update note content with validation, keeping the old version as a revision"""
+        if content and len(content) > Note.MAX_LENGTH:
+            raise ValueError("Note content cannot exceed 5 MB")
+        if self.id is not None:
+            old_content = self.content
+            if (title, content or '') != (self.title, old_content):
+                self._record_revision(old_content, content)
         self.title = title
         self.content = content
         self.updated_at = datetime.utcnow()
+        self._refresh_fingerprint()
+    
+    def _refresh_fingerprint(self):
+        """Recompute the SimHash from the title and the first content chunk"""
+        first_chunk = self.chunks[0].data if self.chunks else ''
+        value = simhash.fingerprint(f'{self.title}\n{first_chunk}')
+        self.simhash = simhash.to_signed(value)
+        for i, band in enumerate(simhash.bands(value)):
+            setattr(self, f'simhash_b{i}', band)
+    
+    def similar_notes(self, limit=5):
+        """
+        Other notes of the same user within simhash.MAX_DISTANCE bits
+        
+        Returns:
+            List of (distance, note id, title) tuples, closest first
+        """
+        if self.simhash is None:
+            return []
+        value = simhash.to_unsigned(self.simhash)
+        # One indexed (user_id, band) lookup per band, merged by the database
+        same_band = [
+            db.and_(Note.user_id == self.user_id, getattr(Note, f'simhash_b{i}') == band)
+            for i, band in enumerate(simhash.bands(value))
+        ]
+        rows = db.session.execute(
+            db.select(Note.id, Note.title, Note.simhash)
+            .where(db.or_(*same_band), Note.id != self.id)
+        ).all()
+        
+        matches = sorted(
+            (simhash.distance(value, simhash.to_unsigned(other)), note_id, title)
+            for note_id, title, other in rows
+        )
+        return [match for match in matches if match[0] <= simhash.MAX_DISTANCE][:limit]
+    
+    def _record_revision(self, old_content, new_content):
+        """Store the current title and content (``old_content``) as the next revision before they are overwritten"""
+        number = (self.revision_count or 0) + 1
+        is_snapshot = number % NoteRevision.SNAPSHOT_INTERVAL == 0
+        self.revisions.append(NoteRevision(
+            number=number,
+            title=self.title,
+            is_snapshot=is_snapshot,
+            # Reverse delta: rebuilds this revision from the content that replaces it
+            data=compress_text(old_content) if is_snapshot else make_delta(new_content, old_content),
+            created_at=self.updated_at
+        ))
+        self.revision_count = number
+    
+    def revision_content(self, number):
+        """
+        Rebuild the content of a stored revision
+        
+        Starts from the nearest snapshot above the revision (or the current
+        content) so at most SNAPSHOT_INTERVAL deltas are applied.
+        """
+        interval = NoteRevision.SNAPSHOT_INTERVAL
+        upper = number + (-number % interval)
+        rows = self.revisions.filter(
+            NoteRevision.number >= number,
+            NoteRevision.number <= upper
+        ).all()
+        if not rows or rows[-1].number != number:
+            return None
+        
+        text = self.content
+        for revision in rows:
+            if revision.is_snapshot:
+                text = decompress_text(revision.data)
+            else:
+                text = apply_delta(text, revision.data)
+        return text
     
     def __repr__(self):
         return f'<Note {self.title}>'
 
+class NoteChunk(db.Model):
+    """Fixed-size slice of a note's content, compressed at rest"""
+    __tablename__ = 'note_chunks'
+    
+    # Characters per chunk
+    CHUNK_SIZE = 64 * 1024
+    
+    note_id = db.Column(db.Integer, db.ForeignKey('notes.id'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    data = db.Column(CompressedText, nullable=False)
+    
+    def __repr__(self):
+        return f'<NoteChunk {self.note_id}#{self.seq}>'
+
+class Blob(db.Model):
+    """Encrypted file in the content-addressed blob store, shared by identical attachments"""
+    __tablename__ = 'blobs'
+    
+    # HMAC of the plaintext SHA-256 (see utils/blobstore.py)
+    id = db.Column(db.String(64), primary_key=True)
+    filename = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    wrapped_key = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Blob {self.id[:12]}>'
+
+class Attachment(db.Model):
+    """File attached to a note"""
+    __tablename__ = 'attachments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('notes.id'), nullable=False, index=True)
+    blob_id = db.Column(db.String(64), db.ForeignKey('blobs.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    blob = db.relationship('Blob')
+    
+    def __repr__(self):
+        return f'<Attachment {self.filename}>'
+
+class NoteRevision(db.Model):
+    """Earlier version of a note stored as a compressed reverse delta or snapshot"""
+    __tablename__ = 'note_revisions'
+    __table_args__ = (db.UniqueConstraint('note_id', 'number'),)
+    
+    # Every Nth revision stores the full text, bounding reconstruction work
+    SNAPSHOT_INTERVAL = 10
+    
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('notes.id'), nullable=False)
+    number = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    is_snapshot = db.Column(db.Boolean, default=False, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<NoteRevision {self.note_id}#{self.number}>'
+
 class PasswordEntry(db.Model):
     """Password entry model for storing encrypted passwords"""
     __tablename__ = 'password_entries'
+    __table_args__ = (
+        db.Index('ix_password_entries_user_id_id', 'user_id', 'id'),
+        # Dashboard reminders: one range scan per user
+        db.Index('ix_password_entries_user_rotation', 'user_id', 'next_rotation_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     service_name = db.Column(db.String(100), nullable=False)
@@ -77,6 +342,16 @@ class PasswordEntry(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), index=True)
+    # Days between password changes (None: never remind)
+    rotation_days = db.Column(db.Integer)
+    next_rotation_at = db.Column(db.DateTime)
+    # Same as next_rotation_at until the rotation scheduler has sent the reminder (see utils/rotation.py)
+    rotation_reminder_at = db.Column(db.DateTime, index=True)
+    # In the trash since (see utils/trash.py)
+    deleted_at = db.Column(db.DateTime, index=True)
+    
+    folder = db.relationship('Folder')
     
     def __init__(self, service_name, username, encrypted_password, user_id):
         if not service_name or not username or not encrypted_password:
@@ -95,5 +370,168 @@ class PasswordEntry(db.Model):
         self.encrypted_password = encrypted_password
         self.updated_at = datetime.utcnow()
     
+    def schedule_rotation(self, days):
+        """Set the rotation policy, counting from a password change now"""
+        self.rotation_days = days or None
+        self.next_rotation_at = datetime.utcnow() + timedelta(days=days) if days else None
+        self.rotation_reminder_at = self.next_rotation_at
+    
+    def __repr__(self):
+        return f'<PasswordEntry {self.service_name}>'
+
+class Vault(db.Model):
+    """Password vault shared by several users (see utils/vaults.py)"""
+    __tablename__ = 'vaults'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    owner = db.relationship('User')
+    members = db.relationship('VaultMember', backref='vault', lazy=True,
+                              cascade='all, delete-orphan', order_by='VaultMember.added_at')
+    entries = db.relationship('VaultEntry', backref='vault', lazy='dynamic',
+                              cascade='all, delete-orphan', order_by='VaultEntry.created_at.desc()')
+    
+    def __repr__(self):
+        return f'<Vault {self.name}>'
+
+class VaultMember(db.Model):
+    """A user's access to a vault: the vault key wrapped with the user's key"""
+    __tablename__ = 'vault_members'
+    # Membership checks look up (user_id, vault_id)
+    __table_args__ = (db.Index('ix_vault_members_user_id', 'user_id', 'vault_id'),)
+    
+    vault_id = db.Column(db.Integer, db.ForeignKey('vaults.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    wrapped_key = db.Column(db.Text, nullable=False)
+    added_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    user = db.relationship('User')
+    
+    def __repr__(self):
+        return f'<VaultMember {self.vault_id} {self.user_id}>'
+
+class VaultEntry(db.Model):
+    """Password entry of a shared vault, encrypted once under the vault key"""
+    __tablename__ = 'vault_entries'
+    __table_args__ = (db.Index('ix_vault_entries_vault_created', 'vault_id', 'created_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    vault_id = db.Column(db.Integer, db.ForeignKey('vaults.id'), nullable=False)
+    service_name = db.Column(db.String(100), nullable=False)
+    username = db.Column(db.String(100), nullable=False)
+    encrypted_password = db.Column(db.Text, nullable=False)
+    # None once the creator has deleted their account
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<VaultEntry {self.service_name}>'
+
+class AuditEvent(db.Model):
+    """Sensitive action taken in a user's account (written by utils/auditlog.py)"""
+    __tablename__ = 'audit_events'
+    __table_args__ = (db.Index('ix_audit_events_user_id_id', 'user_id', 'id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    action = db.Column(db.String(50), nullable=False)
+    target = db.Column(db.String(200))
+    ip_address = db.Column(db.String(45))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<AuditEvent {self.action} {self.user_id}>'
+
+class AccessToken(db.Model):
+    """Personal access token of an API client (see utils/tokens.py)"""
+    __tablename__ = 'access_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    # Keyed hash of the token; the token itself is only shown once
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    # Last characters of the token, to tell tokens apart in the list
+    hint = db.Column(db.String(8), nullable=False)
+    # Comma-separated endpoint groups the token may call
+    scopes = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime)
+    
+    @property
+    def scope_list(self) -> list:
+        return self.scopes.split(',')
+    
+    def __repr__(self):
+        return f'<AccessToken {self.name} {self.user_id}>'
+
+class ShardDirectory(db.Model):
+    """Shard holding a user's notes and password entries (see utils/sharding.py)"""
+    __tablename__ = 'shard_directory'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, autoincrement=False)
+    # Bind key of the shard; None while the data still lives on the primary
+    shard = db.Column(db.String(32))
+    # Set while the data is being moved; writes are refused until it clears
+    locked = db.Column(db.Boolean, default=False, nullable=False)
+    
+    def __repr__(self):
+        return f'<ShardDirectory {self.user_id} {self.shard}>'
+
+class BackgroundJob(db.Model):
+    """Persistent record of a background job and its progress"""
+    __tablename__ = 'background_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)
+    progress = db.Column(db.Integer, default=0, nullable=False)
+    message = db.Column(db.String(200))
+    params = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.String(500))
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    @property
+    def finished(self):
+        """Whether the job has reached a terminal state"""
+        return self.status in ('succeeded', 'failed', 'cancelled')
+    
+    def to_dict(self):
+        """Public view of the job for polling clients"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+    
+    def __repr__(self):
+        return f'<BackgroundJob {self.kind} {self.status}>'
+
+class ServerSession(db.Model):
+    """Server-side session record; the cookie carries only the session id"""
+    __tablename__ = 'sessions'
+    
+    # SHA-256 of the session id, so a leaked table cannot be replayed as cookies
+    id = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, index=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
     def __repr__(self):
-        return f'<PasswordEntry {self.service_name}>'
\ No newline at end of file
+        return f'<ServerSession user={self.user_id}>'
\ No newline at end of file
@@ -2,31 +2,89 @@
 Notes management routes and logic
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask import Blueprint, render_template, stream_template, redirect, url_for, flash, request, abort, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
-from models import db, Note
-from utils.forms import NoteForm, DeleteConfirmationForm, SearchForm
+from werkzeug.datastructures import ContentRange
+from models import db, Note, NoteChunk, NoteRevision, Attachment, Folder, BackgroundJob, Blob
+from utils.forms import NoteForm, DeleteConfirmationForm, SearchForm, RestoreRevisionForm, AttachmentForm, OrganizeForm
+from utils.tags import parse_tags, item_tags, set_item_tags, tagged_ids, id_filter, user_tag_names, folder_for_name
+from utils.jobs import runner, job_handler, job_result
+from utils.replication import read_replica
+from utils.blobstore import get_blob_store, BlobTooLarge
+from utils.auditlog import audit
+from utils.trash import move_to_trash
+from utils.security import secure_filename
+from utils.bitmap import Bitmap
+from utils.serialization import dumps
+from utils import simhash
 from datetime import datetime
+import tempfile
 
 # Create notes blueprint
 notes_bp = Blueprint('notes', __name__, url_prefix='/notes')
 
+def _notes_containing(query, text, batch_size=64):
+    """
+    Ids of the notes selected by ``query`` whose content contains ``text`` (ignoring case)
+    
+    Chunks are decompressed and matched in Python rather than in SQL, so this
+    works on every database. Each chunk is matched together with the last
+    ``len(text) - 1`` characters of the one before, so matches straddling a
+    chunk boundary are found, and the remaining chunks of a note are skipped
+    once it has matched.
+    """
+    needle = text.lower()
+    overlap = len(needle) - 1
+    candidates = query.with_entities(Note.id).order_by(None).subquery()
+    rows = db.session.execute(
+        db.select(NoteChunk.note_id, NoteChunk.data)
+        .where(NoteChunk.note_id.in_(db.select(candidates.c.id)))
+        .order_by(NoteChunk.note_id, NoteChunk.seq)
+        .execution_options(yield_per=batch_size)
+    )
+    
+    found = []
+    current, tail = None, ''
+    for note_id, data in rows:
+        if found and found[-1] == note_id:
+            continue
+        if note_id != current:
+            current, tail = note_id, ''
+        data = data.lower()
+        if needle in tail + data:
+            found.append(note_id)
+        elif overlap:
+            tail = (tail + data)[-overlap:]
+    return found
+
 @notes_bp.route('/')
 @login_required
+@read_replica
 def list_notes():
-    """List all user notes with search and pagination"""
+    """List all user notes with search, tag/folder filters and pagination"""
     search_form = SearchForm()
     page = request.args.get('page', 1, type=int)
     search_query = request.args.get('q', '', type=str)
+    selected_tags = parse_tags(','.join(request.args.getlist('tag')))
+    match = 'any' if request.args.get('match') == 'any' else 'all'
+    folder_id = request.args.get('folder', type=int)
     
     # Base query for user's notes
     query = Note.query.filter_by(user_id=current_user.id)
     
-    # Apply search filter if provided
+    # Tag filters are resolved with bitmaps, then applied as a single id filter
+    if selected_tags:
+        ids = tagged_ids(current_user.id, 'notes', selected_tags, match_all=match == 'all')
+        query = query.filter(id_filter(Note.id, ids))
+    if folder_id:
+        query = query.filter(Note.folder_id == folder_id)
+    
+    # Apply search filter if provided; titles match in SQL, content in Python
     if search_query:
+        title_match = Note.title.icontains(search_query, autoescape=True)
         query = query.filter(
-            (Note.title.contains(search_query)) | 
-            (Note.content.contains(search_query))
+            title_match | 
+            id_filter(Note.id, _notes_containing(query.filter(~title_match), search_query))
         )
         search_form.query.data = search_query
     
@@ -38,7 +96,12 @@ def list_notes():
     return render_template('notes.html', 
                          notes=notes, 
                          search_form=search_form,
-                         search_query=search_query)
+                         search_query=search_query,
+                         selected_tags=selected_tags,
+                         match=match,
+                         folder_id=folder_id,
+                         user_tags=user_tag_names(current_user.id),
+                         user_folders=Folder.query.filter_by(user_id=current_user.id).order_by(Folder.name).all())
 
 @notes_bp.route('/new', methods=['GET', 'POST'])
 @login_required
@@ -72,10 +135,57 @@ def create_note():
 
 @notes_bp.route('/<int:note_id>')
 @login_required
+@read_replica
 def view_note(note_id):
-    """View a specific note"""
+    """View a specific note, streaming its content chunk by chunk"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
+    return stream_template('note_detail.html', 
+                           note=note, 
+                           chunks=note.iter_content(),
+                           attachment_form=AttachmentForm(),
+                           delete_form=DeleteConfirmationForm(),
+                           similar=note.similar_notes(),
+                           organize_form=OrganizeForm(
+                               tags=', '.join(item_tags(current_user.id, 'notes', note.id)),
+                               folder=note.folder.name if note.folder else ''
+                           ))
+
+@notes_bp.route('/<int:note_id>/organize', methods=['POST'])
+@login_required
+def organize_note(note_id):
+    """Set a note's tags and folder"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
+    form = OrganizeForm()
+    
+    if form.validate_on_submit():
+        folder = folder_for_name(current_user.id, form.folder.data)
+        note.folder_id = folder.id if folder else None
+        db.session.commit()
+        set_item_tags(current_user.id, 'notes', note.id, parse_tags(form.tags.data))
+        flash('Tags and folder saved.', 'success')
+    else:
+        for errors in form.errors.values():
+            flash(errors[0], 'error')
+    
+    return redirect(url_for('notes.view_note', note_id=note.id))
+
+@notes_bp.route('/<int:note_id>/raw')
+@login_required
+def raw_note(note_id):
+    """
+    Stream a note's content as plain text
+    
+    Optional ``offset`` and ``length`` query arguments (in characters) load
+    only part of the note.
+    """
     note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
-    return render_template('note_detail.html', note=note)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    length = request.args.get('length', type=int)
+    end = offset + max(length, 0) if length is not None else None
+    
+    return Response(stream_with_context(note.iter_content(offset, end)), 
+                    mimetype='text/plain', 
+                    headers={'X-Note-Size': str(note.size)})
 
 @notes_bp.route('/<int:note_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -109,21 +219,69 @@ def edit_note(note_id):
                          note=note, 
                          title='Edit Note')
 
+@notes_bp.route('/<int:note_id>/revisions')
+@login_required
+def list_revisions(note_id):
+    """List earlier versions of a note, newest first"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
+    revisions = db.session.execute(
+        db.select(NoteRevision.number, NoteRevision.title, NoteRevision.created_at)
+        .where(NoteRevision.note_id == note.id)
+        .order_by(NoteRevision.number.desc())
+    ).all()
+    return render_template('note_revisions.html', note=note, revisions=revisions)
+
+@notes_bp.route('/<int:note_id>/revisions/<int:number>')
+@login_required
+def view_revision(note_id, number):
+    """View an earlier version of a note"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
+    revision = note.revisions.filter_by(number=number).first_or_404()
+    
+    return render_template('note_revision.html', 
+                         note=note, 
+                         revision=revision, 
+                         content=note.revision_content(number),
+                         form=RestoreRevisionForm())
+
+@notes_bp.route('/<int:note_id>/revisions/<int:number>/restore', methods=['POST'])
+@login_required
+def restore_revision(note_id, number):
+    """Make an earlier version the current one (the replaced version becomes a new revision)"""
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
+    revision = note.revisions.filter_by(number=number).first_or_404()
+    form = RestoreRevisionForm()
+    
+    if form.validate_on_submit():
+        try:
+            note.update_content(title=revision.title, content=note.revision_content(number))
+            db.session.commit()
+            
+            flash(f'Note restored to revision {number}.', 'success')
+            return redirect(url_for('notes.view_note', note_id=note.id))
+            
+        except Exception as e:
+            db.session.rollback()
+            flash('An error occurred while restoring the note. Please try again.', 'error')
+    
+    return redirect(url_for('notes.view_revision', note_id=note.id, number=number))
+
 @notes_bp.route('/<int:note_id>/delete', methods=['GET', 'POST'])
 @login_required
 def delete_note(note_id):
-    """Delete a note with confirmation"""
+    """Move a note to the trash with confirmation"""
     note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
     form = DeleteConfirmationForm()
     
     if request.method == 'POST':
         if form.validate_on_submit():
             try:
-                # Delete the note
-                db.session.delete(note)
+                # Tags stay with the note until it is purged, so a restore keeps them
+                move_to_trash(note)
                 db.session.commit()
+                audit('note_deleted', note.title)
                 
-                flash('Note deleted successfully!', 'success')
+                flash('Note moved to the trash.', 'success')
                 return redirect(url_for('notes.list_notes'))
                 
             except Exception as e:
@@ -139,6 +297,132 @@ def delete_note(note_id):
                          item_type='note',
                          cancel_url=url_for('notes.view_note', note_id=note.id))
 
+@notes_bp.route('/<int:note_id>/attachments', methods=['POST'])
+@login_required
+def upload_attachment(note_id):
+    """
+    Attach a file to a note
+    
+    Accepts the upload form, or the raw file as the request body (named by an
+    ``X-Filename`` header) for clients streaming large files.
+    """
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
+    form = None
+    
+    if request.mimetype == 'multipart/form-data':
+        form = AttachmentForm()
+        if not form.validate_on_submit():
+            for errors in form.errors.values():
+                flash(errors[0], 'error')
+            return redirect(url_for('notes.view_note', note_id=note.id))
+        upload = form.file.data
+        stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream = request.stream
+        filename = request.headers.get('X-Filename', '')
+        content_type = request.mimetype or 'application/octet-stream'
+    
+    try:
+        blob = get_blob_store().ingest(stream, max_size=current_app.config['ATTACHMENT_MAX_SIZE'])
+        attachment = Attachment(
+            note_id=note.id,
+            blob_id=blob.id,
+            filename=secure_filename(filename or 'file'),
+            content_type=content_type or 'application/octet-stream',
+            size=blob.size
+        )
+        db.session.add(attachment)
+        db.session.commit()
+    except BlobTooLarge as e:
+        db.session.rollback()
+        if form is None:
+            return {'status': 'error', 'message': str(e)}, 413
+        flash('The file is too large to attach.', 'error')
+        return redirect(url_for('notes.view_note', note_id=note.id))
+    
+    if form is None:
+        return {
+            'status': 'success',
+            'attachment': {'id': attachment.id, 'filename': attachment.filename, 'size': attachment.size}
+        }, 201
+    
+    flash(f'Attached {attachment.filename}.', 'success')
+    return redirect(url_for('notes.view_note', note_id=note.id))
+
+def _get_attachment_or_404(note_id, attachment_id):
+    """Fetch an attachment of one of the current user's notes"""
+    # Notes may live on the user's shard and attachments on the primary, so no join
+    note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
+    return Attachment.query.filter_by(id=attachment_id, note_id=note.id).first_or_404()
+
+@notes_bp.route('/<int:note_id>/attachments/<int:attachment_id>')
+@login_required
+def download_attachment(note_id, attachment_id):
+    """
+    Stream an attachment, decrypting it chunk by chunk
+    
+    Supports single byte-range requests so large files can be resumed or
+    seeked without decrypting the whole blob.
+    """
+    attachment = _get_attachment_or_404(note_id, attachment_id)
+    size = attachment.size
+    etag = attachment.blob_id
+    start, stop, status = 0, size, 200
+    
+    ranges = request.range
+    if ranges and len(ranges.ranges) == 1 and (
+            request.if_range.etag is None and request.if_range.date is None
+            or request.if_range.etag == etag):
+        bounds = ranges.range_for_length(size)
+        if bounds is None:
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+        start, stop = bounds
+        status = 206
+    
+    body = get_blob_store().iter_range(attachment.blob, start, stop)
+    response = Response(stream_with_context(body), status, 
+                        mimetype=attachment.content_type, 
+                        direct_passthrough=True)
+    response.content_length = stop - start
+    response.accept_ranges = 'bytes'
+    response.set_etag(etag)
+    if status == 206:
+        response.content_range = ContentRange('bytes', start, stop, size)
+    response.headers['Content-Disposition'] = f'attachment; filename="{attachment.filename}"'
+    # Never let browsers render user uploads inline
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.cache_control.private = True
+    return response
+
+@notes_bp.route('/<int:note_id>/attachments/<int:attachment_id>/delete', methods=['POST'])
+@login_required
+def delete_attachment(note_id, attachment_id):
+    """Remove an attachment (its blob is purged once nothing references it)"""
+    attachment = _get_attachment_or_404(note_id, attachment_id)
+    form = DeleteConfirmationForm()
+    
+    if form.validate_on_submit():
+        db.session.delete(attachment)
+        db.session.commit()
+        audit('attachment_deleted', attachment.filename)
+        flash(f'Removed {attachment.filename}.', 'success')
+    
+    return redirect(url_for('notes.view_note', note_id=note_id))
+
+@notes_bp.route('/duplicates')
+@login_required
+def duplicate_notes():
+    """Report groups of near-duplicate notes"""
+    rows = db.session.execute(
+        db.select(Note.id, Note.simhash)
+        .where(Note.user_id == current_user.id, Note.simhash.isnot(None))
+    ).all()
+    groups = simhash.group_near_duplicates((note_id, simhash.to_unsigned(value)) for note_id, value in rows)
+    
+    grouped_ids = [note_id for group in groups for note_id in group]
+    notes = {note.id: note for note in Note.query.filter(id_filter(Note.id, Bitmap(grouped_ids)))} if groups else {}
+    return render_template('note_duplicates.html', groups=[[notes[note_id] for note_id in group] for group in groups])
+
 @notes_bp.route('/search')
 @login_required
 def search_notes():
@@ -146,17 +430,101 @@ def search_notes():
     query = request.args.get('q', '')
     return redirect(url_for('notes.list_notes', q=query))
 
+@notes_bp.route('/export', methods=['POST'])
+@login_required
+def export_notes():
+    """Start exporting all notes as a background job"""
+    job = runner.submit('export_notes', user_id=current_user.id)
+    return {
+        'status': 'accepted',
+        'job_id': job.id,
+        'status_url': url_for('jobs.job_status', job_id=job.id),
+        'download_url': url_for('notes.download_export', job_id=job.id)
+    }, 202
+
+@notes_bp.route('/export/<job_id>')
+@login_required
+def download_export(job_id):
+    """Download the JSON file produced by a finished export job"""
+    job = BackgroundJob.query.filter_by(
+        id=job_id, 
+        user_id=current_user.id, 
+        kind='export_notes'
+    ).first_or_404()
+    
+    if job.status != 'succeeded':
+        return {'status': 'error', 'message': 'Export is not ready yet'}, 409
+    
+    # Unreferenced blobs are purged after a while (see utils/blobstore.py)
+    blob = db.session.get(Blob, job_result(job)['blob_id'])
+    if blob is None:
+        return {'status': 'error', 'message': 'Export has expired, please start a new one'}, 410
+    
+    body = get_blob_store().iter_range(blob)
+    response = Response(stream_with_context(body), mimetype='application/json', direct_passthrough=True, headers={
+        'Content-Disposition': f'attachment; filename=notes-export-{job.created_at:%Y%m%d%H%M}.json'
+    })
+    response.content_length = blob.size
+    return response
+
+@job_handler('export_notes')
+def export_notes_job(ctx, batch_size=200):
+    """
+    Write every note of the job's user to an encrypted blob, reporting progress per batch
+    
+    Notes are written one at a time and their content a chunk at a time, so
+    memory use does not depend on the size of the export. The job result only
+    names the blob; download_export streams it.
+    """
+    total = Note.query.filter_by(user_id=ctx.user_id).count()
+    count = 0
+    last_id = 0
+    
+    with tempfile.TemporaryFile() as out:
+        out.write(b'{"notes":[')
+        while True:
+            ctx.check_cancelled()
+            batch = db.session.execute(
+                db.select(Note.id, Note.title, Note.created_at, Note.updated_at)
+                .where(Note.user_id == ctx.user_id, Note.id > last_id)
+                .order_by(Note.id).limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            
+            for note in batch:
+                if count:
+                    out.write(b',')
+                # Content goes last, streamed into the object as pieces of one JSON string
+                out.write(dumps(note._asdict())[:-1] + b',"content":"')
+                chunks = db.session.execute(
+                    db.select(NoteChunk.data).where(NoteChunk.note_id == note.id)
+                    .order_by(NoteChunk.seq).execution_options(yield_per=4)
+                ).scalars()
+                for data in chunks:
+                    out.write(dumps(data)[1:-1])
+                out.write(b'"}')
+                count += 1
+            last_id = batch[-1].id
+            ctx.progress(count, total, f'Exported {count} of {total} notes')
+        out.write(b'],"count":' + dumps(count) + b'}')
+        
+        out.seek(0)
+        blob = get_blob_store().ingest(out)
+    return {'count': count, 'blob_id': blob.id}
+
 # API-like routes for AJAX operations
 @notes_bp.route('/api/<int:note_id>/quick-delete', methods=['POST'])
 @login_required
 def quick_delete_note(note_id):
-    """Quick delete note via AJAX"""
+    """Quick move a note to the trash via AJAX"""
     note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
     
     try:
-        db.session.delete(note)
+        move_to_trash(note)
         db.session.commit()
-        return {'status': 'success', 'message': 'Note deleted successfully'}
+        audit('note_deleted', note.title)
+        return {'status': 'success', 'message': 'Note moved to the trash'}
     except Exception as e:
         db.session.rollback()
         return {'status': 'error', 'message': 'Failed to delete note'}, 500
\ No newline at end of file
@@ -2,44 +2,142 @@
 Password management routes and logic
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, json
 from flask_login import login_required, current_user
-from models import db, PasswordEntry
-from utils.forms import PasswordEntryForm, EditPasswordEntryForm, DeleteConfirmationForm, SearchForm, PasswordGeneratorForm
+from flask_sqlalchemy.pagination import Pagination
+from models import db, PasswordEntry, Folder, Vault, VaultEntry
+from utils.forms import PasswordEntryForm, EditPasswordEntryForm, DeleteConfirmationForm, SearchForm, PasswordGeneratorForm, BatchPasswordGeneratorForm, OrganizeForm
+from utils.passgen import generate_batch as generate_password_batch, batch_entropy
+from utils.strength import score_for, STRENGTH_LABELS
 from utils.security import PasswordEncryption, PasswordGenerator
+from utils.search import fuzzy_search, suggest_service_names
+from utils.ratelimit import limiter
+from utils.auditlog import audit
+from utils.jobs import runner, job_handler
+from utils.replication import read_replica
+from utils.tags import parse_tags, item_tags, set_item_tags, tagged_ids, id_filter, user_tag_names, folder_for_name
+from utils.vaults import shared_entries, entries_share_database
+from utils.trash import move_to_trash
 from datetime import datetime
+import hashlib
+import heapq
+import itertools
+import math
 
 # Create passwords blueprint
 passwords_bp = Blueprint('passwords', __name__, url_prefix='/passwords')
 
+class _MergedPagination(Pagination):
+    """Page of the rows of several sorted SELECTs, merged in Python (for SELECTs on different databases)"""
+
+    def _query_items(self):
+        selects, key = self._query_args['selects'], self._query_args['key']
+        # The first rows of each are enough to fill every page up to this one
+        end = self._query_offset + self.per_page
+        rows = heapq.merge(*(db.session.execute(select.limit(end)).all() for select in selects), key=key)
+        return list(itertools.islice(rows, self._query_offset, end))
+
+    def _query_count(self):
+        return sum(
+            db.session.execute(db.select(db.func.count()).select_from(select.order_by(None).subquery())).scalar()
+            for select in self._query_args['selects']
+        )
+
 @passwords_bp.route('/')
 @login_required
+@read_replica
 def list_passwords():
-    """List all user password entries with search and pagination"""
+    """List the user's password entries and shared vault entries with search, tag/folder filters and pagination"""
     search_form = SearchForm()
     page = request.args.get('page', 1, type=int)
     search_query = request.args.get('q', '', type=str)
+    selected_tags = parse_tags(','.join(request.args.getlist('tag')))
+    match = 'any' if request.args.get('match') == 'any' else 'all'
+    folder_id = request.args.get('folder', type=int)
     
     # Base query for user's password entries
     query = PasswordEntry.query.filter_by(user_id=current_user.id)
     
-    # Apply search filter if provided
+    # Tag filters are resolved with bitmaps, then applied as a single id filter
+    if selected_tags:
+        ids = tagged_ids(current_user.id, 'passwords', selected_tags, match_all=match == 'all')
+        query = query.filter(id_filter(PasswordEntry.id, ids))
+    if folder_id:
+        query = query.filter(PasswordEntry.folder_id == folder_id)
+    
+    # Apply fuzzy service-name search (plus username substring) if provided
+    ordering = [PasswordEntry.created_at.desc()]
+    rank, shared_rank = db.literal(0), 0
     if search_query:
+        # Every match, not just the best few; pagination limits what is shown
+        ranked_ids = fuzzy_search(current_user.id, search_query, limit=None)
         query = query.filter(
-            (PasswordEntry.service_name.contains(search_query)) | 
+            (PasswordEntry.id.in_(ranked_ids)) | 
             (PasswordEntry.username.contains(search_query))
         )
+        if ranked_ids:
+            # Best service-name matches first, username-only matches after
+            rank = db.case(
+                {entry_id: position for position, entry_id in enumerate(ranked_ids)},
+                value=PasswordEntry.id,
+                else_=len(ranked_ids)
+            )
+            ordering.insert(0, rank)
+            # Shared entries rank with the username-only matches
+            shared_rank = len(ranked_ids)
         search_form.query.data = search_query
     
-    # Order by creation date (newest first) and paginate
-    password_entries = query.order_by(PasswordEntry.created_at.desc()).paginate(
-        page=page, per_page=10, error_out=False, max_per_page=50
-    )
+    # Order by relevance, then creation date (newest first) and paginate.
+    # Shared vault entries are merged in, unless filtering by the user's own
+    # tags or folders, with one UNION query next to the personal entries or,
+    # when those are on a shard, by merging a query on each database.
+    if selected_tags or folder_id:
+        password_entries = query.order_by(*ordering).paginate(
+            page=page, per_page=10, error_out=False, max_per_page=50
+        )
+    else:
+        personal = query.with_entities(
+            PasswordEntry.id, PasswordEntry.service_name, PasswordEntry.username, PasswordEntry.created_at,
+            db.literal(None, db.Integer).label('vault_id'), db.literal(None, db.String).label('vault_name'),
+            rank.label('rank')
+        ).statement
+        shared = shared_entries(
+            current_user.id,
+            VaultEntry.id, VaultEntry.service_name, VaultEntry.username, VaultEntry.created_at,
+            VaultEntry.vault_id, Vault.name.label('vault_name'), db.literal(shared_rank).label('rank')
+        )
+        if search_query:
+            shared = shared.where(
+                VaultEntry.service_name.contains(search_query) | VaultEntry.username.contains(search_query)
+            )
+        if entries_share_database(current_user.id):
+            merged = db.union_all(personal, shared).subquery()
+            password_entries = db.session.query(merged).order_by(merged.c.rank, merged.c.created_at.desc()).paginate(
+                page=page, per_page=10, error_out=False, max_per_page=50
+            )
+        else:
+            password_entries = _MergedPagination(
+                selects=[personal.order_by(rank, PasswordEntry.created_at.desc()), shared.order_by(VaultEntry.created_at.desc())],
+                key=lambda row: (row.rank, -row.created_at.timestamp()),
+                page=page, per_page=10, error_out=False, max_per_page=50
+            )
     
     return render_template('passwords.html', 
                          password_entries=password_entries, 
                          search_form=search_form,
-                         search_query=search_query)
+                         search_query=search_query,
+                         selected_tags=selected_tags,
+                         match=match,
+                         folder_id=folder_id,
+                         user_tags=user_tag_names(current_user.id),
+                         user_folders=Folder.query.filter_by(user_id=current_user.id).order_by(Folder.name).all())
+
+def _flash_weak_password(password, *user_inputs):
+    """Warn (without blocking the save) when a stored password is easy to guess"""
+    analysis = PasswordGenerator.check_password_strength(password, user_inputs)
+    if analysis['score'] < 3:
+        reason = analysis['feedback'][0] if analysis['feedback'] else 'It is short or simple'
+        flash(f"This password is {analysis['strength'].lower()}. {reason}; consider generating a new one.", 'info')
 
 @passwords_bp.route('/new', methods=['GET', 'POST'])
 @login_required
@@ -63,12 +161,14 @@ def create_password():
                 encrypted_password=encrypted_password,
                 user_id=current_user.id
             )
+            password_entry.schedule_rotation(form.rotation_days.data)
             
             # Add to database
             db.session.add(password_entry)
             db.session.commit()
             
             flash('Password entry created successfully!', 'success')
+            _flash_weak_password(form.password.data, password_entry.service_name, password_entry.username)
             return redirect(url_for('passwords.list_passwords'))
             
         except ValueError as e:
@@ -84,6 +184,7 @@ def create_password():
 
 @passwords_bp.route('/<int:password_id>')
 @login_required
+@read_replica
 def view_password(password_id):
     """View a specific password entry"""
     password_entry = PasswordEntry.query.filter_by(
@@ -91,7 +192,35 @@ def view_password(password_id):
         user_id=current_user.id
     ).first_or_404()
     
-    return render_template('password_detail.html', password_entry=password_entry)
+    organize_form = OrganizeForm(
+        tags=', '.join(item_tags(current_user.id, 'passwords', password_entry.id)),
+        folder=password_entry.folder.name if password_entry.folder else ''
+    )
+    return render_template('password_detail.html', 
+                         password_entry=password_entry, 
+                         organize_form=organize_form)
+
+@passwords_bp.route('/<int:password_id>/organize', methods=['POST'])
+@login_required
+def organize_password(password_id):
+    """Set a password entry's tags and folder"""
+    password_entry = PasswordEntry.query.filter_by(
+        id=password_id, 
+        user_id=current_user.id
+    ).first_or_404()
+    form = OrganizeForm()
+    
+    if form.validate_on_submit():
+        folder = folder_for_name(current_user.id, form.folder.data)
+        password_entry.folder_id = folder.id if folder else None
+        db.session.commit()
+        set_item_tags(current_user.id, 'passwords', password_entry.id, parse_tags(form.tags.data))
+        flash('Tags and folder saved.', 'success')
+    else:
+        for errors in form.errors.values():
+            flash(errors[0], 'error')
+    
+    return redirect(url_for('passwords.view_password', password_id=password_entry.id))
 
 @passwords_bp.route('/<int:password_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -109,6 +238,7 @@ def edit_password(password_id):
     if request.method == 'GET':
         form.service_name.data = password_entry.service_name
         form.username.data = password_entry.username
+        form.rotation_days.data = password_entry.rotation_days or 0
         # Don't pre-populate password for security
     
     if form.validate_on_submit():
@@ -125,11 +255,14 @@ def edit_password(password_id):
                 username=form.username.data.strip(),
                 encrypted_password=encrypted_password
             )
+            # A new password restarts the rotation period
+            password_entry.schedule_rotation(form.rotation_days.data)
             
             # Save changes
             db.session.commit()
             
             flash('Password entry updated successfully!', 'success')
+            _flash_weak_password(form.password.data, password_entry.service_name, password_entry.username)
             return redirect(url_for('passwords.view_password', password_id=password_entry.id))
             
         except ValueError as e:
@@ -147,7 +280,7 @@ def edit_password(password_id):
 @passwords_bp.route('/<int:password_id>/delete', methods=['GET', 'POST'])
 @login_required
 def delete_password(password_id):
-    """Delete a password entry with confirmation"""
+    """Move a password entry to the trash with confirmation"""
     password_entry = PasswordEntry.query.filter_by(
         id=password_id, 
         user_id=current_user.id
@@ -158,11 +291,12 @@ def delete_password(password_id):
     if request.method == 'POST':
         if form.validate_on_submit():
             try:
-                # Delete the password entry
-                db.session.delete(password_entry)
+                # Tags stay with the entry until it is purged, so a restore keeps them
+                move_to_trash(password_entry)
                 db.session.commit()
+                audit('password_deleted', password_entry.service_name)
                 
-                flash('Password entry deleted successfully!', 'success')
+                flash('Password entry moved to the trash.', 'success')
                 return redirect(url_for('passwords.list_passwords'))
                 
             except Exception as e:
@@ -180,6 +314,7 @@ def delete_password(password_id):
 
 @passwords_bp.route('/<int:password_id>/reveal', methods=['POST'])
 @login_required
+@limiter.limit(json_response=True)
 def reveal_password(password_id):
     """Reveal encrypted password via AJAX"""
     password_entry = PasswordEntry.query.filter_by(
@@ -193,6 +328,7 @@ def reveal_password(password_id):
             password_entry.encrypted_password, 
             current_user.id
         )
+        audit('password_revealed', password_entry.service_name)
         
         return jsonify({
             'status': 'success',
@@ -207,6 +343,7 @@ def reveal_password(password_id):
 
 @passwords_bp.route('/generate', methods=['POST'])
 @login_required
+@limiter.limit(json_response=True)
 def generate_password():
     """Generate a secure password via AJAX"""
     form = PasswordGeneratorForm()
@@ -247,6 +384,120 @@ def generate_password():
         'message': 'Invalid form data'
     }), 400
 
+@passwords_bp.route('/generate/batch', methods=['POST'])
+@login_required
+@limiter.limit(json_response=True)
+def generate_batch():
+    """
+    Generate many passwords at once, streamed as NDJSON
+    
+    Each line is a JSON object with the password, the exact entropy in bits
+    of the chosen generation settings and the strength label that entropy
+    earns (every password of a batch is equally hard to guess).
+    """
+    form = BatchPasswordGeneratorForm()
+    if not form.validate_on_submit():
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid form data',
+            'errors': form.errors
+        }), 400
+    
+    options = {
+        'mode': form.mode.data,
+        'length': form.length.data,
+        'include_symbols': form.include_symbols.data.strip().lower() not in ('', '0', 'false'),
+        'words': form.words.data,
+    }
+    separator = form.separator.data
+    entropy = batch_entropy(**options)
+    strength = STRENGTH_LABELS[score_for(entropy * math.log10(2))]
+    entropy = round(entropy, 1)
+    count = form.count.data
+    
+    def lines(chunk_size=500):
+        for start in range(0, count, chunk_size):
+            passwords = generate_password_batch(min(chunk_size, count - start), separator=separator, **options)
+            yield ''.join(
+                json.dumps({'password': password, 'entropy': entropy, 'strength': strength}) + '\n'
+                for password in passwords
+            )
+    
+    response = Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@passwords_bp.route('/api/suggest')
+@login_required
+def suggest_services():
+    """Autocomplete service names for the search box via AJAX"""
+    prefix = request.args.get('prefix', '', type=str).strip()[:100]
+    suggestions = suggest_service_names(current_user.id, prefix) if prefix else []
+    
+    return jsonify({
+        'status': 'success',
+        'suggestions': suggestions
+    })
+
+@passwords_bp.route('/audit', methods=['POST'])
+@login_required
+def audit_passwords():
+    """Start a weak/reused password audit as a background job"""
+    job = runner.submit('audit_passwords', user_id=current_user.id)
+    return jsonify({
+        'status': 'accepted',
+        'job_id': job.id,
+        'status_url': url_for('jobs.job_status', job_id=job.id),
+        'result_url': url_for('jobs.job_result_view', job_id=job.id)
+    }), 202
+
+@job_handler('audit_passwords')
+def audit_passwords_job(ctx, batch_size=200):
+    """Decrypt every entry of the job's user and report weak and reused passwords"""
+    # Derive the user's key once for the whole audit
+    cipher = PasswordEncryption.get_cipher(ctx.user_id)
+    total = PasswordEntry.query.filter_by(user_id=ctx.user_id).count()
+    weak, failed = [], []
+    seen = {}
+    checked = 0
+    last_id = 0
+    
+    while True:
+        ctx.check_cancelled()
+        batch = db.session.execute(
+            db.select(PasswordEntry.id, PasswordEntry.service_name, PasswordEntry.encrypted_password)
+            .where(PasswordEntry.user_id == ctx.user_id, PasswordEntry.id > last_id)
+            .order_by(PasswordEntry.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        
+        for entry_id, service_name, encrypted_password in batch:
+            item = {'id': entry_id, 'service_name': service_name}
+            try:
+                password = PasswordEncryption.decrypt_password(encrypted_password, ctx.user_id, cipher=cipher)
+            except ValueError:
+                failed.append(item)
+                continue
+            
+            strength = PasswordGenerator.check_password_strength(password, (service_name,))
+            if strength['score'] < 3:
+                weak.append(dict(item, strength=strength['strength']))
+            # Only a digest is kept to spot reuse, never the password itself
+            seen.setdefault(hashlib.sha256(password.encode()).digest(), []).append(item)
+        
+        checked += len(batch)
+        last_id = batch[-1][0]
+        ctx.progress(checked, total, f'Checked {checked} of {total} passwords')
+    
+    return {
+        'total': checked,
+        'weak': weak,
+        'reused': [items for items in seen.values() if len(items) > 1],
+        'undecryptable': failed
+    }
+
 @passwords_bp.route('/search')
 @login_required
 def search_passwords():
@@ -258,16 +509,17 @@ def search_passwords():
 @passwords_bp.route('/api/<int:password_id>/quick-delete', methods=['POST'])
 @login_required
 def quick_delete_password(password_id):
-    """Quick delete password entry via AJAX"""
+    """Quick move a password entry to the trash via AJAX"""
     password_entry = PasswordEntry.query.filter_by(
         id=password_id, 
         user_id=current_user.id
     ).first_or_404()
     
     try:
-        db.session.delete(password_entry)
+        move_to_trash(password_entry)
         db.session.commit()
-        return jsonify({'status': 'success', 'message': 'Password entry deleted successfully'})
+        audit('password_deleted', password_entry.service_name)
+        return jsonify({'status': 'success', 'message': 'Password entry moved to the trash'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'status': 'error', 'message': 'Failed to delete password entry'}), 500
\ No newline at end of file
@@ -23,8 +23,12 @@ def initialize_database():
     """Initialize the database with tables"""
     try:
         with app.app_context():
-            # Create all tables
+            # Create all tables, then add the columns newer versions added to existing ones
             db.create_all()
+            from utils.migrations import migrate_database
+            added = migrate_database()
+            if added:
+                print(f"✅ Database upgraded: added {', '.join(added)}")
             
             # Verify tables were created
             inspector = db.inspect(db.engine)
@@ -42,6 +46,12 @@ def initialize_database():
             print(f"📝 Notes: {note_count}")
             print(f"🔐 Password entries: {password_count}")
             
+            # Jobs cannot survive a restart of this single-process server
+            from utils.jobs import fail_interrupted_jobs
+            interrupted = fail_interrupted_jobs()
+            if interrupted:
+                print(f"⚠️  Marked {interrupted} interrupted background jobs as failed")
+            
             return True
             
     except Exception as e:
@@ -80,6 +90,18 @@ def run_tests():
         print(f"❌ Test failed: {e}")
         return False
 
+def warm_templates():
+    """Precompile all templates before accepting traffic"""
+    try:
+        from utils.templates import precompile_templates
+        count, elapsed = precompile_templates(app)
+        print(f"✅ Templates precompiled: {count} in {elapsed * 1000:.1f} ms")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Template precompilation failed: {e}")
+        return False
+
 def create_app():
     """Create and configure the Flask application"""
     print("🚀 Starting SecureWebApp...")
@@ -99,6 +121,11 @@ def create_app():
         print("❌ Connectivity tests failed. Exiting.")
         sys.exit(1)
     
+    # Compile templates so the first requests don't pay for it
+    if not warm_templates():
+        print("❌ Template warmup failed. Exiting.")
+        sys.exit(1)
+    
     print("=" * 60)
     print("🎉 Application ready!")
     print("🌐 Frontend: Amazon-style blue and white UI")
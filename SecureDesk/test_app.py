@@ -4,6 +4,7 @@ Simple test script to verify the SecureWebApp functionality
 """
 
 import pytest
+from contextlib import contextmanager
 from app import app, db
 from models import User, Note, PasswordEntry
 from utils.security import PasswordEncryption
@@ -131,21 +132,1581 @@ def test_routes_require_auth(client):
 
 def test_registration_and_login(client):
     """Test user registration and login flow"""
+    # Guessable passwords are rejected even when they mix character classes
+    response = client.post('/auth/register', data={
+        'email': 'test@example.com',
+        'password': 'Password123!',
+        'confirm_password': 'Password123!'
+    })
+    assert response.status_code == 200
+    assert b'too easy to guess' in response.data
+    
     # Test registration
     response = client.post('/auth/register', data={
         'email': 'test@example.com',
-        'password': 'TestPassword123',
-        'confirm_password': 'TestPassword123'
+        'password': 'Maple-Orbit-Kettle-42',
+        'confirm_password': 'Maple-Orbit-Kettle-42'
     })
     assert response.status_code == 302  # Redirect after successful registration
     
     # Test login
     response = client.post('/auth/login', data={
         'email': 'test@example.com',
-        'password': 'TestPassword123'
+        'password': 'Maple-Orbit-Kettle-42'
     })
     assert response.status_code == 302  # Redirect after successful login
 
+def _create_user(email='test@example.com', password='TestPassword123'):
+    """Create and save a user, returning its id"""
+    user = User(email=email)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def _login(client, email='test@example.com', password='TestPassword123'):
+    """Log the test client in as the given user"""
+    return client.post('/auth/login', data={'email': email, 'password': password})
+
+def _add_entries(user_id, *service_names):
+    """Store password entries for the given service names"""
+    for name in service_names:
+        db.session.add(PasswordEntry(
+            service_name=name,
+            username='someone',
+            encrypted_password='not-really-encrypted',
+            user_id=user_id
+        ))
+    db.session.commit()
+
+def test_fuzzy_service_search():
+    """Test trigram search tolerates typos and follows edits and deletes"""
+    from utils.search import fuzzy_search, suggest_service_names
+    
+    with app.app_context():
+        user_id = _create_user()
+        other_id = _create_user('other@example.com')
+        _add_entries(user_id, 'Gmail', 'Amazon Web Services', 'Amazon', 'Chase Bank')
+        _add_entries(other_id, 'Gmail Work')
+        
+        by_id = {e.id: e.service_name for e in PasswordEntry.query.all()}
+        assert [by_id[i] for i in fuzzy_search(user_id, 'gmial')][:1] == ['Gmail']
+        assert [by_id[i] for i in fuzzy_search(user_id, 'amaz')][:2] == ['Amazon', 'Amazon Web Services']
+        assert suggest_service_names(user_id, 'amaz') == ['Amazon', 'Amazon Web Services']
+        assert suggest_service_names(user_id, 'ban') == ['Chase Bank']
+        
+        # Index follows renames and deletes
+        entry = PasswordEntry.query.filter_by(service_name='Chase Bank').first()
+        entry.update_entry('Citibank', entry.username, entry.encrypted_password)
+        db.session.commit()
+        assert suggest_service_names(user_id, 'chase') == []
+        assert suggest_service_names(user_id, 'citi') == ['Citibank']
+        
+        db.session.delete(entry)
+        db.session.commit()
+        assert suggest_service_names(user_id, 'citi') == []
+
+def test_suggest_endpoint(client):
+    """Test the autocomplete endpoint returns the user's service names"""
+    user_id = _create_user()
+    _add_entries(user_id, 'GitHub', 'GitLab', 'Google')
+    _login(client)
+    
+    response = client.get('/passwords/api/suggest?prefix=git')
+    assert response.status_code == 200
+    assert response.get_json()['suggestions'] == ['GitHub', 'GitLab']
+    
+    response = client.get('/passwords/?q=gogle')
+    assert response.status_code == 200
+    assert b'Google' in response.data
+
+def test_rate_limit_strategies():
+    """Test sliding-window and token-bucket limiters admit exactly the configured rate"""
+    from utils.ratelimit import MemoryStore, SlidingWindowLimiter, TokenBucketLimiter
+    
+    window = SlidingWindowLimiter(MemoryStore())
+    results = [window.hit('k', 3, 60, now=1200 + i) for i in range(4)]
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert results[-1].retry_after > 0
+    # Half way through the next window only half of the old hits still count
+    assert window.hit('k', 3, 60, now=1290).allowed
+    assert not window.hit('k', 3, 60, now=1291).allowed
+    
+    bucket = TokenBucketLimiter(MemoryStore())
+    assert all(bucket.hit('k', 2, 10, now=100).allowed for _ in range(2))
+    assert not bucket.hit('k', 2, 10, now=100).allowed
+    assert bucket.hit('k', 2, 10, now=105).allowed
+
+def test_login_throttled_before_hashing(client, monkeypatch):
+    """Test repeated logins are rejected with 429 without checking the password"""
+    from utils.ratelimit import limiter
+    from utils.metrics import metrics
+    
+    _create_user()
+    checks = []
+    original = User.check_password
+    monkeypatch.setattr(User, 'check_password', lambda self, pw: checks.append(pw) or original(self, pw))
+    monkeypatch.setitem(app.config, 'RATELIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATELIMIT_ROUTES', {'auth.login': [('2/minute', 'user')]})
+    limiter.reset()
+    rejected_before = metrics.value('ratelimit_rejections_total', endpoint='auth.login', scope='user')
+    
+    for _ in range(2):
+        assert _login(client, password='WrongPassword1').status_code == 200
+    response = _login(client, password='WrongPassword1')
+    
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+    assert len(checks) == 2
+    assert metrics.value('ratelimit_rejections_total', endpoint='auth.login', scope='user') == rejected_before + 1
+    limiter.reset()
+
+def test_server_side_sessions(client):
+    """Test sessions live server-side, load with the user in one query and can be revoked"""
+    from sqlalchemy import event
+    from models import ServerSession
+    
+    user_id = _create_user()
+    _login(client)
+    
+    record = ServerSession.query.filter_by(user_id=user_id).one()
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    assert len(cookie.value) < 64
+    assert record.id != cookie.value  # only the hash is stored
+    
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.get('/passwords/api/suggest?prefix=')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    assert len(statements) == 1  # session and user in a single query, nothing written
+    
+    response = client.post('/auth/logout-all')
+    assert response.status_code == 302
+    assert ServerSession.query.filter_by(user_id=user_id).count() == 0
+    assert client.get('/dashboard').status_code == 302
+
+def test_background_jobs(client):
+    """Test export and audit jobs report status and results through /jobs"""
+    from models import Note, BackgroundJob, Blob
+    from utils.security import PasswordEncryption
+    from utils.blobstore import get_blob_store
+    from utils.jobs import runner, job_handler, _handlers
+    
+    user_id = _create_user()
+    db.session.add(Note(title='First', content='Hello', user_id=user_id))
+    for service, password in [('a', 'short'), ('b', 'Sup3r$ecret!Passw0rd'), ('c', 'Sup3r$ecret!Passw0rd')]:
+        db.session.add(PasswordEntry(
+            service_name=service,
+            username='someone',
+            encrypted_password=PasswordEncryption.encrypt_password(password, user_id),
+            user_id=user_id
+        ))
+    db.session.commit()
+    _login(client)
+    
+    response = client.post('/notes/export')
+    assert response.status_code == 202
+    status = client.get(response.json['status_url']).json['job']
+    assert status['status'] == 'succeeded' and status['progress'] == 100
+    # Polling never carries the result itself, and the result only names the export's blob
+    assert 'result' not in status
+    result = client.get(status['result_url']).json['result']
+    assert result['count'] == 1 and set(result) == {'count', 'blob_id'}
+    export = client.get(response.json['download_url'])
+    assert export.json['count'] == 1 and export.content_length == len(export.data)
+    assert [(note['title'], note['content']) for note in export.json['notes']] == [('First', 'Hello')]
+    # The blob store encrypts the export at rest
+    with open(get_blob_store().path(db.session.get(Blob, result['blob_id'])), 'rb') as f:
+        assert b'First' not in f.read()
+    
+    response = client.post('/passwords/audit')
+    assert 'result_url' in client.get(response.json['status_url']).json['job']
+    result = client.get(response.json['result_url']).json['result']
+    assert [entry['service_name'] for entry in result['weak']] == ['a']
+    assert [[entry['service_name'] for entry in group] for group in result['reused']] == [['b', 'c']]
+    
+    # Queued jobs are cancelled before they start
+    job = BackgroundJob(id='queued-job', kind='export_notes', user_id=user_id, status='queued')
+    db.session.add(job)
+    db.session.commit()
+    response = client.post('/jobs/queued-job/cancel')
+    assert response.json['job']['status'] == 'cancelled'
+    runner.run('queued-job')
+    assert db.session.get(BackgroundJob, 'queued-job').status == 'cancelled'
+    assert client.get('/jobs/queued-job/result').status_code == 409
+    
+    # A job handed to several workers runs once: only the first claims it
+    calls = []
+    
+    @job_handler('claim_test')
+    def claim_test(ctx):
+        calls.append(ctx.job_id)
+        runner.run(ctx.job_id)  # a second worker picking up the same job
+        return 'done'
+    
+    try:
+        db.session.add(BackgroundJob(id='claimed-job', kind='claim_test', user_id=user_id, status='queued'))
+        db.session.commit()
+        runner.run('claimed-job')
+        runner.run('claimed-job')
+        assert calls == ['claimed-job']
+        assert client.get('/jobs/claimed-job/result').json['result'] == 'done'
+    finally:
+        _handlers.pop('claim_test')
+
+def test_note_revisions(client):
+    """Test every edit is kept as a revision that can be rebuilt and restored"""
+    from models import Note, NoteRevision
+    
+    user_id = _create_user()
+    note = Note(title='Draft', content='line 0\n', user_id=user_id)
+    db.session.add(note)
+    db.session.commit()
+    
+    versions = [('Draft', 'line 0\n')]
+    for i in range(1, 25):
+        content = ''.join(f'line {j}\n' for j in range(i + 1))
+        note.update_content(title=f'Draft {i}', content=content)
+        db.session.commit()
+        versions.append((f'Draft {i}', content))
+    
+    assert note.revision_count == 24
+    assert NoteRevision.query.filter_by(note_id=note.id, is_snapshot=True).count() == 2
+    for number, (title, content) in enumerate(versions[:-1], start=1):
+        assert note.revision_content(number) == content
+    assert note.revision_content(25) is None
+    
+    _login(client)
+    response = client.get(f'/notes/{note.id}/revisions')
+    assert b'Revision 24: Draft 23' in response.data
+    assert b'line 2' in client.get(f'/notes/{note.id}/revisions/3').data
+    
+    client.post(f'/notes/{note.id}/revisions/3/restore')
+    db.session.refresh(note)
+    assert (note.title, note.content) == versions[2]
+    assert note.revision_content(25) == versions[-1][1]
+    
+    db.session.delete(note)
+    db.session.commit()
+    assert NoteRevision.query.count() == 0
+
+def test_note_compression(client):
+    """Test large note bodies are compressed at rest but read and searched as plaintext"""
+    from models import Note
+    from utils.compression import RAW, ZLIB
+    
+    user_id = _create_user()
+    log = ''.join(f'2024-01-01 12:00:{i % 60:02d} INFO request served in {i} ms\n' for i in range(100))
+    db.session.add_all([
+        Note(title='Log', content=log, user_id=user_id),
+        Note(title='Short', content='tiny', user_id=user_id)
+    ])
+    db.session.commit()
+    db.session.expunge_all()
+    
+    stored = dict(db.session.execute(db.text(
+        'SELECT title, data FROM notes JOIN note_chunks ON note_chunks.note_id = notes.id'
+    )).all())
+    assert stored['Log'][0] == ZLIB and len(stored['Log']) < len(log) / 4
+    assert stored['Short'] == bytes([RAW]) + b'tiny'
+    
+    # Rows written before compression was enabled are still readable
+    db.session.execute(db.text("UPDATE note_chunks SET data = 'legacy text' WHERE data = :data"), {'data': stored['Short']})
+    db.session.commit()
+    
+    notes = {note.title: note for note in Note.query.all()}
+    assert 'chunks' not in notes['Log'].__dict__  # loaded only when accessed
+    assert notes['Log'].snippet == log[:120]
+    assert notes['Log'].content == log
+    assert notes['Short'].content == 'legacy text'
+    
+    _login(client)
+    response = client.get('/notes/?q=served in 42 ms')
+    assert b'Log' in response.data and b'Short' not in response.data
+    # Content is matched in Python, case-insensitively and without LIKE wildcards
+    assert b'>Log<' in client.get('/notes/?q=SERVED IN 42').data
+    assert b'>Log<' not in client.get('/notes/?q=served_in').data
+
+def test_large_note_chunks(client):
+    """Test multi-MB notes are chunked, streamed and loadable by range"""
+    from models import Note, NoteChunk
+    
+    user_id = _create_user()
+    size = NoteChunk.CHUNK_SIZE
+    content = ''.join(f'{i:07d} runbook line\n' for i in range(60000))  # ~1.3 MB
+    note = Note(title='Runbook', content=content, user_id=user_id)
+    db.session.add(note)
+    db.session.commit()
+    
+    chunk_count = -(-len(content) // size)
+    assert NoteChunk.query.filter_by(note_id=note.id).count() == chunk_count
+    assert note.size == len(content) and note.content == content
+    assert ''.join(note.iter_content(size - 5, size + 5)) == content[size - 5:size + 5]
+    
+    # Only the changed chunk is rewritten; shrinking drops the extra chunks
+    before = {chunk.seq: chunk.data for chunk in note.chunks}
+    edited = content[:10] + 'X' + content[11:2 * size]
+    note.update_content(title='Runbook', content=edited)
+    db.session.commit()
+    assert [chunk.seq for chunk in note.chunks] == [0, 1]
+    assert note.chunks[1].data == before[1]
+    assert note.revision_content(1) == content
+    
+    _login(client)
+    response = client.get(f'/notes/{note.id}')
+    assert response.is_streamed
+    assert response.get_data(as_text=True).count(' line<br>') == edited.count('\n')
+    
+    response = client.get(f'/notes/{note.id}/raw?offset={size - 3}&length=6')
+    assert response.get_data(as_text=True) == edited[size - 3:size + 3]
+    assert response.headers['X-Note-Size'] == str(len(edited))
+    
+    response = client.post(f'/notes/{note.id}/edit', data={'title': 'Runbook', 'content': content})
+    assert response.status_code == 302
+    db.session.refresh(note)
+    assert note.size == len(content.strip())
+    
+    # Search finds text straddling a chunk boundary, but not halves split across notes
+    padding = 'x' * (size - 4)
+    db.session.add_all([
+        Note(title='Straddling', content=padding + 'Boundary marker', user_id=user_id),
+        Note(title='Halves', content=padding + 'Boun', user_id=user_id),
+        Note(title='Other half', content='dary marker', user_id=user_id),
+    ])
+    db.session.commit()
+    html = client.get('/notes/?q=boundary marker').get_data(as_text=True)
+    assert '>Straddling<' in html and '>Halves<' not in html and '>Other half<' not in html
+
+def test_note_attachments(client):
+    """Test attachments are encrypted, deduplicated and served with byte ranges"""
+    import io
+    import os
+    from datetime import timedelta
+    from models import Note, Blob, Attachment
+    from utils.blobstore import get_blob_store
+    
+    user_id = _create_user()
+    notes = [Note(title=f'Note {i}', content='', user_id=user_id) for i in range(2)]
+    db.session.add_all(notes)
+    db.session.commit()
+    _login(client)
+    
+    payload = os.urandom(150 * 1024) + b'secret marker'
+    response = client.post(f'/notes/{notes[0].id}/attachments', 
+                           data={'file': (io.BytesIO(payload), '../report.pdf')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    response = client.post(f'/notes/{notes[1].id}/attachments', data=payload,
+                           headers={'X-Filename': 'copy.bin', 'Content-Type': 'application/octet-stream'})
+    assert response.status_code == 201
+    
+    # Identical content is stored once, and encrypted on disk
+    store = get_blob_store()
+    blob = Blob.query.one()
+    with open(store.path(blob), 'rb') as f:
+        assert b'secret marker' not in f.read()
+    first, second = Attachment.query.order_by(Attachment.id).all()
+    assert first.filename == 'report.pdf' and first.blob_id == second.blob_id == blob.id
+    
+    url = f'/notes/{notes[0].id}/attachments/{first.id}'
+    response = client.get(url)
+    assert response.status_code == 200 and response.data == payload
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    
+    # A range spanning a chunk boundary
+    response = client.get(url, headers={'Range': 'bytes=65530-65545'})
+    assert response.status_code == 206 and response.data == payload[65530:65546]
+    assert response.headers['Content-Range'] == f'bytes 65530-65545/{len(payload)}'
+    assert client.get(url, headers={'Range': 'bytes=-13'}).data == b'secret marker'
+    assert client.get(url, headers={'Range': f'bytes={len(payload)}-'}).status_code == 416
+    
+    # Other users' notes and oversized uploads are refused
+    assert client.get(f'/notes/{notes[1].id}/attachments/{first.id}').status_code == 404
+    app.config['ATTACHMENT_MAX_SIZE'] = 1024
+    try:
+        response = client.post(f'/notes/{notes[1].id}/attachments', data=payload,
+                               headers={'Content-Type': 'application/octet-stream'})
+        assert response.status_code == 413
+    finally:
+        app.config['ATTACHMENT_MAX_SIZE'] = 100 * 1024 * 1024
+    
+    # Blobs are purged only once no attachment references them
+    path = store.path(blob)
+    db.session.delete(notes[0])
+    db.session.commit()
+    assert store.purge_orphans(grace=timedelta(0)) == 0
+    client.post(f'/notes/{notes[1].id}/attachments/{second.id}/delete', data={'item_id': second.id})
+    assert Attachment.query.count() == 0
+    assert store.purge_orphans(grace=timedelta(seconds=-1)) == 1
+    assert not os.path.exists(path) and Blob.query.count() == 0
+
+def test_bitmap():
+    """Test roaring-style bitmaps round-trip and combine like sets"""
+    import random
+    from utils.bitmap import Bitmap
+    
+    rng = random.Random(3)
+    dense = set(rng.sample(range(200000), 60000))
+    sparse = set(rng.sample(range(200000), 200)) | {0, 65535, 65536, 2 ** 32 - 1}
+    a, b = Bitmap(dense), Bitmap(sparse)
+    
+    for bitmap, values in ((a, dense), (b, sparse)):
+        assert list(Bitmap.from_bytes(bitmap.to_bytes())) == sorted(values)
+    assert set(a & b) == dense & sparse
+    assert set(a | b) == dense | sparse
+    assert len(b.to_bytes()) < 2 * len(sparse) + 64  # sparse containers stay arrays
+    
+    b.discard(65536)
+    assert 65536 not in b and 65535 in b
+    
+    # Ids past 32 bits (as shards allocate) switch to the wide format; 32-bit bitmaps keep the compact one
+    wide = Bitmap(sparse | {2 ** 40, 2 ** 40 + 70000, 2 ** 63 - 1})
+    assert b.to_bytes()[:3] == b'RB1' and wide.to_bytes()[:3] == b'RB2'
+    assert list(Bitmap.from_bytes(wide.to_bytes())) == sorted(wide)
+    assert set(wide & a) == dense & set(wide) and 2 ** 40 + 70000 in wide | a
+
+def test_tags_and_folders(client):
+    """Test tag/folder filters combine with search and survive deletes"""
+    from models import Note, Tag
+    from utils.bitmap import Bitmap
+    
+    user_id = _create_user()
+    notes = [Note(title=f'Note {i}', content='', user_id=user_id) for i in range(4)]
+    db.session.add_all(notes)
+    db.session.commit()
+    _login(client)
+    
+    for note, tags, folder in [(notes[0], 'Work, urgent', 'Projects'), (notes[1], 'work', ''),
+                               (notes[2], 'urgent, home', 'Projects'), (notes[3], '', '')]:
+        response = client.post(f'/notes/{note.id}/organize', data={'tags': tags, 'folder': folder})
+        assert response.status_code == 302
+    
+    def listed(**params):
+        html = client.get('/notes/', query_string=params).get_data(as_text=True)
+        return {note.title for note in notes if f'>{note.title}<' in html}
+    
+    assert listed(tag=['work', 'urgent']) == {'Note 0'}
+    assert listed(tag=['work', 'urgent'], match='any') == {'Note 0', 'Note 1', 'Note 2'}
+    assert listed(tag=['missing', 'work']) == set()
+    assert listed(tag='urgent', q='Note 2') == {'Note 2'}
+    assert listed(folder=notes[0].folder_id) == {'Note 0', 'Note 2'}
+    assert b'urgent, work' in client.get(f'/notes/{notes[0].id}').data
+    
+    # The id filter is plain SQL on every database, with no limit on the number of ids
+    from sqlalchemy.dialects import postgresql, mysql
+    from utils.tags import id_filter
+    condition = id_filter(Note.id, Bitmap(range(100000)) | Bitmap([2 ** 32 - 1]))
+    for dialect in (postgresql.dialect(), mysql.dialect()):
+        sql = str(db.select(Note.id).where(condition).compile(dialect=dialect, compile_kwargs={'render_postcompile': True}))
+        assert 'json_each' not in sql and sql.rstrip().endswith('99999, 4294967295)')
+    assert Note.query.filter(condition).count() == 4
+    assert Note.query.filter(id_filter(Note.id, Bitmap())).count() == 0
+    
+    # Password entries have their own membership in the same tags
+    _add_entries(user_id, 'Bank')
+    entry = PasswordEntry.query.one()
+    client.post(f'/passwords/{entry.id}/organize', data={'tags': 'work', 'folder': 'Projects'})
+    html = client.get('/passwords/?tag=work').get_data(as_text=True)
+    assert 'Bank' in html
+    assert 'Bank' not in client.get('/passwords/?tag=home').get_data(as_text=True)
+    
+    # Trashed items leave tag filters; purging removes them from their tags and drops empty tags
+    client.post(f'/notes/{notes[2].id}/delete', data={'item_id': notes[2].id})
+    assert listed(tag='urgent') == {'Note 0'}
+    assert Tag.query.filter_by(name='home').first() is not None
+    client.post('/trash/empty', data={'item_id': 'all'})
+    assert Tag.query.filter_by(name='home').first() is None
+    assert listed(tag='urgent') == {'Note 0'}
+
+def test_near_duplicate_notes(client):
+    """Test SimHash fingerprints find near-duplicate notes through the band index"""
+    from models import Note
+    from utils import simhash
+    
+    text = ' '.join(f'line {i} of the quarterly planning meeting minutes' for i in range(60))
+    user_id = _create_user()
+    notes = [
+        Note(title='Minutes', content=text, user_id=user_id),
+        Note(title='Minutes (copy)', content=text + ' plus one late addition', user_id=user_id),
+        Note(title='Recipes', content='flour sugar eggs butter and a pinch of salt', user_id=user_id),
+    ]
+    db.session.add_all(notes)
+    db.session.commit()
+    
+    # A small edit flips only a few bits, so some band is shared
+    original, copy = (simhash.to_unsigned(note.simhash) for note in notes[:2])
+    assert simhash.distance(original, copy) <= simhash.MAX_DISTANCE
+    assert [title for _, _, title in notes[0].similar_notes()] == ['Minutes (copy)']
+    assert notes[2].similar_notes() == []
+    assert simhash.group_near_duplicates([(1, 0b1011), (2, 0b1000), (3, ~0 & (2 ** 64 - 1))]) == [[1, 2]]
+    
+    # The fingerprint follows content updates
+    notes[1].update_content('Minutes (copy)', 'something else entirely about gardening and tomatoes')
+    db.session.commit()
+    assert notes[0].similar_notes() == []
+    
+    notes[1].update_content('Minutes (copy)', text)
+    db.session.commit()
+    _login(client)
+    assert b'Minutes (copy)' in client.get(f'/notes/{notes[0].id}').data
+    html = client.get('/notes/duplicates').get_data(as_text=True)
+    assert 'Minutes (copy)' in html and 'Recipes' not in html
+
+def test_batch_password_generation(client):
+    """Test batch generation modes, unbiased index drawing and NDJSON streaming"""
+    import json
+    import math
+    from collections import Counter
+    from utils import passgen
+    from utils.security import character_classes
+    
+    passwords = passgen.generate_batch(200, 'random', length=8)
+    assert len(passwords) == 200 and all(len(p) == 8 for p in passwords)
+    assert all(character_classes(p) == {'l', 'u', 'd', 's'} for p in passwords)
+    assert passgen.random_mode_entropy(16, True) < 16 * math.log2(88)
+    
+    phrases = passgen.generate_batch(5, 'passphrase', words=4, separator=' ', wordlist=('alpha', 'beta', 'gamma'))
+    assert all(len(p.split(' ')) == 4 and set(p.split(' ')) <= {'alpha', 'beta', 'gamma'} for p in phrases)
+    assert all(len(p) == 9 for p in passgen.generate_batch(5, 'pronounceable', length=9))
+    
+    counts = Counter(passgen.random_indices(3, 30000))
+    assert set(counts) == {0, 1, 2} and min(counts.values()) > 9000
+    
+    _create_user()
+    _login(client)
+    response = client.post('/passwords/generate/batch', data={'count': 1200, 'mode': 'passphrase', 'words': 5})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 1200
+    assert len(lines[0]['password'].split('-')) == 5 and lines[0]['entropy'] > 50
+    assert lines[0]['strength'] == 'Strong'
+    
+    assert client.post('/passwords/generate/batch', data={'count': 10 ** 6}).status_code == 400
+    assert client.post('/passwords/generate/batch', data={'mode': 'nope'}).status_code == 400
+
+def test_password_strength_estimator(tmp_path):
+    """Test pattern-based strength estimates and the memory-mapped dictionaries"""
+    from utils.strength import StrengthEstimator, DICTIONARIES, load_trie, compile_trie, Trie
+    from utils.security import PasswordGenerator
+    
+    trie = Trie(compile_trie(['pass', 'password', 'word']))
+    assert list(trie.prefixes('xpasswords', 1)) == [(5, 1), (9, 2)]
+    assert list(trie.prefixes('wordy', 0)) == [(4, 3)]
+    
+    # Compiled once into the cache directory, then memory-mapped
+    estimator = StrengthEstimator({name: load_trie(path, str(tmp_path)) for name, path in DICTIONARIES.items()})
+    assert len(list(tmp_path.glob('*.trie'))) == 2
+    estimator = StrengthEstimator({name: load_trie(path, str(tmp_path)) for name, path in DICTIONARIES.items()})
+    
+    def score(password, *user_inputs):
+        return estimator.estimate(password, user_inputs)['score']
+    
+    # Mixed classes no longer make a predictable password strong
+    assert score('Password1!') <= 1
+    assert score('p@ssw0rd') == 0
+    assert score('drowssap') == 0
+    assert score('qwertyuiop') == 0
+    assert score('zxcvbnm,./') <= 1
+    assert score('abcdefgh') <= 1
+    assert score('aaaaaaaaaaaa') <= 1
+    assert score('19/02/1988') <= 1
+    assert score('kX9#mQ2$vL7!wB') == 4
+    assert score('Maple-Orbit-Kettle-42') >= 3
+    assert score('johnsmith88') > score('johnsmith88', 'john.smith@example.com')
+    assert 'Contains a keyboard pattern' in estimator.estimate('qazwsxedcrfv99')['feedback']
+    
+    analysis = PasswordGenerator.check_password_strength('Password1!')
+    assert analysis['has_symbols'] and analysis['strength'] in ('Very Weak', 'Weak')
+
+def test_read_replica_routing(tmp_path):
+    """Test replica reads, read-your-writes stickiness and simulated replication lag"""
+    from flask import Flask
+    from utils.compression import configure_compression
+    from utils.replication import init_replication, read_replica, sync_sqlite_replicas
+    
+    replica_app = Flask('replica_test')
+    replica_app.config.update(
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/primary.db',
+        SQLALCHEMY_BINDS={'replica0': f'sqlite:///{tmp_path}/replica.db'},
+        REPLICA_STICKY_SECONDS=60,
+    )
+    db.init_app(replica_app)
+    configure_compression(replica_app)
+    init_replication(replica_app)
+    
+    def count():
+        return str(Note.query.count())
+    replica_app.add_url_rule('/count', 'count', read_replica(count))
+    replica_app.add_url_rule('/primary-count', 'primary_count', count)
+    
+    @replica_app.route('/add', methods=['POST'])
+    def add():
+        db.session.add(Note(title='New', content='', user_id=1))
+        db.session.commit()
+        return count()
+    
+    try:
+        with replica_app.app_context():
+            db.create_all()
+            user = User(email='replica@example.com')
+            user.set_password('TestPassword123')
+            db.session.add_all([user, Note(title='First', content='', user_id=1)])
+            db.session.commit()
+            sync_sqlite_replicas()
+    
+        writer, reader = replica_app.test_client(), replica_app.test_client()
+        assert writer.get('/count').data == b'1'
+    
+        # The writer's reads stay on the primary; others see the lagging replica
+        assert writer.post('/add').data == b'2'
+        assert writer.get('/count').data == b'2'
+        assert reader.get('/count').data == b'1'
+        assert reader.get('/primary-count').data == b'2'
+    
+        with replica_app.app_context():
+            sync_sqlite_replicas()
+        assert reader.get('/count').data == b'2'
+    finally:
+        with replica_app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        # init_app registered metadata for the replica bind on the shared db
+        db.metadatas.pop('replica0')
+
+def test_user_sharding(tmp_path):
+    """Test shard placement, per-user routing, global ids and online moves between shards"""
+    from flask import Flask
+    from sqlalchemy import create_engine, text
+    from utils.compression import configure_compression
+    from utils import sharding
+    from models import ShardDirectory
+    
+    shard_app = Flask('shard_test')
+    shard_app.config.update(
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/primary.db',
+        SQLALCHEMY_BINDS={key: f'sqlite:///{tmp_path}/{key}.db' for key in ('shard0', 'shard1')},
+    )
+    db.init_app(shard_app)
+    configure_compression(shard_app)
+    sharding.init_sharding(shard_app)
+    
+    def rows(database, user_id):
+        engine = create_engine(f'sqlite:///{tmp_path}/{database}.db')
+        with engine.connect() as connection:
+            counts = [connection.execute(text(f'SELECT COUNT(*) FROM {table} WHERE user_id = :u'), {'u': user_id}).scalar()
+                      for table in ('notes', 'password_entries')]
+        engine.dispose()
+        return counts
+    
+    try:
+        with shard_app.app_context():
+            db.create_all()
+            shards = sharding.get_shards()
+            users = []
+            for i in range(8):
+                user = User(email=f'shard{i}@example.com')
+                user.set_password('TestPassword123')
+                users.append(user)
+            db.session.add_all(users)
+            db.session.commit()
+            placement = {user.id: db.session.get(ShardDirectory, user.id).shard for user in users}
+            assert placement == {user.id: shards.ring.shard_for(user.id) for user in users}
+            assert set(placement.values()) == {'shard0', 'shard1'}
+            alice = next(u.id for u in users if placement[u.id] == 'shard0')
+            bob = next(u.id for u in users if placement[u.id] == 'shard1')
+            
+            with sharding.use_user_shard(alice):
+                note = Note(title='Plans', content='first draft', user_id=alice)
+                db.session.add_all([note, PasswordEntry('Example', 'alice', 'encrypted', alice)])
+                db.session.commit()
+                note.update_content('Plans', 'second draft')
+                db.session.commit()
+                note_id = note.id
+            with sharding.use_user_shard(bob):
+                db.session.add(Note(title='Bob', content='', user_id=bob))
+                db.session.commit()
+                assert Note.query.filter_by(user_id=alice).count() == 0
+            db.session.remove()
+            
+            # Each shard allocates ids from its own range
+            assert sharding.SHARD_ID_STRIDE <= note_id < 2 * sharding.SHARD_ID_STRIDE
+            assert rows('shard0', alice) == [1, 1] and rows('shard1', alice) == [0, 0]
+            assert rows('primary', alice) == [0, 0]
+            
+            assert sharding.move_user(alice, 'shard1', grace=0)
+            assert not sharding.move_user(alice, 'shard1', grace=0)
+            assert rows('shard0', alice) == [0, 0] and rows('shard1', alice) == [1, 1]
+            assert db.session.get(ShardDirectory, alice).shard == 'shard1'
+            with sharding.use_user_shard(alice):
+                moved = db.session.get(Note, note_id)
+                assert moved.content == 'second draft'
+                assert moved.revision_content(1) == 'first draft'
+                db.session.add(Note(title='After move', content='', user_id=alice))
+                db.session.commit()
+                assert Note.query.filter_by(user_id=alice).count() == 2
+                assert Note.query.filter_by(user_id=bob).count() == 1
+            db.session.remove()
+            
+            # Writes are refused while a move holds the lock; reads continue
+            shards.set_entry(alice, 'shard1', locked=True)
+            with sharding.use_user_shard(alice):
+                assert Note.query.filter_by(user_id=alice).count() == 2
+                db.session.add(Note(title='Blocked', content='', user_id=alice))
+                with pytest.raises(sharding.ShardMoving):
+                    db.session.commit()
+                db.session.rollback()
+            shards.set_entry(alice, 'shard1')
+    finally:
+        with shard_app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        for key in ('shard0', 'shard1'):
+            db.metadatas.pop(key)
+
+@contextmanager
+def _sharded(tmp_path):
+    """Give the test app one shard, so users created meanwhile keep their notes and entries there"""
+    from sqlalchemy import create_engine
+    from utils import sharding
+    
+    engine = create_engine(f'sqlite:///{tmp_path}/shard0.db')
+    engines = db._app_engines[app]
+    binds = app.config['SQLALCHEMY_BINDS']
+    engines['shard0'] = engine
+    app.config['SQLALCHEMY_BINDS'] = {'shard0': str(engine.url)}
+    try:
+        sharding.init_sharding(app)
+        yield sharding.get_shards()
+    finally:
+        db.session.remove()
+        app.extensions.pop('shards', None)
+        app.config['SQLALCHEMY_BINDS'] = binds
+        engines.pop('shard0')
+        engine.dispose()
+
+def test_sharded_attachments(client, tmp_path):
+    """Test attachments of a note on a shard can be downloaded and deleted"""
+    from models import Attachment
+    from utils.sharding import SHARD_ID_STRIDE, use_user_shard
+    
+    with _sharded(tmp_path):
+        user_id = _create_user()
+        _login(client)
+        client.post('/notes/new', data={'title': 'Sharded', 'content': 'with a file'})
+        with use_user_shard(user_id):
+            note_id = Note.query.filter_by(user_id=user_id).one().id
+        assert note_id >= SHARD_ID_STRIDE
+        
+        payload = b'sharded attachment ' * 100
+        response = client.post(f'/notes/{note_id}/attachments', data=payload,
+                               headers={'Content-Type': 'application/octet-stream', 'X-Filename': 'a.txt'})
+        assert response.status_code == 201
+        attachment_id = response.json['attachment']['id']
+        assert b'a.txt' in client.get(f'/notes/{note_id}').data
+        
+        url = f'/notes/{note_id}/attachments/{attachment_id}'
+        assert client.get(url).data == payload
+        assert client.get(f'/notes/{note_id + 1}/attachments/{attachment_id}').status_code == 404
+        client.post(f'{url}/delete', data={'item_id': attachment_id})
+        assert Attachment.query.count() == 0
+        assert client.get(url).status_code == 404
+
+def test_sharded_tags(client, tmp_path):
+    """Test notes and entries on a shard, whose ids exceed 32 bits, can be tagged and filtered"""
+    from utils.sharding import SHARD_ID_STRIDE, use_user_shard
+    
+    with _sharded(tmp_path):
+        user_id = _create_user()
+        _login(client)
+        for title in ('Tagged', 'Untagged'):
+            client.post('/notes/new', data={'title': title, 'content': ''})
+        _add_entries(user_id, 'Bank')
+        with use_user_shard(user_id):
+            notes = {note.title: note.id for note in Note.query.filter_by(user_id=user_id)}
+            entry_id = PasswordEntry.query.filter_by(user_id=user_id).one().id
+        assert min(notes.values()) >= SHARD_ID_STRIDE
+        
+        assert client.post(f'/notes/{notes["Tagged"]}/organize', data={'tags': 'work', 'folder': ''}).status_code == 302
+        assert client.post(f'/passwords/{entry_id}/organize', data={'tags': 'work', 'folder': ''}).status_code == 302
+        html = client.get('/notes/?tag=work').get_data(as_text=True)
+        assert '>Tagged<' in html and '>Untagged<' not in html
+        assert 'Bank' in client.get('/passwords/?tag=work').get_data(as_text=True)
+        assert b'work' in client.get(f'/notes/{notes["Tagged"]}').data
+
+def test_connection_pool_metrics(client, tmp_path):
+    """Test pool options from config, checkout wait/timeout metrics and the /metrics endpoint"""
+    from flask import Flask
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+    from utils.dbpool import InstrumentedQueuePool, configure_pool, label_pools, record_pool_gauges
+    from utils.metrics import metrics
+    
+    pool_app = Flask('pool_test')
+    pool_app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/pool.db',
+        DB_POOL_SIZE=2, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT=1, DB_POOL_PRE_PING=True,
+        SQLALCHEMY_ENGINE_OPTIONS={'pool_recycle': 60},
+    )
+    configure_pool(pool_app)
+    assert pool_app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 2
+    assert pool_app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_recycle'] == 60
+    db.init_app(pool_app)
+    label_pools(pool_app)
+    
+    with pool_app.app_context():
+        engine = db.engine
+    try:
+        assert isinstance(engine.pool, InstrumentedQueuePool)
+        waits_before = metrics.summary('db_pool_checkout_wait_seconds', bind='primary')[0]
+        timeouts_before = metrics.value('db_pool_checkout_timeouts_total', bind='primary')
+        first, second = engine.connect(), engine.connect()
+        record_pool_gauges(pool_app)
+        assert metrics.value('db_pool_in_use', bind='primary') == 2
+        with pytest.raises(PoolTimeout):
+            engine.connect()
+        assert metrics.value('db_pool_checkout_timeouts_total', bind='primary') == timeouts_before + 1
+        count, _, peak = metrics.summary('db_pool_checkout_wait_seconds', bind='primary')
+        assert count == waits_before + 3 and peak >= 1
+        first.close()
+        second.close()
+        record_pool_gauges(pool_app)
+        assert metrics.value('db_pool_in_use', bind='primary') == 0
+    finally:
+        engine.dispose()
+    
+    # The in-memory test database keeps its single shared connection
+    assert not isinstance(db.engine.pool, InstrumentedQueuePool)
+    assert client.get('/metrics').status_code == 404
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    try:
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 404
+        response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        assert response.status_code == 200
+        assert b'db_pool_checkout_wait_seconds_count{bind="primary"}' in response.data
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+def test_audit_log(client, tmp_path):
+    """Test queued audit events, batched flushes, backpressure, spilling and the activity view"""
+    from models import AuditEvent
+    from utils.auditlog import get_audit_log
+    
+    log = get_audit_log()
+    # Drop events queued by earlier tests against their own databases
+    log._events.clear()
+    user_id = _create_user()
+    entry = PasswordEntry('Example Bank', 'me', PasswordEncryption.encrypt_password('s3cret', user_id), user_id)
+    db.session.add(entry)
+    db.session.commit()
+    entry_id = entry.id
+    
+    _login(client, password='WrongPassword1')
+    _login(client)
+    assert client.post(f'/passwords/{entry_id}/reveal').get_json()['password'] == 's3cret'
+    client.post(f'/passwords/api/{entry_id}/quick-delete')
+    
+    # Requests only queue events; nothing is written until a flush
+    assert log.pending == 4
+    assert AuditEvent.query.count() == 0
+    log.batch_size = 3
+    try:
+        assert log.flush() == 4
+    finally:
+        log.batch_size = 500
+    actions = [e.action for e in AuditEvent.query.order_by(AuditEvent.id)]
+    assert actions == ['login_failed', 'login', 'password_revealed', 'password_deleted']
+    assert AuditEvent.query.filter_by(action='password_revealed').one().target == 'Example Bank'
+    
+    # A full queue makes the recording request write a batch itself
+    log.max_size = 2
+    try:
+        client.get('/auth/logout')
+        _login(client)
+        assert log.pending == 0 and AuditEvent.query.count() == 6
+    finally:
+        log.max_size = 10000
+    
+    # Events the database refuses at shutdown are saved and queued again on start
+    client.get('/auth/logout')
+    _login(client)
+    log.spill_path = str(tmp_path / 'spill.jsonl')
+    original_write = log._write
+    def refuse(events):
+        raise RuntimeError('database unavailable')
+    log._write = refuse
+    try:
+        with pytest.raises(RuntimeError):
+            log.flush()
+        assert log.pending == 2
+        assert log.flush(spill=True) == 0
+        assert log.pending == 0
+    finally:
+        log._write = original_write
+    assert log.restore_spill() == 2 and not (tmp_path / 'spill.jsonl').exists()
+    log.spill_path = None
+    
+    response = client.get('/auth/activity')
+    assert response.status_code == 200
+    assert b'Failed sign-in attempt' in response.data
+    assert b'Revealed a password' in response.data
+    assert AuditEvent.query.count() == 8
+
+def test_buffered_last_login(client):
+    """Test login and last-seen times are buffered, shown fresh and flushed in one UPDATE"""
+    from sqlalchemy import event
+    from utils.lastseen import get_last_seen
+    
+    buffer = get_last_seen()
+    # Forget activity buffered by earlier tests against their own databases
+    buffer._pending.clear()
+    emails = [f'seen{i}@example.com' for i in range(3)]
+    user_ids = [_create_user(email) for email in emails]
+    for email in emails:
+        _login(client, email)
+        client.get('/dashboard')
+        client.get('/auth/logout')
+    _login(client, emails[0])
+    
+    # Nothing was written on the login path, but the profile shows the pending value
+    assert db.session.execute(db.select(db.func.count()).where(User.last_login.isnot(None))).scalar() == 0
+    last_login, last_seen = buffer.pending(user_ids[0])
+    response = client.get('/auth/profile')
+    assert last_login.strftime('%Y-%m-%d %H:%M').encode() in response.data
+    assert b'Never' not in response.data
+    
+    updates = []
+    def count_updates(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE users'):
+            updates.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count_updates)
+    try:
+        assert buffer.flush() == 3
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_updates)
+    assert len(updates) == 1 and 'CASE' in updates[0]
+    
+    db.session.expire_all()
+    users = [db.session.get(User, user_id) for user_id in user_ids]
+    assert all(user.last_login and user.last_seen >= user.last_login for user in users)
+    assert users[0].last_seen >= last_seen
+    assert buffer.flush() == 0
+
+def test_json_api(client):
+    """Test the v1 API projects fields, pages by cursor and never exposes passwords"""
+    import json
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    
+    user_id = _create_user()
+    other_id = _create_user('other@example.com')
+    for i in range(5):
+        db.session.add(Note(title=f'Note {i}', content=f'Body {i} ' * 3, user_id=user_id))
+    db.session.add(Note(title='Not mine', content='Hidden', user_id=other_id))
+    db.session.commit()
+    _add_entries(user_id, 'GitHub', 'Gmail')
+    
+    # Anonymous API calls are refused with JSON, not redirected to the login page
+    response = client.get('/api/v1/notes')
+    assert response.status_code == 401 and response.is_json
+    
+    _login(client)
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM notes' in statement:
+            statements.append(statement)
+    # Reads may go to a replica or shard engine, so watch them all
+    event.listen(Engine, 'before_cursor_execute', capture)
+    try:
+        response = client.get('/api/v1/notes?fields=id,title&limit=2')
+        # The body is produced while it is read
+        page = json.loads(response.data)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', capture)
+    assert [note['title'] for note in page['data']] == ['Note 4', 'Note 3']
+    assert all(set(note) == {'id', 'title'} for note in page['data'])
+    assert 'snippet' not in statements[0] and 'simhash' not in statements[0]
+    
+    titles = [note['title'] for note in page['data']]
+    while page['next_cursor']:
+        page = json.loads(client.get(f"/api/v1/notes?fields=title&limit=2&cursor={page['next_cursor']}").data)
+        titles += [note['title'] for note in page['data']]
+    assert titles == [f'Note {i}' for i in range(4, -1, -1)]
+    
+    page = json.loads(client.get('/api/v1/notes?fields=id,content').data)
+    assert page['data'][0]['content'] == 'Body 4 ' * 3 and page['next_cursor'] is None
+    note = json.loads(client.get(f"/api/v1/notes/{page['data'][0]['id']}").data)['data']
+    assert note['content'] == 'Body 4 ' * 3 and note['title'] == 'Note 4'
+    
+    entries = json.loads(client.get('/api/v1/passwords').data)['data']
+    assert [entry['service_name'] for entry in entries] == ['Gmail', 'GitHub']
+    assert 'encrypted_password' not in entries[0]
+    
+    # Unknown fields, bad cursors and other users' items
+    assert client.get('/api/v1/passwords?fields=encrypted_password').status_code == 400
+    assert client.get('/api/v1/notes?cursor=!!').status_code == 400
+    assert client.get('/api/v1/notes?limit=0').status_code == 400
+    other_note = Note.query.filter_by(user_id=other_id).first()
+    response = client.get(f'/api/v1/notes/{other_note.id}')
+    assert response.status_code == 404 and json.loads(response.data)['error']['status'] == 404
+
+def test_access_tokens(client, tmp_path):
+    """Test API tokens are scoped, cached, kept off HTML pages and revocable in every process"""
+    import re
+    from flask import g
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from models import AccessToken
+    from utils.tokens import TokenCache, get_token_cache, issue_token
+    
+    user_id = _create_user()
+    db.session.add(Note(title='Via token', content='Hello', user_id=user_id))
+    db.session.commit()
+    _login(client)
+    response = client.post('/auth/tokens', data={'name': 'Backup', 'scopes': ['notes'], 'expires': '30'})
+    token = re.search(rb'sdp_[\w-]+', response.data).group().decode()
+    stored = AccessToken.query.filter_by(user_id=user_id).one()
+    assert stored.scopes == 'notes' and token not in stored.token_hash and stored.expires_at
+    client.get('/auth/logout')
+    
+    def api_get(url, token=token):
+        # Requests share the fixture's app context, and with it the user cached in g
+        g.pop('_login_user', None)
+        g.pop('token_scopes', None)
+        return client.get(url, headers={'Authorization': f'Bearer {token}'})
+    
+    response = api_get('/api/v1/notes?fields=title')
+    assert response.status_code == 200 and b'Via token' in response.data
+    assert len(get_token_cache()._entries) == 1
+    # Once cached, a token authenticates without reading the token or user rows
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(Engine, 'before_cursor_execute', capture)
+    try:
+        response = api_get('/api/v1/notes?fields=title')
+    finally:
+        event.remove(Engine, 'before_cursor_execute', capture)
+    assert b'Via token' in response.data
+    assert not [s for s in statements if 'FROM users' in s or 'FROM access_tokens' in s]
+    assert g._login_user.id == user_id and g._login_user.email == 'test@example.com'
+    assert api_get('/api/v1/passwords').status_code == 403
+    assert api_get('/api/v1/notes', token='sdp_wrong').status_code == 401
+    # Tokens never stand in for a login on the HTML pages
+    assert api_get('/dashboard').status_code == 302
+    
+    _login(client)
+    client.post(f'/auth/tokens/{stored.id}/revoke', data={'item_id': stored.id})
+    client.get('/auth/logout')
+    assert AccessToken.query.count() == 0
+    assert api_get('/api/v1/notes').status_code == 401
+    
+    # Another process keeps its cached entry until the revocation file changes
+    key = b'k' * 32
+    path = str(tmp_path / 'revocations')
+    revoking, other = TokenCache(key, revocation_path=path), TokenCache(key, revocation_path=path)
+    app.extensions['access_tokens'], original = revoking, get_token_cache()
+    try:
+        row, token = issue_token(user_id, 'Script', ['notes', 'passwords'])
+        db.session.commit()
+        assert other.lookup(token).scopes == {'notes', 'passwords'}
+        db.session.delete(row)
+        db.session.commit()
+        assert other.lookup(token) is not None
+        revoking.revoked()
+        assert other.lookup(token) is None
+    finally:
+        app.extensions['access_tokens'] = original
+
+def test_shared_vaults(client):
+    """Test vault entries are encrypted once, shared by key wrapping and merged into the password list"""
+    from sqlalchemy import event
+    from models import Vault, VaultMember, VaultEntry
+    
+    owner_id = _create_user('owner@example.com')
+    member_id = _create_user('member@example.com')
+    _add_entries(member_id, 'Personal Mail')
+    _login(client, 'owner@example.com')
+    client.post('/vaults/', data={'name': 'Family'})
+    vault = Vault.query.one()
+    client.post(f'/vaults/{vault.id}/entries', data={'service_name': 'Netflix', 'username': 'family', 'password': 'Sh4red!pass'})
+    entry = VaultEntry.query.one()
+    stored = entry.encrypted_password
+    
+    client.post(f'/vaults/{vault.id}/members', data={'email': 'member@example.com'})
+    keys = {m.user_id: m.wrapped_key for m in VaultMember.query.filter_by(vault_id=vault.id)}
+    assert set(keys) == {owner_id, member_id} and keys[owner_id] != keys[member_id]
+    # Sharing wrapped the key once and left the entry alone
+    assert db.session.get(VaultEntry, entry.id).encrypted_password == stored
+    assert b'member@example.com' in client.get(f'/vaults/{vault.id}').data
+    client.get('/auth/logout')
+    
+    _login(client, 'member@example.com')
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'vault_entries' in statement:
+            statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        response = client.get('/passwords/')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    assert b'Netflix' in response.data and b'Personal Mail' in response.data and b'Family' in response.data
+    assert statements and all('UNION ALL' in statement and 'password_entries' in statement for statement in statements)
+    response = client.get('/passwords/?q=netflix')
+    assert b'Netflix' in response.data and b'Personal Mail' not in response.data
+    
+    response = client.post(f'/vaults/{vault.id}/entries/{entry.id}/reveal')
+    assert response.get_json()['password'] == 'Sh4red!pass'
+    # Members cannot manage membership
+    assert client.post(f'/vaults/{vault.id}/members', data={'email': 'owner@example.com'}).status_code == 404
+    client.get('/auth/logout')
+    
+    _login(client, 'owner@example.com')
+    client.post(f'/vaults/{vault.id}/members/{member_id}/remove', data={'item_id': member_id})
+    client.get('/auth/logout')
+    _login(client, 'member@example.com')
+    assert client.get(f'/vaults/{vault.id}').status_code == 404
+    assert client.post(f'/vaults/{vault.id}/entries/{entry.id}/reveal').status_code == 404
+    assert b'Netflix' not in client.get('/passwords/').data
+
+def test_rotation_reminders(client):
+    """Test rotation due dates are served by one indexed query and reminders are sent once"""
+    from datetime import datetime, timedelta
+    from models import AuditEvent
+    from utils.auditlog import get_audit_log
+    from utils.rotation import send_due_reminders
+    
+    get_audit_log()._events.clear()
+    user_id = _create_user()
+    _login(client)
+    client.post('/passwords/new', data={'service_name': 'Bank', 'username': 'me', 'password': 'Xk4#pq9!Lm2z', 'rotation_days': 90})
+    bank = PasswordEntry.query.filter_by(service_name='Bank').one()
+    assert bank.rotation_days == 90 and bank.next_rotation_at > datetime.utcnow() + timedelta(days=89)
+    
+    _add_entries(user_id, 'Overdue', 'Soon', 'Later', 'Never')
+    now = datetime.utcnow()
+    for name, due in (('Overdue', now - timedelta(days=3)), ('Soon', now + timedelta(days=5)), ('Later', now + timedelta(days=60))):
+        entry = PasswordEntry.query.filter_by(service_name=name).one()
+        entry.schedule_rotation(90)
+        entry.next_rotation_at = entry.rotation_reminder_at = due
+    db.session.commit()
+    
+    # The widget is one range scan over (user_id, next_rotation_at)
+    plan = db.session.execute(db.text(
+        "EXPLAIN QUERY PLAN SELECT id FROM password_entries WHERE user_id = 1 AND next_rotation_at <= '2100-01-01' ORDER BY next_rotation_at"
+    )).all()
+    assert 'ix_password_entries_user_rotation' in str(plan)
+    widget = client.get('/dashboard').data.split(b'Recent Passwords')[0]
+    assert b'Overdue since' in widget and b'Soon' in widget
+    assert b'Later' not in widget and b'Bank' not in widget
+    
+    assert send_due_reminders() == 1
+    assert send_due_reminders() == 0
+    get_audit_log().flush()
+    reminders = AuditEvent.query.filter_by(user_id=user_id, action='rotation_due').all()
+    assert [event.target for event in reminders] == ['Overdue']
+    
+    # Changing the password restarts the period
+    overdue = PasswordEntry.query.filter_by(service_name='Overdue').one()
+    client.post(f'/passwords/{overdue.id}/edit', data={'service_name': 'Overdue', 'username': 'someone', 'password': 'Nw7$zq2!Rt5v', 'rotation_days': 30})
+    db.session.refresh(overdue)
+    assert overdue.next_rotation_at > datetime.utcnow() + timedelta(days=29) and overdue.rotation_reminder_at == overdue.next_rotation_at
+
+def test_trash_and_account_deletion(client):
+    """Test deletes go to the trash, purges run in small batches and accounts are deleted in chunks"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import event
+    from models import Note, User, Vault, VaultEntry, BackgroundJob
+    from utils.search import suggest_service_names
+    from utils.trash import purge_trash
+    
+    user_id = _create_user()
+    _add_entries(user_id, 'Bank', 'Mail', 'Shop')
+    notes = [Note(title=f'Note {i}', content='text', user_id=user_id) for i in range(3)]
+    db.session.add_all(notes)
+    db.session.commit()
+    _login(client)
+    entries = {entry.service_name: entry.id for entry in PasswordEntry.query}
+    
+    client.post(f'/notes/{notes[0].id}/delete', data={'item_id': notes[0].id})
+    client.post(f'/passwords/api/{entries["Bank"]}/quick-delete')
+    # Trashed items are hidden everywhere without being deleted
+    assert b'Note 0' not in client.get('/notes/').data
+    assert b'Bank' not in client.get('/passwords/').data and b'Mail' in client.get('/passwords/').data
+    assert suggest_service_names(user_id, 'Ba') == []
+    assert client.get(f'/notes/{notes[0].id}').status_code == 404
+    assert db.session.execute(db.text('SELECT COUNT(*) FROM notes')).scalar() == 3
+    trash = client.get('/trash/').data
+    assert b'Note 0' in trash and b'Bank' in trash and b'Mail' not in trash
+    
+    client.post(f'/trash/passwords/{entries["Bank"]}/restore', data={'item_id': entries['Bank']})
+    assert b'Bank' in client.get('/passwords/').data and suggest_service_names(user_id, 'Ba') == ['Bank']
+    assert client.post(f'/trash/passwords/{entries["Bank"]}/restore', data={'item_id': entries['Bank']}).status_code == 404
+    
+    # Only expired items are purged, one small transaction per batch
+    client.post(f'/passwords/{entries["Mail"]}/delete', data={'item_id': entries['Mail']})
+    client.post(f'/notes/{notes[1].id}/delete', data={'item_id': notes[1].id})
+    db.session.execute(db.update(Note).where(Note.deleted_at.isnot(None)).values(deleted_at=datetime.utcnow() - timedelta(days=31)))
+    db.session.commit()
+    commits = []
+    def count(conn):
+        commits.append(conn)
+    event.listen(db.engine, 'commit', count)
+    try:
+        assert purge_trash(batch_size=1) == 2
+    finally:
+        event.remove(db.engine, 'commit', count)
+    assert len(commits) >= 2
+    assert db.session.execute(db.text('SELECT COUNT(*) FROM notes')).scalar() == 1
+    assert b'Mail' in client.get('/trash/').data
+    
+    # Account deletion: wrong password changes nothing; otherwise a job removes everything
+    other_id = _create_user('other@example.com')
+    client.post('/vaults/', data={'name': 'Mine'})
+    client.post('/auth/delete-account', data={'password': 'wrong'})
+    assert db.session.get(User, user_id).deleted_at is None
+    client.get('/auth/logout')
+    _login(client, 'other@example.com')
+    client.post('/vaults/', data={'name': 'Shared'})
+    shared = Vault.query.filter_by(name='Shared').one()
+    client.post(f'/vaults/{shared.id}/members', data={'email': 'test@example.com'})
+    client.get('/auth/logout')
+    _login(client)
+    client.post(f'/vaults/{shared.id}/entries', data={'service_name': 'Wifi', 'username': 'home', 'password': 'Sh4red!pass'})
+    
+    response = client.post('/auth/delete-account', data={'password': 'TestPassword123'})
+    assert response.status_code == 302
+    job = BackgroundJob.query.filter_by(kind='delete_account').one()
+    assert job.status == 'succeeded' and job.user_id is None
+    db.session.expire_all()
+    assert db.session.get(User, user_id) is None
+    for table in ('notes', 'password_entries', 'tags', 'audit_events', 'sessions'):
+        assert db.session.execute(db.text(f'SELECT COUNT(*) FROM {table} WHERE user_id = {user_id}')).scalar() == 0
+    assert [vault.name for vault in Vault.query] == ['Shared']
+    assert VaultEntry.query.one().created_by is None
+    assert db.session.get(User, other_id) is not None
+
+def test_synthetic_data(client):
+    """Test the synthetic loader's bulk data behaves like app-created data for random queries"""
+    import random
+    from models import Note
+    from utils.synthetic import load, SYNTHETIC_PASSWORD, WORDS
+    
+    counts = load(3, 40, 15, batch_size=7, seed=3)
+    assert counts['users'] == 3 and counts['notes'] == 120 and counts['password_entries'] == 45
+    user = User.query.filter(User.email.like('synthetic%')).order_by(User.id).first()
+    _login(client, user.email, SYNTHETIC_PASSWORD)
+    
+    html = client.get('/dashboard').get_data(as_text=True)
+    assert '>40<' in html and '>15<' in html
+    entry_ids = [entry.id for entry in PasswordEntry.query.filter_by(user_id=user.id)]
+    for entry_id in random.Random(0).sample(entry_ids, 5):
+        assert client.post(f'/passwords/{entry_id}/reveal').get_json()['status'] == 'success'
+    
+    # Searching compressed chunks agrees with a case-insensitive search of the loaded text
+    from notes import _notes_containing
+    query = Note.query.filter_by(user_id=user.id)
+    notes = query.all()
+    for word in random.Random(1).sample(WORDS, 10):
+        expected = {note.id for note in notes if word in note.content.lower()}
+        assert set(_notes_containing(query, word)) == expected
+    
+    # The same seed produces the same data; new rows never reuse ids
+    again = load(3, 40, 15, seed=3, email_prefix='again')
+    assert again['notes'] == 120
+    titles = lambda prefix: [n.title for n in Note.query.join(User).filter(User.email.like(f'{prefix}%')).order_by(Note.id)]
+    assert titles('synthetic') == titles('again')
+
+def test_request_profiler(client):
+    """Test sampled requests are profiled per endpoint and downloadable only with the token"""
+    import threading
+    from utils.profiler import get_profiler, parse_folded
+    from utils.metrics import metrics
+    
+    profiler = get_profiler()
+    user_id = _create_user()
+    _login(client)
+    app.config.update(PROFILE_TOKEN='profile-secret', PROFILE_SAMPLE_RATE=0)
+    try:
+        # Unsampled requests are not profiled; the header opts a request in
+        before = metrics.value('profiled_requests_total', endpoint='notes.list_notes')
+        client.get('/notes/')
+        client.get('/notes/', headers={'X-Profile': 'wrong'})
+        assert metrics.value('profiled_requests_total', endpoint='notes.list_notes') == before
+        client.get('/notes/', headers={'X-Profile': 'profile-secret'})
+        assert metrics.value('profiled_requests_total', endpoint='notes.list_notes') == before + 1
+        
+        # Samples land under the endpoint as collapsed stacks
+        profiler.begin('notes.list_notes')
+        try:
+            assert profiler.sample() >= 1
+        finally:
+            profiler.end()
+        assert threading.get_ident() not in profiler._active
+        
+        assert client.get('/profiles/').status_code == 404
+        assert client.get('/profiles/notes.list_notes.folded', headers={'Authorization': 'Bearer wrong'}).status_code == 404
+        auth = {'Authorization': 'Bearer profile-secret'}
+        assert 'notes.list_notes' in client.get('/profiles/', headers=auth).get_data(as_text=True).split()
+        assert client.get('/profiles/nonexistent.folded', headers=auth).status_code == 404
+        response = client.get('/profiles/notes.list_notes.folded', headers=auth)
+        counts = parse_folded(response.get_data(as_text=True).splitlines())
+        assert sum(counts.values()) >= 1
+        assert any('test_request_profiler (test_app.py)' in stack.split(';') for stack in counts)
+    finally:
+        app.config.update(PROFILE_TOKEN=None, PROFILE_SAMPLE_RATE=0)
+
+def test_template_bytecode_cache(tmp_path, monkeypatch):
+    """Test precompiling fills the bytecode cache and cached templates render without compiling"""
+    from utils.templates import configure_template_cache, precompile_templates
+    
+    monkeypatch.setitem(app.config, 'TEMPLATE_BYTECODE_CACHE_DIR', str(tmp_path / 'jinja_cache'))
+    original = app.jinja_env.bytecode_cache
+    cache = configure_template_cache(app)
+    try:
+        # Overlays share the app's filters but get an empty in-memory template cache
+        env = app.jinja_env.overlay(cache_size=400, bytecode_cache=cache)
+        count, _ = precompile_templates(app, env)
+        assert count == len(env.list_templates(filter_func=lambda n: n.endswith('.html'))) > 0
+        assert len(list((tmp_path / 'jinja_cache').glob('securedesk_*.cache'))) == count
+        
+        # A new worker's environment loads the bytecode instead of compiling the source
+        env = app.jinja_env.overlay(cache_size=400, bytecode_cache=cache)
+        def compile(*args, **kwargs):
+            raise AssertionError('template compiled despite cached bytecode')
+        monkeypatch.setattr(env, 'compile', compile)
+        with app.test_request_context('/'):
+            context = {}
+            app.update_template_context(context)
+            html = env.get_template('errors/404.html').render(context)
+        assert 'Page Not Found' in html
+        
+        # The startup hook warms the app's own environment
+        from run import warm_templates
+        assert warm_templates()
+    finally:
+        app.jinja_env.bytecode_cache = original
+
+def test_password_search_returns_every_match(client):
+    """Test password search is not capped at the fuzzy search's default limit"""
+    import re
+    from utils.search import fuzzy_search
+    
+    user_id = _create_user()
+    _add_entries(user_id, *(f'Gmail {i:02d}' for i in range(60)), 'Chase Bank')
+    assert len(fuzzy_search(user_id, 'gmail')) == 50
+    assert len(fuzzy_search(user_id, 'gmail', limit=None)) == 60
+    
+    _login(client)
+    found = set()
+    for page in range(1, 8):
+        html = client.get(f'/passwords/?q=gmail&page={page}').get_data(as_text=True)
+        found.update(re.findall(r'Gmail \d\d', html))
+    assert 'Page 1 of 6' in client.get('/passwords/?q=gmail').get_data(as_text=True)
+    assert found == {f'Gmail {i:02d}' for i in range(60)}
+
+def test_revision_deltas_stay_fast_for_large_notes(client, monkeypatch):
+    """Test saving an edit to a large note of repeated lines stays fast and its revision round-trips"""
+    import time
+    import random
+    from models import Note
+    from utils import deltas
+    
+    user_id = _create_user()
+    content = 'the same line of a long log\n' * 40000  # ~1.1 MB
+    note = Note(title='Repetitive', content=content, user_id=user_id)
+    db.session.add(note)
+    db.session.commit()
+    
+    # Edits far apart leave a large changed middle, which used to take over a minute to diff
+    lines = content.splitlines(keepends=True)
+    lines[100] = 'an edited line\n'
+    lines.insert(39000, 'an inserted line\n')
+    edited = ''.join(lines)
+    start = time.perf_counter()
+    note.update_content(title='Repetitive', content=edited)
+    db.session.commit()
+    assert time.perf_counter() - start < 5
+    assert note.revision_content(1) == content and note.content == edited
+    
+    # Greedy deltas rebuild the same text as exact ones
+    monkeypatch.setattr(deltas, 'EXACT_DIFF_LIMIT', 0)
+    rng = random.Random(5)
+    vocabulary = ['alpha\n', 'beta\n', 'gamma\n', 'delta\n', 'alpha beta\n', 'no newline']
+    for _ in range(200):
+        base = ''.join(rng.choices(vocabulary, k=rng.randint(0, 30)))
+        target = ''.join(rng.choices(vocabulary, k=rng.randint(0, 30)))
+        assert deltas.apply_delta(base, deltas.make_delta(base, target)) == target
+
+# Schema of the tables the first release created, before any migration
+LEGACY_SCHEMA = (
+    '''CREATE TABLE users (
+        id INTEGER NOT NULL, email VARCHAR(120) NOT NULL, password_hash VARCHAR(128) NOT NULL,
+        created_at DATETIME NOT NULL, last_login DATETIME, PRIMARY KEY (id))''',
+    '''CREATE TABLE notes (
+        id INTEGER NOT NULL, title VARCHAR(200) NOT NULL, content TEXT, created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id))''',
+    '''CREATE TABLE password_entries (
+        id INTEGER NOT NULL, service_name VARCHAR(100) NOT NULL, username VARCHAR(100) NOT NULL,
+        encrypted_password TEXT NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL,
+        user_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))''',
+)
+
+def test_database_migration(tmp_path):
+    """Test a database from the first release is upgraded in place, once"""
+    from datetime import datetime
+    from sqlalchemy import create_engine, inspect, text
+    from models import NoteChunk
+    from utils.compression import ZLIB
+    from utils import simhash
+    from utils.migrations import migrate_engine
+    
+    size = NoteChunk.CHUNK_SIZE
+    legacy_notes = ['short note', None, ''.join(f'line {i} of a long note\n' for i in range(10000))]
+    engine = create_engine(f'sqlite:///{tmp_path}/legacy.db')
+    try:
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text(
+                "INSERT INTO users VALUES (1, 'old@example.com', 'hash', '2024-01-01 00:00:00', '2024-02-01 00:00:00')"
+            ))
+            for note_id, content in enumerate(legacy_notes, 1):
+                connection.execute(text(
+                    "INSERT INTO notes VALUES (:id, :title, :content, '2024-01-01 00:00:00', '2024-01-02 00:00:00', 1)"
+                ), {'id': note_id, 'title': f'Old {note_id}', 'content': content})
+        db.metadata.create_all(engine)
+        
+        added = migrate_engine(engine)
+        assert {('users', 'search_version'), ('users', 'last_seen'), ('users', 'deleted_at'), ('notes', 'size'),
+                ('notes', 'folder_id'), ('password_entries', 'folder_id'), ('notes', 'simhash'),
+                ('notes', 'deleted_at'), ('password_entries', 'deleted_at')} <= set(added)
+        assert migrate_engine(engine) == []
+        
+        # Existing rows got the defaults
+        with engine.connect() as connection:
+            row = connection.execute(text('SELECT search_version, last_seen FROM users')).one()
+            assert row == (0, '2024-02-01 00:00:00')  # last seen at their last login
+            # Legacy content moved into compressed chunks, with the derived columns filled
+            notes = connection.execute(
+                db.select(Note.snippet, Note.size, Note.revision_count, Note.updated_at).order_by(Note.id)
+            ).all()
+            assert [(note.snippet, note.size, note.revision_count) for note in notes] == [
+                ((content or '')[:120], len(content or ''), 0) for content in legacy_notes
+            ]
+            assert {note.updated_at for note in notes} == {datetime(2024, 1, 2)}
+            for note_id, content in enumerate(legacy_notes, 1):
+                chunks = connection.execute(
+                    db.select(NoteChunk.data).where(NoteChunk.note_id == note_id).order_by(NoteChunk.seq)
+                ).scalars().all()
+                assert ''.join(chunks) == (content or '')
+            assert len(chunks) == -(-len(legacy_notes[2]) // size)
+            assert connection.execute(text('SELECT substr(data, 1, 1) FROM note_chunks WHERE note_id = 3')).scalar() == bytes([ZLIB])
+            assert connection.execute(text('SELECT COUNT(*) FROM notes WHERE content IS NOT NULL')).scalar() == 0
+            # Existing notes are fingerprinted for duplicate detection as if just saved
+            fingerprints = connection.execute(db.select(Note.simhash, Note.simhash_b0).order_by(Note.id)).all()
+            value = simhash.fingerprint(f'Old 1\n{legacy_notes[0]}')
+            assert fingerprints[0] == (simhash.to_signed(value), simhash.bands(value)[0])
+            assert all(fingerprint.simhash is not None for fingerprint in fingerprints)
+            # Every mapped column now exists
+            for table in db.metadata.sorted_tables:
+                connection.execute(db.select(table)).all()
+            # Nothing starts out in the trash, and the trash purge scan is indexed
+            assert connection.execute(text('SELECT COUNT(*) FROM users WHERE deleted_at IS NULL')).scalar() == 1
+        assert {'ix_notes_deleted_at', 'ix_password_entries_deleted_at', 'ix_notes_folder_id',
+                'ix_password_entries_folder_id'} <= {
+            index['name'] for table in ('notes', 'password_entries') for index in inspect(engine).get_indexes(table)
+        }
+        indexes = {index['name'] for table in db.metadata.tables for index in inspect(engine).get_indexes(table)}
+        assert {index.name for table in db.metadata.sorted_tables for index in table.indexes} <= indexes
+        assert 'folders' in {key['referred_table'] for key in inspect(engine).get_foreign_keys('notes')}
+    finally:
+        engine.dispose()
+
+def test_json_api_large_notes(client):
+    """Test listing note content streams each note instead of loading the whole page"""
+    import json
+    import random
+    import string
+    import tracemalloc
+    
+    user_id = _create_user()
+    rng = random.Random(7)
+    # About 2 MB each, in many chunks, and not compressible
+    bodies = [''.join(rng.choices(string.ascii_letters + 'é ', k=2_000_000)) for _ in range(4)]
+    for i, body in enumerate(bodies):
+        db.session.add(Note(title=f'Large {i}', content=body, user_id=user_id))
+    db.session.commit()
+    _login(client)
+    
+    tracemalloc.start()
+    try:
+        response = client.get('/api/v1/notes?fields=id,content', buffered=False)
+        length = sum(len(piece) for piece in response.iter_encoded())
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert length > 8_000_000
+    # Far less than one note, let alone the page
+    assert peak < 2_000_000
+    
+    page = json.loads(client.get('/api/v1/notes?fields=title,content').data)
+    assert [note['content'] for note in page['data']] == bodies[::-1]
+    assert list(page['data'][0]) == ['title', 'content']
+
+def test_sharded_shared_vaults(client, tmp_path):
+    """Test a user whose entries are on a shard still sees the shared vault entries, in order and paged"""
+    import re
+    from datetime import datetime, timedelta
+    from models import Vault, VaultEntry
+    from utils.sharding import use_user_shard
+    from utils.vaults import entries_share_database
+    
+    with _sharded(tmp_path):
+        owner_id = _create_user('owner@example.com')
+        member_id = _create_user('member@example.com')
+        assert not entries_share_database(member_id)
+        _login(client, 'owner@example.com')
+        client.post('/vaults/', data={'name': 'Family'})
+        vault = Vault.query.one()
+        client.post(f'/vaults/{vault.id}/members', data={'email': 'member@example.com'})
+        for i in range(6):
+            client.post(f'/vaults/{vault.id}/entries', data={'service_name': f'Shared {i}', 'username': 'family', 'password': 'Sh4red!pass'})
+        client.get('/auth/logout')
+        
+        with use_user_shard(member_id):
+            _add_entries(member_id, *[f'Own {i}' for i in range(6)])
+        # Interleave creation times: Own 0, Shared 0, Own 1, Shared 1, ... (newest last)
+        start = datetime(2024, 1, 1)
+        for i, entry in enumerate(VaultEntry.query.order_by(VaultEntry.id)):
+            entry.created_at = start + timedelta(minutes=2 * i + 1)
+        db.session.commit()
+        with use_user_shard(member_id):
+            for i, entry in enumerate(PasswordEntry.query.filter_by(user_id=member_id).order_by(PasswordEntry.id)):
+                entry.created_at = start + timedelta(minutes=2 * i)
+            db.session.commit()
+        
+        _login(client, 'member@example.com')
+        names = []
+        for page in (1, 2):
+            html = client.get(f'/passwords/?page={page}').data.decode()
+            names += re.findall(r'<h3>((?:Own|Shared) \d)', html)
+        assert names == [f'{kind} {i}' for i in range(5, -1, -1) for kind in ('Shared', 'Own')]
+        assert 'Page 1 of 2' in client.get('/passwords/').data.decode()
+        
+        response = client.get('/passwords/?q=shared')
+        assert b'Shared 3' in response.data and b'Own 3' not in response.data
+
 if __name__ == '__main__':
     # Run basic tests
     print("Running SecureWebApp tests...")
@@ -0,0 +1,65 @@
+"""
+Trash routes and logic
+"""
+
+from datetime import timedelta
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort, current_app
+from flask_login import login_required, current_user
+from models import db, Note, PasswordEntry
+from utils.forms import DeleteConfirmationForm
+from utils.trash import TRASHABLE, trashed, trashed_item, restore, purge_trash
+from utils.auditlog import audit
+
+# Create trash blueprint
+trash_bp = Blueprint('trash', __name__, url_prefix='/trash')
+
+@trash_bp.route('/')
+@login_required
+def view_trash():
+    """Trashed notes and password entries, most recently deleted first"""
+    page = request.args.get('page', 1, type=int)
+    notes = trashed(Note, current_user.id).paginate(page=page, per_page=25, error_out=False, max_per_page=100)
+    passwords = trashed(PasswordEntry, current_user.id).paginate(page=page, per_page=25, error_out=False, max_per_page=100)
+    
+    return render_template('trash.html',
+                         notes=notes,
+                         passwords=passwords,
+                         pages=max(notes.pages, passwords.pages),
+                         retention_days=current_app.config.get('TRASH_RETENTION_DAYS', 30),
+                         form=DeleteConfirmationForm(formdata=None))
+
+@trash_bp.route('/<kind>/<int:item_id>/restore', methods=['POST'])
+@login_required
+def restore_item(kind, item_id):
+    """Take a note or password entry out of the trash"""
+    model = TRASHABLE.get(kind)
+    item = trashed_item(model, item_id, current_user.id) if model is not None else None
+    if item is None:
+        abort(404)
+    form = DeleteConfirmationForm()
+    
+    if form.validate_on_submit():
+        restore(item)
+        db.session.commit()
+        if model is Note:
+            audit('note_restored', item.title)
+            flash('Note restored.', 'success')
+            return redirect(url_for('notes.view_note', note_id=item.id))
+        audit('password_restored', item.service_name)
+        flash('Password entry restored.', 'success')
+        return redirect(url_for('passwords.view_password', password_id=item.id))
+    
+    return redirect(url_for('trash.view_trash'))
+
+@trash_bp.route('/empty', methods=['POST'])
+@login_required
+def empty_trash():
+    """Delete everything in the trash now instead of after the retention period"""
+    form = DeleteConfirmationForm()
+    
+    if form.validate_on_submit():
+        purged = purge_trash(user_id=current_user.id, older_than=timedelta(0))
+        audit('trash_emptied', f'{purged} item{"s" if purged != 1 else ""}')
+        flash('Trash emptied.', 'info')
+    
+    return redirect(url_for('trash.view_trash'))
@@ -0,0 +1,200 @@
+"""
+Audit log of sensitive actions, written in batches off the request path
+
+``audit(action, target)`` only appends the event to an in-memory queue. The
+``audit-flusher`` worker drains it every ``AUDIT_FLUSH_INTERVAL`` seconds, or
+as soon as ``AUDIT_BATCH_SIZE`` events are waiting, inserting up to
+``AUDIT_BATCH_SIZE`` events per transaction on a connection of its own (never
+the request's session).
+
+Backpressure: once ``AUDIT_QUEUE_SIZE`` events are waiting, the request that
+adds the next one writes a batch itself, so a stalled flusher slows requests
+down instead of losing events. Only when the database refuses writes and the
+queue reaches twice that size are new events dropped (and counted).
+
+Shutdown: the worker flushes once more at exit; events that still cannot be
+written are saved to ``AUDIT_SPILL_PATH`` and queued again by the next start.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from flask import current_app, has_request_context, request
+from flask_login import current_user
+from models import db, AuditEvent
+from utils.background import register_worker
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# How each action is described in the activity view
+ACTION_LABELS = {
+    'login': 'Signed in',
+    'login_failed': 'Failed sign-in attempt',
+    'logout': 'Signed out',
+    'logout_all': 'Signed out of all devices',
+    'password_revealed': 'Revealed a password',
+    'password_deleted': 'Deleted a password entry',
+    'note_deleted': 'Deleted a note',
+    'password_restored': 'Restored a password entry from the trash',
+    'note_restored': 'Restored a note from the trash',
+    'trash_emptied': 'Emptied the trash',
+    'attachment_deleted': 'Removed an attachment',
+    'token_created': 'Created an API token',
+    'token_revoked': 'Revoked an API token',
+    'vault_member_added': 'Added a member to a shared vault',
+    'vault_member_removed': 'Removed a member from a shared vault',
+    'vault_entry_deleted': 'Deleted a shared password entry',
+    'vault_deleted': 'Deleted a shared vault',
+    'rotation_due': 'Password due for rotation',
+}
+
+class AuditLog:
+    """Bounded queue of audit events flushed in batched inserts"""
+
+    def __init__(self, batch_size: int = 500, max_size: int = 10000, spill_path: str = None):
+        self.batch_size = batch_size
+        self.max_size = max_size
+        self.spill_path = spill_path
+        self.worker = None
+        self._events = deque()
+        self._lock = threading.Lock()
+        # One flush at a time keeps batches in order
+        self._flush_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._events)
+
+    def record(self, event: dict):
+        """Queue one event (a row of ``audit_events``)"""
+        with self._lock:
+            if len(self._events) >= 2 * self.max_size:
+                metrics.inc('audit_events_dropped_total')
+                return
+            self._events.append(event)
+            pending = len(self._events)
+        metrics.inc('audit_events_total')
+
+        if pending >= self.max_size:
+            try:
+                self.flush(limit=self.batch_size)
+            except Exception:
+                logger.exception("Audit log backpressure flush failed")
+        elif pending >= self.batch_size and self.worker is not None:
+            self.worker.wake()
+
+    def _take(self, count: int) -> list:
+        with self._lock:
+            return [self._events.popleft() for _ in range(min(count, len(self._events)))]
+
+    def _requeue(self, events: list):
+        with self._lock:
+            self._events.extendleft(reversed(events))
+
+    def _write(self, events: list):
+        with db.engine.begin() as connection:
+            connection.execute(AuditEvent.__table__.insert(), events)
+
+    def flush(self, limit: int = None, spill: bool = False) -> int:
+        """
+        Write queued events, one transaction per batch
+
+        Args:
+            limit: Stop after about this many events (default: all)
+            spill: Save events to the spill file if the database refuses them
+
+        Returns:
+            Number of events written
+        """
+        written = 0
+        with self._flush_lock:
+            while limit is None or written < limit:
+                batch = self._take(self.batch_size)
+                if not batch:
+                    break
+                try:
+                    self._write(batch)
+                except Exception:
+                    self._requeue(batch)
+                    if spill and self.spill_path:
+                        logger.exception("Audit log flush failed; saving events to %s", self.spill_path)
+                        self._spill()
+                        break
+                    raise
+                written += len(batch)
+                metrics.inc('audit_flushes_total')
+        metrics.set('audit_queue_depth', self.pending)
+        return written
+
+    def _spill(self):
+        events = self._take(len(self._events))
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps({**event, 'created_at': event['created_at'].isoformat()}) + '\n')
+
+    def restore_spill(self) -> int:
+        """Queue events saved by an earlier shutdown; returns how many"""
+        if not self.spill_path:
+            return 0
+        # Claim the file first so concurrently starting workers restore it once
+        claimed = f'{self.spill_path}.{os.getpid()}'
+        try:
+            os.rename(self.spill_path, claimed)
+        except FileNotFoundError:
+            return 0
+        with open(claimed, encoding='utf-8') as f:
+            events = [json.loads(line) for line in f if line.strip()]
+        for event in events:
+            event['created_at'] = datetime.fromisoformat(event['created_at'])
+        self._requeue(events)
+        os.remove(claimed)
+        return len(events)
+
+def get_audit_log() -> AuditLog:
+    """Audit log of the current app"""
+    return current_app.extensions['audit_log']
+
+def audit(action: str, target: str = None, user_id: int = None):
+    """
+    Record a sensitive action of the current user (or of ``user_id``)
+
+    Args:
+        action: Key of ACTION_LABELS
+        target: What was acted on, e.g. a service name (truncated to 200 characters)
+        user_id: Acting user when not the logged-in one
+    """
+    if user_id is None:
+        user_id = current_user.id
+    get_audit_log().record({
+        'user_id': user_id,
+        'action': action,
+        'target': target[:200] if target else None,
+        'ip_address': request.remote_addr if has_request_context() else None,
+        'created_at': datetime.utcnow(),
+    })
+
+def init_audit_log(app):
+    """Create the app's audit log, its flusher and restore spilled events"""
+    spill_path = app.config.get('AUDIT_SPILL_PATH')
+    if spill_path and not os.path.isabs(spill_path):
+        os.makedirs(app.instance_path, exist_ok=True)
+        spill_path = os.path.join(app.instance_path, spill_path)
+    log = AuditLog(
+        batch_size=app.config.get('AUDIT_BATCH_SIZE', 500),
+        max_size=app.config.get('AUDIT_QUEUE_SIZE', 10000),
+        spill_path=spill_path,
+    )
+    app.extensions['audit_log'] = log
+
+    def flush():
+        log.flush(spill=log.worker.stopping)
+    log.worker = register_worker(app, 'audit-flusher', app.config.get('AUDIT_FLUSH_INTERVAL', 2),
+                                 flush, run_on_exit=True)
+    restored = log.restore_spill()
+    if restored:
+        logger.info("Queued %d audit events saved at the last shutdown", restored)
+    return log
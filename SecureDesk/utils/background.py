@@ -0,0 +1,119 @@
+"""
+Periodic background workers (session sweeps, flushes, purges)
+
+Workers are registered at import time and started lazily on the first request
+each process handles, so forked server workers each get their own threads and
+test runs never start any.
+"""
+
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class PeriodicWorker:
+    """Daemon thread that runs a task at a fixed interval inside an app context"""
+
+    def __init__(self, name: str, interval: float, task, run_on_exit: bool = False):
+        """
+        Args:
+            name: Thread name, also used in log messages
+            interval: Seconds between runs
+            task: Callable taking no arguments
+            run_on_exit: Run the task once more when the process shuts down
+        """
+        self.name = name
+        self.interval = interval
+        self.task = task
+        self.run_on_exit = run_on_exit
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def stopping(self) -> bool:
+        """Whether the worker has been asked to stop (true during the final run)"""
+        return self._stop.is_set()
+
+    def wake(self):
+        """Run the task as soon as possible instead of waiting out the interval"""
+        self._wake.set()
+
+    def start(self, app):
+        """Start the worker thread for an app (no-op if already running)"""
+        if self.running:
+            return
+        self._app = app
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Stop the worker thread, running the task a final time if configured"""
+        self._stop.set()
+        self._wake.set()
+        if self.running:
+            self._thread.join(timeout)
+        if self.run_on_exit and self._app is not None:
+            self.run_once(self._app)
+
+    def run_once(self, app):
+        """Run the task a single time in the calling thread"""
+        with app.app_context():
+            try:
+                self.task()
+            except Exception:
+                logger.exception("Background worker %s failed", self.name)
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once(self._app)
+
+def register_worker(app, name: str, interval: float, task, run_on_exit: bool = False) -> PeriodicWorker:
+    """
+    Register a periodic task to be started with the app's background workers
+
+    Returns:
+        The PeriodicWorker (useful for running it directly in tests)
+    """
+    worker = PeriodicWorker(name, interval, task, run_on_exit=run_on_exit)
+    app.extensions.setdefault('background_workers', {})[name] = worker
+    return worker
+
+def start_background_workers(app):
+    """Start every registered worker unless disabled by configuration"""
+    if not app.config.get('BACKGROUND_WORKERS_ENABLED', True):
+        return
+    for worker in app.extensions.get('background_workers', {}).values():
+        worker.start(app)
+
+def stop_background_workers(app):
+    """Stop all workers, giving flush-on-exit tasks a final run"""
+    for worker in app.extensions.get('background_workers', {}).values():
+        worker.stop()
+
+def init_background(app):
+    """Start workers on the first request and stop them at interpreter exit"""
+    started = []
+    lock = threading.Lock()
+
+    @app.before_request
+    def _start_workers():
+        if started:
+            return
+        with lock:
+            if not started:
+                start_background_workers(app)
+                started.append(True)
+
+    atexit.register(stop_background_workers, app)
@@ -0,0 +1,156 @@
+"""
+Compressed bitmaps of row ids (roaring-style)
+
+An id is split into a high key (up to 48 bits), which selects a container,
+and a 16-bit low value stored in it. In memory each container is a Python int
+used as a 65536-bit set, so intersections and unions run a machine word at a
+time. When serialized, each container is written as a sorted uint16 array
+while it holds fewer than 4096 values and as a raw 8 KiB bitset otherwise,
+which keeps both sparse and dense sets compact. Bitmaps whose ids all fit in
+32 bits are written with 16-bit container keys (``RB1``); larger ids, such as
+the ones shards hand out (see utils/sharding.py), switch the whole bitmap to
+64-bit keys (``RB2``). Both formats are read.
+"""
+
+import sys
+import struct
+from array import array
+
+ARRAY_LIMIT = 4096
+BITSET_BYTES = 8192
+MAGIC = b'RB1'
+WIDE_MAGIC = b'RB2'
+
+_HEADER = struct.Struct('<3sI')
+_CONTAINER = struct.Struct('<HBH')  # key, kind, cardinality - 1
+_WIDE_CONTAINER = struct.Struct('<QBH')
+_ARRAY, _BITSET = 0, 1
+
+def _low_values(bits: int):
+    """Yield the set bit positions of a container in ascending order"""
+    if bits.bit_count() <= 64:
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+        return
+    words = array('Q', bits.to_bytes(BITSET_BYTES, 'little'))
+    if sys.byteorder == 'big':
+        words.byteswap()
+    for index, word in enumerate(words):
+        base = index * 64
+        while word:
+            lowest = word & -word
+            yield base + lowest.bit_length() - 1
+            word ^= lowest
+
+class Bitmap:
+    """Set of non-negative 64-bit integers with fast AND/OR"""
+
+    __slots__ = ('_containers',)
+
+    def __init__(self, values=()):
+        self._containers = {}
+        for value in values:
+            self.add(value)
+
+    def add(self, value: int):
+        key, low = value >> 16, value & 0xFFFF
+        self._containers[key] = self._containers.get(key, 0) | (1 << low)
+
+    def discard(self, value: int):
+        key, low = value >> 16, value & 0xFFFF
+        bits = self._containers.get(key)
+        if bits is None:
+            return
+        bits &= ~(1 << low)
+        if bits:
+            self._containers[key] = bits
+        else:
+            del self._containers[key]
+
+    def __contains__(self, value: int) -> bool:
+        return bool(self._containers.get(value >> 16, 0) >> (value & 0xFFFF) & 1)
+
+    def __len__(self) -> int:
+        return sum(bits.bit_count() for bits in self._containers.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def __iter__(self):
+        for key in sorted(self._containers):
+            base = key << 16
+            for low in _low_values(self._containers[key]):
+                yield base + low
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Bitmap) and self._containers == other._containers
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        small, large = sorted((self._containers, other._containers), key=len)
+        result = Bitmap()
+        for key, bits in small.items():
+            both = bits & large.get(key, 0)
+            if both:
+                result._containers[key] = both
+        return result
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        result = Bitmap()
+        result._containers = dict(self._containers)
+        for key, bits in other._containers.items():
+            result._containers[key] = result._containers.get(key, 0) | bits
+        return result
+
+    def __repr__(self):
+        return f'<Bitmap {len(self)} ids>'
+
+    def to_bytes(self) -> bytes:
+        """Serialize, choosing the smaller encoding for each container"""
+        wide = any(key > 0xFFFF for key in self._containers)
+        container = _WIDE_CONTAINER if wide else _CONTAINER
+        parts = [_HEADER.pack(WIDE_MAGIC if wide else MAGIC, len(self._containers))]
+        for key in sorted(self._containers):
+            bits = self._containers[key]
+            cardinality = bits.bit_count()
+            if cardinality < ARRAY_LIMIT:
+                values = array('H', _low_values(bits))
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                parts.append(container.pack(key, _ARRAY, cardinality - 1))
+                parts.append(values.tobytes())
+            else:
+                parts.append(container.pack(key, _BITSET, cardinality - 1))
+                parts.append(bits.to_bytes(BITSET_BYTES, 'little'))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Bitmap':
+        """Inverse of to_bytes (empty or missing data gives an empty bitmap)"""
+        bitmap = cls()
+        if not data:
+            return bitmap
+        magic, count = _HEADER.unpack_from(data)
+        if magic not in (MAGIC, WIDE_MAGIC):
+            raise ValueError("Not a serialized bitmap")
+        container = _WIDE_CONTAINER if magic == WIDE_MAGIC else _CONTAINER
+        offset = _HEADER.size
+        for _ in range(count):
+            key, kind, cardinality = container.unpack_from(data, offset)
+            offset += container.size
+            if kind == _ARRAY:
+                values = array('H')
+                values.frombytes(data[offset:offset + (cardinality + 1) * 2])
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                offset += (cardinality + 1) * 2
+                buffer = bytearray(BITSET_BYTES)
+                for low in values:
+                    buffer[low >> 3] |= 1 << (low & 7)
+                bits = int.from_bytes(buffer, 'little')
+            else:
+                bits = int.from_bytes(data[offset:offset + BITSET_BYTES], 'little')
+                offset += BITSET_BYTES
+            bitmap._containers[key] = bits
+        return bitmap
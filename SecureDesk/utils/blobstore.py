@@ -0,0 +1,223 @@
+"""
+Encrypted, content-addressed blob store for note attachments
+
+Uploads are streamed through AES-GCM one chunk at a time while their SHA-256
+is computed, so memory use does not depend on file size. A blob is named by
+an HMAC of that digest (plain hashes of user files never reach the disk or
+the database), and identical content is stored once however many
+attachments point at it.
+
+File layout: a header (magic, nonce prefix, chunk size) followed by fixed
+size encrypted chunks, so any byte range can be served by decrypting only
+the chunks it overlaps. Each chunk's nonce and associated data include its
+index and a final-chunk flag, preventing reordering and truncation.
+"""
+
+import os
+import hmac
+import struct
+import secrets
+import hashlib
+import tempfile
+from datetime import datetime, timedelta
+from functools import lru_cache
+from flask import current_app
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy.exc import IntegrityError
+from models import db, Blob, Attachment
+from utils.background import register_worker
+
+MAGIC = b'SDB1'
+HEADER = struct.Struct('>4s8sI')
+CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+
+class BlobTooLarge(ValueError):
+    """Raised when an upload exceeds the configured maximum size"""
+
+@lru_cache(maxsize=None)
+def _master_keys(master_key: str) -> tuple:
+    """Derive the blob naming and key wrapping keys from the master key"""
+    def derive(info):
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(master_key.encode())
+    return derive(b'securedesk blob names'), derive(b'securedesk blob keys')
+
+def _keys() -> tuple:
+    return _master_keys(os.environ.get('MASTER_KEY', 'default-master-key-change-in-production'))
+
+def _wrap_key(key: bytes) -> bytes:
+    nonce = os.urandom(12)
+    return nonce + AESGCM(_keys()[1]).encrypt(nonce, key, b'blob key')
+
+def _unwrap_key(wrapped: bytes) -> bytes:
+    return AESGCM(_keys()[1]).decrypt(wrapped[:12], wrapped[12:], b'blob key')
+
+def _chunk_aad(index: int, last: bool) -> bytes:
+    return struct.pack('>I?', index, last)
+
+def _read_chunk(stream, size: int = CHUNK_SIZE) -> bytes:
+    """Read up to size bytes, looping over short reads"""
+    parts = []
+    remaining = size
+    while remaining:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+class BlobStore:
+    """Blob files under a root directory, tracked by ``Blob`` rows"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+
+    def path(self, blob: Blob) -> str:
+        return os.path.join(self.root, blob.filename)
+
+    def ingest(self, stream, max_size: int = None) -> Blob:
+        """
+        Encrypt a stream into the store, reusing an identical existing blob
+
+        Args:
+            stream: File-like object to read plaintext from
+            max_size: Reject streams longer than this many bytes
+
+        Returns:
+            The committed Blob row for the content
+
+        Raises:
+            BlobTooLarge: If the stream exceeds max_size
+        """
+        key = AESGCM.generate_key(bit_length=256)
+        aes = AESGCM(key)
+        prefix = os.urandom(8)
+        hasher = hashlib.sha256()
+        size = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(HEADER.pack(MAGIC, prefix, CHUNK_SIZE))
+                index = 0
+                chunk = _read_chunk(stream)
+                while True:
+                    # Read ahead one chunk to know whether this one is the last
+                    following = _read_chunk(stream) if len(chunk) == CHUNK_SIZE else b''
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise BlobTooLarge(f"File exceeds the {max_size} byte limit")
+                    hasher.update(chunk)
+                    last = not following
+                    nonce = prefix + struct.pack('>I', index)
+                    out.write(aes.encrypt(nonce, chunk, _chunk_aad(index, last)))
+                    if last:
+                        break
+                    chunk = following
+                    index += 1
+
+            blob_id = hmac.new(_keys()[0], hasher.digest(), hashlib.sha256).hexdigest()
+            blob = db.session.get(Blob, blob_id)
+            if blob is None:
+                # A fresh file name per row, so a concurrent purge of an older
+                # copy of the same content can never unlink this one
+                blob = Blob(id=blob_id, size=size, wrapped_key=_wrap_key(key),
+                            filename=f'{blob_id[:2]}/{blob_id}-{secrets.token_hex(4)}')
+                os.makedirs(os.path.dirname(self.path(blob)), exist_ok=True)
+                os.replace(tmp_path, self.path(blob))
+                db.session.add(blob)
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    # Same content uploaded concurrently; keep the other copy
+                    db.session.rollback()
+                    os.unlink(self.path(blob))
+                    blob = db.session.get(Blob, blob_id)
+            if blob.last_used_at is None or blob.last_used_at < datetime.utcnow() - timedelta(minutes=1):
+                blob.last_used_at = datetime.utcnow()
+                db.session.commit()
+            return blob
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def iter_range(self, blob: Blob, start: int = 0, stop: int = None):
+        """
+        Yield decrypted plaintext between two byte offsets
+
+        Only the chunks overlapping ``start:stop`` are read and decrypted.
+        """
+        stop = blob.size if stop is None else min(stop, blob.size)
+        if start >= stop:
+            return
+
+        aes = AESGCM(_unwrap_key(blob.wrapped_key))
+        with open(self.path(blob), 'rb') as f:
+            magic, prefix, chunk_size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"Blob {blob.id} has an unknown format")
+            last_index = max(blob.size - 1, 0) // chunk_size
+            first = start // chunk_size
+            f.seek(HEADER.size + first * (chunk_size + TAG_SIZE))
+
+            for index in range(first, (stop - 1) // chunk_size + 1):
+                data = f.read(chunk_size + TAG_SIZE)
+                nonce = prefix + struct.pack('>I', index)
+                plain = aes.decrypt(nonce, data, _chunk_aad(index, index == last_index))
+                offset = index * chunk_size
+                yield plain[max(start - offset, 0):stop - offset]
+
+    def purge_orphans(self, grace: timedelta = timedelta(hours=1)) -> int:
+        """
+        Delete blobs no attachment references any more
+
+        Blobs used within the grace period are kept so an upload that has
+        stored its blob but not yet its attachment is never purged.
+
+        Returns:
+            Number of blobs deleted
+        """
+        cutoff = datetime.utcnow() - grace
+        orphaned = db.and_(
+            ~db.exists().where(Attachment.blob_id == Blob.id),
+            db.or_(Blob.last_used_at.is_(None), Blob.last_used_at < cutoff),
+            Blob.created_at < cutoff
+        )
+        candidates = db.session.execute(db.select(Blob.id, Blob.filename).where(orphaned)).all()
+
+        purged = 0
+        for blob_id, filename in candidates:
+            # Re-check in the DELETE itself in case an upload reused the blob meanwhile
+            deleted = db.session.execute(db.delete(Blob).where(Blob.id == blob_id, orphaned)).rowcount
+            db.session.commit()
+            if deleted:
+                try:
+                    os.unlink(os.path.join(self.root, filename))
+                except FileNotFoundError:
+                    pass
+                purged += 1
+        return purged
+
+def get_blob_store() -> BlobStore:
+    """Blob store of the current app"""
+    return current_app.extensions['blob_store']
+
+def init_blob_store(app):
+    """Create the app's blob store and its orphan purge worker"""
+    root = app.config.get('ATTACHMENT_STORAGE_DIR')
+    if root is None:
+        # Throwaway store (tests)
+        root = tempfile.mkdtemp(prefix='securedesk-blobs-')
+    elif not os.path.isabs(root):
+        root = os.path.join(app.instance_path, root)
+    store = BlobStore(root)
+    app.extensions['blob_store'] = store
+
+    def purge():
+        store.purge_orphans()
+    register_worker(app, 'blob-purger', app.config.get('BLOB_PURGE_INTERVAL', 3600), purge)
+    return store
@@ -0,0 +1,91 @@
+"""
+Transparent compression of large text columns
+
+Values are stored as a one-byte codec tag followed by the payload, so rows
+written with different codecs (or before compression was enabled) can be read
+side by side. Short values, and values that do not shrink, are stored raw.
+"""
+
+import zlib
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.types import TypeDecorator, LargeBinary
+
+try:
+    import zstandard
+except ImportError:  # optional: falls back to zlib
+    zstandard = None
+
+# Codec tags (first byte of every stored value)
+RAW = 0
+ZLIB = 1
+ZSTD = 2
+
+_settings = {'codec': 'zlib', 'min_size': 256}
+
+def configure_compression(app):
+    """Choose the codec for newly written values from the app configuration"""
+    codec = app.config.get('NOTE_COMPRESSION', 'zlib')
+    if codec == 'zstd' and zstandard is None:
+        app.logger.warning("NOTE_COMPRESSION=zstd but zstandard is not installed; using zlib")
+        codec = 'zlib'
+    _settings['codec'] = codec
+    _settings['min_size'] = app.config.get('NOTE_COMPRESSION_MIN_SIZE', 256)
+
+def compress(text: str) -> bytes:
+    """Encode text with the configured codec, keeping it raw when that is smaller"""
+    raw = text.encode('utf-8')
+    codec = _settings['codec']
+    if codec != 'none' and len(raw) >= _settings['min_size']:
+        if codec == 'zstd':
+            packed = bytes([ZSTD]) + zstandard.ZstdCompressor(level=6).compress(raw)
+        else:
+            packed = bytes([ZLIB]) + zlib.compress(raw, 6)
+        if len(packed) < len(raw) + 1:
+            return packed
+    return bytes([RAW]) + raw
+
+def decompress(value) -> str:
+    """Decode a value written by compress()"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # Stored as plain text before the column was compressed
+        return value
+
+    tag, payload = value[0], bytes(value[1:])
+    if tag == ZLIB:
+        payload = zlib.decompress(payload)
+    elif tag == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed values")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    elif tag != RAW:
+        raise ValueError(f"Unknown compression codec tag: {tag}")
+    return payload.decode('utf-8')
+
+class CompressedText(TypeDecorator):
+    """
+    Text column compressed transparently on write
+
+    Comparisons in SQL see the encoded bytes, so search by decompressing in
+    Python; on SQLite the ``note_text()`` SQL function also returns the
+    plaintext, for ad-hoc queries.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress(value)
+
+@event.listens_for(Engine, 'connect')
+def _register_sql_functions(dbapi_connection, connection_record):
+    # Lets ad-hoc SQLite queries read compressed columns as plaintext; the app itself does not rely on it
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('note_text', 1, decompress, deterministic=True)
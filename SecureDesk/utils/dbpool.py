@@ -0,0 +1,80 @@
+"""
+Database connection pool settings and pool health metrics
+
+``configure_pool`` turns the ``DB_POOL_*`` settings into engine options for
+every bind (before ``db.init_app``), using ``InstrumentedQueuePool`` so that
+each checkout records how long it waited for a free connection:
+
+- ``db_pool_checkout_wait_seconds``: summary (count, sum, max) per bind
+- ``db_pool_checkout_timeouts_total``: checkouts that gave up after ``DB_POOL_TIMEOUT``
+- ``db_pool_in_use`` / ``db_pool_idle`` / ``db_pool_size``: gauges sampled by
+  ``record_pool_gauges`` when metrics are scraped
+
+A growing wait maximum means requests queue for connections: raise
+``DB_POOL_SIZE``/``DB_MAX_OVERFLOW`` (within the server's connection limit) or
+lower the number of worker threads.
+"""
+
+import time
+from sqlalchemy import exc, make_url
+from sqlalchemy.pool import QueuePool
+from utils.metrics import metrics
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that reports checkout wait times and timeouts"""
+
+    # Bind key shown in metric labels (set by label_pools)
+    label = 'primary'
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.inc('db_pool_checkout_timeouts_total', bind=self.label)
+            raise
+        finally:
+            metrics.observe('db_pool_checkout_wait_seconds', time.perf_counter() - start, bind=self.label)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.label = self.label
+        return pool
+
+def _in_memory(uri: str) -> bool:
+    url = make_url(uri)
+    return url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:')
+
+def configure_pool(app):
+    """Derive pool engine options from config; explicit SQLALCHEMY_ENGINE_OPTIONS win"""
+    # In-memory SQLite shares one connection (StaticPool) and takes no pool options
+    if _in_memory(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': app.config.get('DB_POOL_SIZE', 5),
+        'max_overflow': app.config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': app.config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': app.config.get('DB_POOL_RECYCLE', -1),
+        'pool_pre_ping': app.config.get('DB_POOL_PRE_PING', False),
+        **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+    }
+
+def label_pools(app):
+    """Name each instrumented pool after its bind (call after ``db.init_app``)"""
+    with app.app_context():
+        for key, engine in app.extensions['sqlalchemy'].engines.items():
+            if isinstance(engine.pool, InstrumentedQueuePool):
+                engine.pool.label = key or 'primary'
+
+def record_pool_gauges(app):
+    """Sample connection counts of every queue pool into the metrics registry"""
+    with app.app_context():
+        engines = app.extensions['sqlalchemy'].engines
+    for key, engine in engines.items():
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            label = key or 'primary'
+            metrics.set('db_pool_in_use', pool.checkedout(), bind=label)
+            metrics.set('db_pool_idle', pool.checkedin(), bind=label)
+            metrics.set('db_pool_size', pool.size(), bind=label)
@@ -0,0 +1,113 @@
+"""
+Compact line-based deltas for storing text revisions
+
+A delta describes how to rebuild a target text from a base text as a list of
+operations: ``[start, end]`` copies lines ``start:end`` of the base, and a
+string inserts literal text. Deltas and snapshots are zlib-compressed.
+
+Lines shared at the start and end are copied without diffing. A small
+changed middle is diffed exactly with ``SequenceMatcher``, whose cost grows
+with the product of the line counts; a larger one is matched greedily
+through a hash table of the base lines, in linear time, so saving an edit to
+a multi-MB note stays fast even when its lines repeat. Greedy deltas may be
+larger than exact ones, never wrong.
+"""
+
+import json
+import zlib
+from difflib import SequenceMatcher
+
+# Largest (base lines x target lines) middle diffed exactly
+EXACT_DIFF_LIMIT = 250000
+
+def _lines(text: str) -> list:
+    return (text or '').splitlines(keepends=True)
+
+def _exact_ops(base_lines: list, target_lines: list, offset: int) -> list:
+    ops = []
+    matcher = SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([offset + i1, offset + i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(''.join(target_lines[j1:j2]))
+    return ops
+
+def _greedy_ops(base_lines: list, target_lines: list, offset: int) -> list:
+    # Each target line starts a copy at the first base line equal to it,
+    # extended while the following lines still match
+    first = {}
+    for i, line in enumerate(base_lines):
+        first.setdefault(line, i)
+
+    ops, inserted = [], []
+    j = 0
+    while j < len(target_lines):
+        i = first.get(target_lines[j])
+        if i is None:
+            inserted.append(target_lines[j])
+            j += 1
+            continue
+        if inserted:
+            ops.append(''.join(inserted))
+            inserted = []
+        start = i
+        while i < len(base_lines) and j < len(target_lines) and base_lines[i] == target_lines[j]:
+            i += 1
+            j += 1
+        ops.append([offset + start, offset + i])
+    if inserted:
+        ops.append(''.join(inserted))
+    return ops
+
+def make_delta(base: str, target: str) -> bytes:
+    """
+    Encode the changes turning ``base`` into ``target``
+
+    Args:
+        base: Text the delta will be applied to
+        target: Text the delta reproduces
+
+    Returns:
+        Compressed delta
+    """
+    base_lines = _lines(base)
+    target_lines = _lines(target)
+
+    shortest = min(len(base_lines), len(target_lines))
+    prefix = 0
+    while prefix < shortest and base_lines[prefix] == target_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and base_lines[-1 - suffix] == target_lines[-1 - suffix]:
+        suffix += 1
+    base_middle = base_lines[prefix:len(base_lines) - suffix]
+    target_middle = target_lines[prefix:len(target_lines) - suffix]
+
+    ops = [[0, prefix]] if prefix else []
+    if len(base_middle) * len(target_middle) <= EXACT_DIFF_LIMIT:
+        ops.extend(_exact_ops(base_middle, target_middle, prefix))
+    else:
+        ops.extend(_greedy_ops(base_middle, target_middle, prefix))
+    if suffix:
+        ops.append([len(base_lines) - suffix, len(base_lines)])
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode(), 9)
+
+def apply_delta(base: str, delta: bytes) -> str:
+    """Rebuild the target text from ``base`` and a delta made by make_delta"""
+    base_lines = _lines(base)
+    parts = []
+    for op in json.loads(zlib.decompress(delta)):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0]:op[1]])
+    return ''.join(parts)
+
+def compress_text(text: str) -> bytes:
+    """Compress a full text snapshot"""
+    return zlib.compress((text or '').encode(), 9)
+
+def decompress_text(data: bytes) -> str:
+    """Inverse of compress_text"""
+    return zlib.decompress(data).decode()
@@ -2,12 +2,17 @@
 Form validation classes using WTForms
 """
 
+from flask import current_app
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, TextAreaField, SubmitField, HiddenField
+from flask_wtf.file import FileField, FileRequired
+from wtforms import StringField, PasswordField, TextAreaField, SubmitField, HiddenField, SelectField, IntegerField, SelectMultipleField
+from wtforms.validators import NumberRange
 from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError
-from wtforms.widgets import TextArea
-from models import User
-import re
+from wtforms.widgets import TextArea, ListWidget, CheckboxInput
+from models import User, Note
+from utils.strength import estimate_strength
+from utils.tokens import SCOPES
+from utils.rotation import ROTATION_CHOICES
 
 class RegistrationForm(FlaskForm):
     """User registration form with validation"""
@@ -36,21 +41,17 @@ class RegistrationForm(FlaskForm):
             raise ValidationError('This email is already registered. Please use a different email.')
     
     def validate_password(self, password):
-        """Validate password strength requirements"""
+        """Reject passwords that are short or easy to guess"""
         pwd = password.data
         
-        # Check for minimum requirements: 8 chars, mixed case, numbers
         if len(pwd) < 8:
             raise ValidationError('Password must be at least 8 characters long.')
         
-        if not re.search(r'[a-z]', pwd):
-            raise ValidationError('Password must contain at least one lowercase letter.')
-        
-        if not re.search(r'[A-Z]', pwd):
-            raise ValidationError('Password must contain at least one uppercase letter.')
-        
-        if not re.search(r'\d', pwd):
-            raise ValidationError('Password must contain at least one number.')
+        # Estimated guesses, including patterns built from the email address
+        analysis = estimate_strength(pwd, user_inputs=(self.email.data,))
+        if analysis['score'] < current_app.config['MIN_PASSWORD_SCORE']:
+            reason = analysis['feedback'][0] if analysis['feedback'] else 'It is too short or simple'
+            raise ValidationError(f'Password is too easy to guess. {reason}.')
 
 class LoginForm(FlaskForm):
     """User login form with validation"""
@@ -73,7 +74,7 @@ class NoteForm(FlaskForm):
     ])
     
     content = TextAreaField('Content', validators=[
-        Length(max=5000, message='Content must be less than 5000 characters')
+        Length(max=Note.MAX_LENGTH, message='Content must be less than 5 MB')
     ], render_kw={'rows': 10, 'placeholder': 'Enter your note content here...'})
     
     submit = SubmitField('Save Note')
@@ -94,6 +95,8 @@ class PasswordEntryForm(FlaskForm):
         DataRequired(message='Password is required')
     ], render_kw={'placeholder': 'Enter the password for this service'})
     
+    rotation_days = SelectField('Rotation Reminder', coerce=int, default=0, choices=list(ROTATION_CHOICES))
+    
     submit = SubmitField('Save Password')
 
 class EditPasswordEntryForm(FlaskForm):
@@ -112,6 +115,8 @@ class EditPasswordEntryForm(FlaskForm):
         DataRequired(message='Password is required')
     ])
     
+    rotation_days = SelectField('Rotation Reminder', coerce=int, default=0, choices=list(ROTATION_CHOICES))
+    
     submit = SubmitField('Update Password')
 
 class DeleteConfirmationForm(FlaskForm):
@@ -119,6 +124,27 @@ class DeleteConfirmationForm(FlaskForm):
     item_id = HiddenField('Item ID', validators=[DataRequired()])
     submit = SubmitField('Confirm Delete')
 
+class AttachmentForm(FlaskForm):
+    """Form for attaching a file to a note"""
+    file = FileField('Attach File', validators=[FileRequired(message='Please choose a file')])
+    submit = SubmitField('Upload')
+
+class OrganizeForm(FlaskForm):
+    """Form for setting the tags and folder of a note or password entry"""
+    tags = StringField('Tags', validators=[
+        Length(max=500, message='Tags must be less than 500 characters')
+    ], render_kw={'placeholder': 'work, travel, finance'})
+    
+    folder = StringField('Folder', validators=[
+        Length(max=50, message='Folder name must be less than 50 characters')
+    ], render_kw={'placeholder': 'No folder'})
+    
+    submit = SubmitField('Save')
+
+class RestoreRevisionForm(FlaskForm):
+    """Form for restoring an earlier note revision"""
+    submit = SubmitField('Restore This Version')
+
 class SearchForm(FlaskForm):
     """Form for searching notes and passwords"""
     query = StringField('Search', validators=[
@@ -148,6 +174,80 @@ class PasswordGeneratorForm(FlaskForm):
         except ValueError:
             raise ValidationError('Please enter a valid number for length.')
 
+class BatchPasswordGeneratorForm(FlaskForm):
+    """Form for generating many passwords at once (provisioning scripts)"""
+    count = IntegerField('Count', default=100, validators=[
+        NumberRange(min=1, message='Count must be at least 1.')
+    ])
+    mode = SelectField('Mode', default='random', choices=[
+        ('random', 'Random characters'),
+        ('passphrase', 'Passphrase'),
+        ('pronounceable', 'Pronounceable')
+    ])
+    length = IntegerField('Length', default=16, validators=[
+        NumberRange(min=8, max=128, message='Password length must be between 8 and 128 characters.')
+    ])
+    # Symbols are included unless this is sent empty, '0' or 'false'
+    include_symbols = StringField('Include Symbols', default='1')
+    words = IntegerField('Words', default=6, validators=[
+        NumberRange(min=3, max=20, message='Passphrases must have between 3 and 20 words.')
+    ])
+    separator = StringField('Separator', default='-', validators=[
+        Length(max=3, message='Separator must be at most 3 characters.')
+    ])
+    
+    def validate_count(self, count):
+        """Validate the batch size against the configured maximum"""
+        maximum = current_app.config['PASSWORD_BATCH_MAX']
+        if count.data is not None and count.data > maximum:
+            raise ValidationError(f'Count cannot exceed {maximum}.')
+
+class VaultForm(FlaskForm):
+    """Form for creating a shared vault"""
+    name = StringField('Name', validators=[
+        DataRequired(message='Name is required'),
+        Length(max=100, message='Name must be less than 100 characters')
+    ], render_kw={'placeholder': 'e.g., Family, Team'})
+    
+    submit = SubmitField('Create Vault')
+
+class VaultMemberForm(FlaskForm):
+    """Form for adding a member to a shared vault"""
+    email = StringField('Email', validators=[
+        DataRequired(message='Email is required'),
+        Email(message='Please enter a valid email address')
+    ], render_kw={'placeholder': 'Email of a SecureDesk user'})
+    
+    submit = SubmitField('Add Member')
+
+class AccessTokenForm(FlaskForm):
+    """Form for creating a personal access token for API clients"""
+    name = StringField('Name', validators=[
+        DataRequired(message='Name is required'),
+        Length(max=100, message='Name must be less than 100 characters')
+    ], render_kw={'placeholder': 'Backup script'})
+    
+    scopes = SelectMultipleField('Access', choices=list(SCOPES.items()), validators=[
+        DataRequired(message='Choose at least one kind of access')
+    ], widget=ListWidget(prefix_label=False), option_widget=CheckboxInput())
+    
+    expires = SelectField('Expires', default='90', choices=[
+        ('30', 'In 30 days'),
+        ('90', 'In 90 days'),
+        ('365', 'In a year'),
+        ('0', 'Never')
+    ])
+    
+    submit = SubmitField('Create Token')
+
+class DeleteAccountForm(FlaskForm):
+    """Form for deleting the current user's account, confirmed with their password"""
+    password = PasswordField('Current Password', validators=[
+        DataRequired(message='Enter your password to confirm')
+    ])
+    
+    submit = SubmitField('Delete Account')
+
 # Custom widget for password reveal functionality
 class PasswordRevealWidget:
     """Custom widget for password fields with reveal functionality"""
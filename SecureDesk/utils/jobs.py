@@ -0,0 +1,193 @@
+"""
+In-process background jobs persisted in the ``background_jobs`` table
+
+Routes submit work with ``runner.submit(kind, user_id, **params)`` and return
+the job id straight away; a thread pool runs the registered handler, which
+reports progress and checks for cancellation through its ``JobContext``.
+Clients poll ``/jobs/<id>`` for status and fetch the result of a finished
+job once from ``/jobs/<id>/result``. Workers claim a job with a conditional
+UPDATE, so however many of them are handed the same job, only one runs it.
+"""
+
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from models import db, BackgroundJob
+from utils.sharding import use_user_shard
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+class JobCancelled(Exception):
+    """Raised inside a handler when the job has been cancelled"""
+
+def job_handler(kind: str):
+    """
+    Register a function as the handler for a job kind
+
+    The handler is called as ``handler(ctx, **params)`` inside an app context
+    and returns a JSON-serializable result.
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+class JobContext:
+    """Handle given to a running job for progress reporting and cancellation"""
+
+    def __init__(self, job_id: str, user_id: int):
+        self.job_id = job_id
+        self.user_id = user_id
+
+    def _update(self, **values):
+        db.session.execute(
+            db.update(BackgroundJob).where(BackgroundJob.id == self.job_id).values(**values)
+        )
+        db.session.commit()
+
+    def progress(self, done: int, total: int, message: str = None):
+        """Record progress as a fraction of the total work"""
+        percent = int(done * 100 / total) if total else 100
+        self._update(progress=min(percent, 100), message=message)
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation has been requested"""
+        return bool(db.session.execute(
+            db.select(BackgroundJob.cancel_requested).where(BackgroundJob.id == self.job_id)
+        ).scalar())
+
+    def check_cancelled(self):
+        """Stop the handler if cancellation has been requested"""
+        if self.cancelled:
+            raise JobCancelled()
+
+class JobRunner:
+    """Thread pool executing queued jobs for the app"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['job_runner'] = self
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created on first use so each forked server worker gets its own threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config.get('JOBS_WORKERS', 2),
+                    thread_name_prefix='job'
+                )
+            return self._executor
+
+    def submit(self, kind: str, user_id: int = None, **params) -> BackgroundJob:
+        """
+        Persist a new job and schedule it
+
+        Args:
+            kind: Registered handler name
+            user_id: Owner of the job (None for system jobs)
+            **params: JSON-serializable handler arguments
+
+        Returns:
+            The queued BackgroundJob
+        """
+        if kind not in _handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job = BackgroundJob(id=uuid.uuid4().hex, kind=kind, user_id=user_id,
+                            status='queued', params=json.dumps(params))
+        db.session.add(job)
+        db.session.commit()
+
+        if current_app.config.get('JOBS_EAGER'):
+            self.run(job.id)
+            db.session.refresh(job)
+        else:
+            self._pool().submit(self._run_in_context, job.id)
+        return job
+
+    def _run_in_context(self, job_id: str):
+        with self.app.app_context():
+            self.run(job_id)
+
+    def run(self, job_id: str):
+        """Execute a queued job in the current thread, unless another worker claimed it first"""
+        claimed = db.session.execute(
+            db.update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == 'queued')
+            .values(status='running', started_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+        job = db.session.get(BackgroundJob, job_id)
+
+        ctx = JobContext(job.id, job.user_id)
+        try:
+            with use_user_shard(job.user_id):
+                result = _handlers[job.kind](ctx, **json.loads(job.params or '{}'))
+            values = {'status': 'succeeded', 'progress': 100, 'result': json.dumps(result)}
+        except JobCancelled:
+            values = {'status': 'cancelled', 'message': 'Cancelled'}
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job_id, job.kind)
+            values = {'status': 'failed', 'error': str(e)[:500] or e.__class__.__name__}
+
+        # Discard anything the handler left uncommitted before recording the outcome
+        db.session.rollback()
+        values['finished_at'] = datetime.utcnow()
+        db.session.execute(db.update(BackgroundJob).where(BackgroundJob.id == job_id).values(**values))
+        db.session.commit()
+
+    def cancel(self, job: BackgroundJob):
+        """Request cancellation; queued jobs are cancelled immediately"""
+        if job.finished:
+            return
+        job.cancel_requested = True
+        # Only while still queued, in case a worker claims it meanwhile
+        db.session.execute(
+            db.update(BackgroundJob)
+            .where(BackgroundJob.id == job.id, BackgroundJob.status == 'queued')
+            .values(status='cancelled', finished_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+def job_result(job: BackgroundJob):
+    """Decoded result of a finished job (None until it succeeds)"""
+    if job.status != 'succeeded' or job.result is None:
+        return None
+    return json.loads(job.result)
+
+def fail_interrupted_jobs() -> int:
+    """
+    Mark jobs left queued or running by a previous process as failed
+
+    Only call this when no other process is running jobs (e.g. at startup of
+    a single-process server).
+
+    Returns:
+        Number of jobs marked failed
+    """
+    count = db.session.execute(
+        db.update(BackgroundJob)
+        .where(BackgroundJob.status.in_(('queued', 'running')))
+        .values(status='failed', error='Interrupted by server restart', finished_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return count
+
+# Shared runner, bound to the app in app.py
+runner = JobRunner()
@@ -0,0 +1,103 @@
+"""
+Buffered last-login and last-seen timestamps
+
+Logins and authenticated requests only update an in-memory map. The
+``last-seen-flusher`` worker writes it every ``LAST_SEEN_FLUSH_INTERVAL``
+seconds (and once more at exit) with a single ``UPDATE users SET ... = CASE
+id WHEN ... END`` per few hundred users, so the stored values lag by at most
+one interval and the login path commits nothing. Pages showing these times
+should use ``effective_times``, which overlays the pending values.
+"""
+
+import threading
+from datetime import datetime
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import case
+from models import db, User
+from utils.background import register_worker
+from utils.metrics import metrics
+
+# Users per UPDATE statement (three bound parameters each, well under SQLite's limit)
+FLUSH_CHUNK = 300
+
+class LastSeenBuffer:
+    """Pending last_login/last_seen values keyed by user id"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, user_id: int, login: bool = False, when: datetime = None):
+        """Note activity by a user (a login also counts as being seen)"""
+        when = when or datetime.utcnow()
+        with self._lock:
+            last_login, _ = self._pending.get(user_id, (None, None))
+            self._pending[user_id] = (when if login else last_login, when)
+
+    def pending(self, user_id: int) -> tuple:
+        """(last_login, last_seen) not yet written for a user; None where nothing is pending"""
+        with self._lock:
+            return self._pending.get(user_id, (None, None))
+
+    def _restore(self, values: dict):
+        """Put back values whose write failed, unless newer ones arrived meanwhile"""
+        with self._lock:
+            for user_id, (last_login, last_seen) in values.items():
+                newer_login, newer_seen = self._pending.get(user_id, (None, None))
+                self._pending[user_id] = (newer_login or last_login, newer_seen or last_seen)
+
+    def flush(self) -> int:
+        """Write all pending timestamps; returns the number of users updated"""
+        with self._lock:
+            values, self._pending = self._pending, {}
+        if not values:
+            return 0
+
+        users = User.__table__
+        user_ids = list(values)
+        try:
+            with db.engine.begin() as connection:
+                for i in range(0, len(user_ids), FLUSH_CHUNK):
+                    chunk = user_ids[i:i + FLUSH_CHUNK]
+                    logins = {user_id: values[user_id][0] for user_id in chunk if values[user_id][0]}
+                    seen = {user_id: values[user_id][1] for user_id in chunk}
+                    last_login = case(logins, value=users.c.id, else_=users.c.last_login) if logins else users.c.last_login
+                    connection.execute(
+                        users.update().where(users.c.id.in_(chunk)).values(
+                            last_login=last_login,
+                            last_seen=case(seen, value=users.c.id, else_=users.c.last_seen),
+                        )
+                    )
+        except Exception:
+            self._restore(values)
+            raise
+        metrics.inc('last_seen_flushes_total')
+        return len(values)
+
+def get_last_seen() -> LastSeenBuffer:
+    """Timestamp buffer of the current app"""
+    return current_app.extensions['last_seen']
+
+def record_login(user_id: int):
+    """Remember a successful login, written with the next flush"""
+    get_last_seen().record(user_id, login=True)
+
+def effective_times(user) -> tuple:
+    """(last_login, last_seen) of a user including values not yet flushed"""
+    last_login, last_seen = get_last_seen().pending(user.id)
+    return last_login or user.last_login, last_seen or user.last_seen
+
+def init_last_seen(app):
+    """Track authenticated requests and flush timestamps in the background"""
+    buffer = LastSeenBuffer()
+    app.extensions['last_seen'] = buffer
+
+    @app.before_request
+    def _record_seen():
+        if request.endpoint != 'static' and current_user.is_authenticated:
+            buffer.record(current_user.id)
+
+    register_worker(app, 'last-seen-flusher', app.config.get('LAST_SEEN_FLUSH_INTERVAL', 60),
+                    buffer.flush, run_on_exit=True)
+    return buffer
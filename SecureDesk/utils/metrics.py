@@ -0,0 +1,85 @@
+"""
+In-process metrics registry: counters, gauges and timing summaries
+"""
+
+import threading
+
+class MetricsRegistry:
+    """Thread-safe store of labelled counters, gauges and summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge to an absolute value"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def add(self, name: str, delta: float, **labels):
+        """Move a gauge up or down"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one observation (count, sum and max are kept)"""
+        key = self._key(name, labels)
+        with self._lock:
+            count, total, peak = self._summaries.get(key, (0, 0.0, 0.0))
+            self._summaries[key] = (count + 1, total + value, max(peak, value))
+
+    def value(self, name: str, **labels) -> float:
+        """Current value of a counter or gauge (0 when never recorded)"""
+        key = self._key(name, labels)
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def summary(self, name: str, **labels) -> tuple:
+        """(count, sum, max) of a summary ((0, 0.0, 0.0) when never observed)"""
+        key = self._key(name, labels)
+        with self._lock:
+            return self._summaries.get(key, (0, 0.0, 0.0))
+
+    def reset(self):
+        """Forget all recorded metrics"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        def fmt(name, labels, value):
+            if labels:
+                label_str = ','.join(f'{k}="{v}"' for k, v in labels)
+                return f'{name}{{{label_str}}} {value}'
+            return f'{name} {value}'
+
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(fmt(name, labels, value))
+            for (name, labels), value in sorted(self._gauges.items()):
+                lines.append(fmt(name, labels, value))
+            for (name, labels), (count, total, peak) in sorted(self._summaries.items()):
+                lines.append(fmt(f'{name}_count', labels, count))
+                lines.append(fmt(f'{name}_sum', labels, round(total, 6)))
+                lines.append(fmt(f'{name}_max', labels, round(peak, 6)))
+        return '\n'.join(lines) + '\n'
+
+# Shared registry for the whole process
+metrics = MetricsRegistry()
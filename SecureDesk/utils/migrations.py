@@ -0,0 +1,170 @@
+"""
+Schema upgrades for databases created by earlier versions
+
+``db.create_all()`` creates missing tables but never alters existing ones,
+so columns added to existing tables are listed in ``COLUMNS`` and added with
+``ALTER TABLE`` by ``migrate_database()``, typed as in the models for the
+database's dialect, followed by any index of the
+models that is missing. Every step checks the live schema first, so running
+the migration again, or on a freshly created database, changes nothing.
+
+Columns that need existing rows filled in register a backfill with
+``@backfill(table, column)``; it runs in the same transaction, right after
+the column was added.
+"""
+
+from sqlalchemy import inspect, text
+from models import db, Note, NoteChunk
+from utils.compression import decompress
+from utils import simhash
+from utils.search import reset_indexes
+from utils.sharding import all_engines
+
+# Columns added to existing tables, in the order they were introduced:
+# (table, column, SQL default for existing rows of NOT NULL columns)
+COLUMNS = [
+    ('users', 'search_version', '0'),
+    ('notes', 'revision_count', '0'),
+    ('notes', 'snippet', "''"),
+    ('notes', 'size', '0'),
+    ('notes', 'folder_id', None),
+    ('password_entries', 'folder_id', None),
+    ('notes', 'simhash', None),
+    ('notes', 'simhash_b0', None),
+    ('notes', 'simhash_b1', None),
+    ('notes', 'simhash_b2', None),
+    ('notes', 'simhash_b3', None),
+    ('users', 'last_seen', None),
+    ('password_entries', 'rotation_days', None),
+    ('password_entries', 'next_rotation_at', None),
+    ('password_entries', 'rotation_reminder_at', None),
+    ('users', 'deleted_at', None),
+    ('notes', 'deleted_at', None),
+    ('password_entries', 'deleted_at', None),
+]
+
+_backfills = {}
+
+def backfill(table: str, column: str):
+    """Register ``func(connection)`` to fill in a column after it is added to an existing table"""
+    def decorator(func):
+        _backfills[(table, column)] = func
+        return func
+    return decorator
+
+@backfill('users', 'search_version')
+def _rebuild_search_indexes(connection):
+    # Indexes are rebuilt from the entries on next use; drop any built against the old schema
+    reset_indexes()
+
+@backfill('users', 'last_seen')
+def _seen_at_last_login(connection):
+    # Users were last seen no earlier than their last login
+    connection.execute(text('UPDATE users SET last_seen = last_login'))
+
+@backfill('notes', 'size')
+def _chunk_legacy_content(connection, batch_size=100):
+    # Before chunking, note text lived in notes.content (compressed in place for a while)
+    if 'content' not in {info['name'] for info in inspect(connection).get_columns('notes')}:
+        return
+    notes, chunks = Note.__table__, NoteChunk.__table__
+    size = NoteChunk.CHUNK_SIZE
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text('SELECT id, content FROM notes WHERE id > :last_id ORDER BY id LIMIT :limit'),
+            {'last_id': last_id, 'limit': batch_size}
+        ).all()
+        if not rows:
+            return
+        for note_id, value in rows:
+            content = decompress(value) or ''
+            if content:
+                # Bound through NoteChunk's column type, so chunks are compressed like any other
+                connection.execute(chunks.insert(), [
+                    {'note_id': note_id, 'seq': seq, 'data': content[start:start + size]}
+                    for seq, start in enumerate(range(0, len(content), size))
+                ])
+            connection.execute(
+                notes.update().where(notes.c.id == note_id)
+                .values(snippet=content[:120], size=len(content), updated_at=notes.c.updated_at)
+            )
+        # The old column is no longer read; clear it rather than keep a stale copy
+        connection.execute(
+            text('UPDATE notes SET content = NULL WHERE id > :last_id AND id <= :end_id'),
+            {'last_id': last_id, 'end_id': rows[-1][0]}
+        )
+        last_id = rows[-1][0]
+
+@backfill('notes', 'simhash')
+def _fingerprint_notes(connection, batch_size=100):
+    # Same input as Note._refresh_fingerprint: the title and the first chunk
+    notes, chunks = Note.__table__, NoteChunk.__table__
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            db.select(notes.c.id, notes.c.title, chunks.c.data)
+            .outerjoin(chunks, (chunks.c.note_id == notes.c.id) & (chunks.c.seq == 0))
+            .where(notes.c.id > last_id).order_by(notes.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        for note_id, title, first_chunk in rows:
+            value = simhash.fingerprint(f'{title}\n{first_chunk or ""}')
+            values = {f'simhash_b{i}': band for i, band in enumerate(simhash.bands(value))}
+            connection.execute(
+                notes.update().where(notes.c.id == note_id)
+                .values(simhash=simhash.to_signed(value), updated_at=notes.c.updated_at, **values)
+            )
+        last_id = rows[-1][0]
+
+def migrate_engine(engine) -> list:
+    """
+    Add the missing columns and indexes to one database
+
+    Returns:
+        (table, column) of every column added
+    """
+    added = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+        columns = {table: {info['name'] for info in inspector.get_columns(table)} for table in tables}
+        for table, column, default in COLUMNS:
+            if table not in tables:
+                continue
+            if column not in columns[table]:
+                mapped = db.metadata.tables[table].c[column]
+                ddl = mapped.type.compile(dialect=connection.dialect)
+                for key in mapped.foreign_keys:
+                    ddl += f' REFERENCES {key.column.table.name} ({key.column.name})'
+                if default is not None:
+                    ddl += f' NOT NULL DEFAULT {default}'
+                connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+                columns[table].add(column)
+                added.append((table, column))
+
+        for table in db.metadata.sorted_tables:
+            if table.name in tables:
+                for index in table.indexes:
+                    if all(column.name in columns[table.name] for column in index.columns):
+                        index.create(connection, checkfirst=True)
+
+        for key in added:
+            if key in _backfills:
+                _backfills[key](connection)
+    return added
+
+def migrate_database() -> list:
+    """
+    Bring the primary database and every shard up to date
+
+    Run before the app serves requests, after ``db.create_all()``.
+
+    Returns:
+        ``table.column`` of every column added, once per database
+    """
+    added = []
+    for engine in all_engines():
+        added.extend(f'{table}.{column}' for table, column in migrate_engine(engine))
+    return added
@@ -0,0 +1,154 @@
+"""
+Bulk password generation for provisioning
+
+Randomness is drawn from ``secrets.token_bytes`` a whole batch at a time.
+Bytes are mapped onto an alphabet with ``bytes.translate``, deleting the top
+``256 % len(alphabet)`` byte values first so every symbol stays equally
+likely (rejection sampling instead of a biased modulo). Wordlists longer
+than 256 entries draw two bytes per index the same way.
+
+Because the generator's distribution is known, the entropy reported for a
+batch is exact rather than estimated from the finished strings.
+"""
+
+import os
+import math
+import secrets
+import string
+from array import array
+from functools import lru_cache
+from itertools import combinations
+from utils.security import SYMBOLS, character_classes
+
+MODES = ('random', 'passphrase', 'pronounceable')
+
+WORDLIST_PATH = os.path.join(os.path.dirname(__file__), 'data', 'words.txt')
+
+CONSONANTS = 'bcdfghjklmnprstvz'
+VOWELS = 'aeiou'
+SYLLABLES = [c + v for c in CONSONANTS for v in VOWELS]
+
+def _alphabet(include_symbols: bool) -> list:
+    classes = [string.ascii_lowercase, string.ascii_uppercase, string.digits]
+    if include_symbols:
+        classes.append(SYMBOLS)
+    return classes
+
+@lru_cache(maxsize=4)
+def load_wordlist(path: str = WORDLIST_PATH) -> tuple:
+    """Unique words of a one-word-per-line file (cached per path)"""
+    with open(path, encoding='utf-8') as f:
+        words = dict.fromkeys(line.strip() for line in f)
+    words.pop('', None)
+    if len(words) < 2:
+        raise ValueError("Wordlist must contain at least two words")
+    return tuple(words)
+
+def random_indices(n: int, count: int) -> list:
+    """
+    Draw ``count`` uniform integers in [0, n) from bulk random bytes
+
+    Values from the incomplete top range are discarded, so the result has
+    no modulo bias.
+    """
+    if not 1 < n <= 1 << 32:
+        raise ValueError("Range must hold between 2 and 2**32 values")
+    typecode = 'B' if n <= 1 << 8 else 'H' if n <= 1 << 16 else 'I'
+    width = array(typecode).itemsize
+    span = 1 << (8 * width)
+    limit = span - span % n
+    result = []
+    while len(result) < count:
+        # Oversample by the rejection rate so one draw is nearly always enough
+        needed = count - len(result)
+        values = array(typecode, secrets.token_bytes((needed * span // limit + 8) * width))
+        result.extend(value % n for value in values if value < limit)
+    del result[count:]
+    return result
+
+def random_string(alphabet: str, length: int) -> str:
+    """Uniform random string over an ASCII alphabet of at most 256 characters"""
+    n = len(alphabet)
+    limit = 256 - 256 % n
+    table = bytes(ord(alphabet[i % n]) for i in range(256))
+    rejected = bytes(range(limit, 256))
+    text = b''
+    while len(text) < length:
+        needed = length - len(text)
+        text += secrets.token_bytes(needed * 256 // limit + 16).translate(table, rejected)
+    return text[:length].decode('ascii')
+
+@lru_cache(maxsize=256)
+def random_mode_entropy(length: int, include_symbols: bool) -> float:
+    """
+    Exact entropy in bits of the random mode
+
+    Passwords must contain every character class, so the number of possible
+    passwords is counted by inclusion-exclusion over the missing classes.
+    """
+    sizes = [len(chars) for chars in _alphabet(include_symbols)]
+    total = sum(sizes)
+    possible = 0
+    for missing in range(len(sizes) + 1):
+        for excluded in combinations(sizes, missing):
+            possible += (-1) ** missing * (total - sum(excluded)) ** length
+    return math.log2(possible)
+
+def batch_entropy(mode: str, length: int = 16, include_symbols: bool = True,
+                  words: int = 6, wordlist: tuple = None) -> float:
+    """Entropy in bits of every password produced with the given settings"""
+    if mode == 'random':
+        return random_mode_entropy(length, include_symbols)
+    if mode == 'passphrase':
+        return words * math.log2(len(wordlist or load_wordlist()))
+    if mode == 'pronounceable':
+        return length // 2 * math.log2(len(SYLLABLES)) + length % 2 * math.log2(len(CONSONANTS))
+    raise ValueError(f"Unknown generation mode: {mode}")
+
+def generate_batch(count: int, mode: str = 'random', length: int = 16, include_symbols: bool = True,
+                   words: int = 6, separator: str = '-', wordlist: tuple = None) -> list:
+    """
+    Generate ``count`` passwords at once
+
+    Args:
+        count: Number of passwords
+        mode: 'random' (every character class present), 'passphrase'
+            (``words`` words from the wordlist) or 'pronounceable'
+            (consonant-vowel syllables, ``length`` letters)
+        length: Characters per password (random and pronounceable modes)
+        include_symbols: Use symbols in the random mode
+        words: Words per passphrase
+        separator: Joins passphrase words
+        wordlist: Words to draw from (default: the bundled list)
+
+    Returns:
+        List of password strings
+    """
+    if mode == 'random':
+        if length < 8:
+            raise ValueError("Password length must be at least 8 characters")
+        classes = _alphabet(include_symbols)
+        alphabet = ''.join(classes)
+        result = []
+        while len(result) < count:
+            needed = count - len(result)
+            # Draw ~25% extra: candidates missing a character class are discarded
+            text = random_string(alphabet, (needed + needed // 4 + 4) * length)
+            for i in range(0, len(text), length):
+                candidate = text[i:i + length]
+                if len(character_classes(candidate)) == len(classes):
+                    result.append(candidate)
+        return result[:count]
+
+    if mode == 'passphrase':
+        wordlist = wordlist or load_wordlist()
+        picks = [wordlist[i] for i in random_indices(len(wordlist), count * words)]
+        return [separator.join(picks[i:i + words]) for i in range(0, len(picks), words)]
+
+    if mode == 'pronounceable':
+        syllables = length // 2
+        picks = [SYLLABLES[i] for i in random_indices(len(SYLLABLES), count * syllables)] if syllables else []
+        tails = random_string(CONSONANTS, count) if length % 2 else ''
+        return [''.join(picks[i * syllables:(i + 1) * syllables]) + tails[i:i + 1] for i in range(count)]
+
+    raise ValueError(f"Unknown generation mode: {mode}")
@@ -0,0 +1,298 @@
+"""
+Request rate limiting with sliding-window or token-bucket strategies
+
+Rules are configured per endpoint in ``RATELIMIT_ROUTES`` and checked by the
+``limiter.limit()`` decorator before the view runs, so rejected requests never
+reach password hashing or decryption.
+"""
+
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+import zlib
+from collections import namedtuple
+from functools import wraps
+from flask import current_app, request, jsonify
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+from utils.metrics import metrics
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'remaining', 'retry_after'])
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+def parse_rate(rate: str) -> tuple:
+    """
+    Parse a rate string such as '10/minute' or '100/5 minutes'
+
+    Returns:
+        Tuple of (limit, period in seconds)
+    """
+    count, _, period = rate.partition('/')
+    parts = period.strip().split()
+    multiplier = int(parts[0]) if len(parts) == 2 else 1
+    unit = parts[-1].rstrip('s')
+    if unit not in _PERIODS:
+        raise ValueError(f"Unknown rate period: {rate}")
+    return int(count), multiplier * _PERIODS[unit]
+
+class MemoryStore:
+    """Per-process state store split into independently locked shards"""
+
+    # Expired keys are purged from a shard every this many writes
+    SWEEP_EVERY = 1024
+
+    def __init__(self, shards: int = 16):
+        self._shards = [(threading.Lock(), {}) for _ in range(shards)]
+        self._writes = [0] * shards
+
+    def update(self, key: str, func, ttl: float):
+        """
+        Atomically replace a key's state with func(state)
+
+        Args:
+            key: Limiter key
+            func: Callable taking the old state (or None) and returning
+                (new state, result)
+            ttl: Seconds until the new state may be discarded
+
+        Returns:
+            The result returned by func
+        """
+        index = zlib.crc32(key.encode()) % len(self._shards)
+        lock, data = self._shards[index]
+        now = time.monotonic()
+        with lock:
+            entry = data.get(key)
+            state = entry[0] if entry and entry[1] > now else None
+            new_state, result = func(state)
+            data[key] = (new_state, now + ttl)
+
+            self._writes[index] += 1
+            if self._writes[index] % self.SWEEP_EVERY == 0:
+                for stale in [k for k, (_, expires) in data.items() if expires <= now]:
+                    del data[stale]
+        return result
+
+    def clear(self):
+        """Drop all stored state"""
+        for lock, data in self._shards:
+            with lock:
+                data.clear()
+
+class SQLiteStore:
+    """State store in a local SQLite file shared by every worker on the host"""
+
+    SWEEP_EVERY = 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limits '
+            '(key TEXT PRIMARY KEY, state TEXT NOT NULL, expires REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def update(self, key: str, func, ttl: float):
+        """Atomically replace a key's state with func(state) (see MemoryStore.update)"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT state FROM rate_limits WHERE key = ? AND expires > ?', (key, now)
+            ).fetchone()
+            new_state, result = func(tuple(json.loads(row[0])) if row else None)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limits (key, state, expires) VALUES (?, ?, ?)',
+                (key, json.dumps(new_state), now + ttl)
+            )
+
+            self._writes += 1
+            if self._writes % self.SWEEP_EVERY == 0:
+                conn.execute('DELETE FROM rate_limits WHERE expires <= ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def clear(self):
+        """Drop all stored state"""
+        self._connection().execute('DELETE FROM rate_limits')
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter: the previous fixed window's count is weighted by
+    how much of it still overlaps the sliding window, giving O(1) state
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def hit(self, key: str, limit: int, period: float, now: float = None) -> RateLimitResult:
+        now = time.time() if now is None else now
+        window = math.floor(now / period) * period
+
+        def apply(state):
+            current, previous = 0, 0
+            if state:
+                start, count, prior = state
+                if start == window:
+                    current, previous = count, prior
+                elif start == window - period:
+                    previous = count
+
+            weight = 1 - (now - window) / period
+            estimated = previous * weight + current
+            if estimated + 1 > limit:
+                if current + 1 > limit or not previous:
+                    retry_after = window + period - now
+                else:
+                    # Wait until enough of the previous window has slid out
+                    retry_after = window + period * (1 - (limit - current - 1) / previous) - now
+                return (window, current, previous), RateLimitResult(False, 0, math.ceil(retry_after) or 1)
+
+            current += 1
+            remaining = max(int(limit - previous * weight - current), 0)
+            return (window, current, previous), RateLimitResult(True, remaining, 0)
+
+        return self.store.update(key, apply, ttl=2 * period)
+
+class TokenBucketLimiter:
+    """Token bucket holding up to ``limit`` tokens refilled over ``period`` seconds"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def hit(self, key: str, limit: int, period: float, now: float = None) -> RateLimitResult:
+        now = time.time() if now is None else now
+        rate = limit / period
+
+        def apply(state):
+            tokens, updated = state if state else (limit, now)
+            tokens = min(limit, tokens + (now - updated) * rate)
+            if tokens < 1:
+                return (tokens, now), RateLimitResult(False, 0, math.ceil((1 - tokens) / rate))
+            return (tokens - 1, now), RateLimitResult(True, int(tokens - 1), 0)
+
+        return self.store.update(key, apply, ttl=period)
+
+STRATEGIES = {
+    'sliding-window': SlidingWindowLimiter,
+    'token-bucket': TokenBucketLimiter,
+}
+
+def _key_value(scope: str):
+    """Resolve the value a rule is keyed by for the current request"""
+    if scope == 'ip':
+        return request.remote_addr or 'unknown'
+    if scope == 'user':
+        if current_user.is_authenticated:
+            return f'id:{current_user.id}'
+        # Anonymous endpoints (login) are keyed by the account being tried
+        email = (request.form.get('email') or '').strip().lower()
+        return f'email:{email}' if email else f'ip:{request.remote_addr}'
+    if scope == 'endpoint':
+        return 'all'
+    raise ValueError(f"Unknown rate limit scope: {scope}")
+
+class RateLimiter:
+    """Flask integration: per-route rules, pluggable store and strategy"""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.strategy = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Create the configured store and strategy for an app"""
+        storage = app.config.get('RATELIMIT_STORAGE', 'memory')
+        if storage == 'sqlite':
+            path = app.config.get('RATELIMIT_STORAGE_PATH', 'ratelimit.sqlite')
+            if not os.path.isabs(path):
+                os.makedirs(app.instance_path, exist_ok=True)
+                path = os.path.join(app.instance_path, path)
+            self.store = SQLiteStore(path)
+        elif storage == 'memory':
+            self.store = MemoryStore(app.config.get('RATELIMIT_SHARDS', 16))
+        else:
+            raise ValueError(f"Unknown rate limit storage: {storage}")
+
+        strategy = app.config.get('RATELIMIT_STRATEGY', 'sliding-window')
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown rate limit strategy: {strategy}")
+        self.strategy = STRATEGIES[strategy](self.store)
+        app.extensions['ratelimiter'] = self
+
+    def reset(self):
+        """Clear all counters (used by tests)"""
+        self.store.clear()
+
+    def check(self, endpoint: str) -> RateLimitResult:
+        """
+        Apply every configured rule for an endpoint to the current request
+
+        Returns:
+            The first rejecting result, or the most restrictive allowed one
+        """
+        rules = current_app.config.get('RATELIMIT_ROUTES', {}).get(endpoint, ())
+        outcome = RateLimitResult(True, None, 0)
+        for index, (rate, scope) in enumerate(rules):
+            limit, period = parse_rate(rate)
+            key = f'{endpoint}:{index}:{scope}:{_key_value(scope)}'
+            result = self.strategy.hit(key, limit, period)
+            metrics.inc('ratelimit_checks_total', endpoint=endpoint)
+            if not result.allowed:
+                metrics.inc('ratelimit_rejections_total', endpoint=endpoint, scope=scope)
+                return result
+            if outcome.remaining is None or result.remaining < outcome.remaining:
+                outcome = result
+        return outcome
+
+    def limit(self, json_response: bool = False, methods: tuple = ('POST',)):
+        """
+        Decorator enforcing the endpoint's configured rules
+
+        Args:
+            json_response: Reply with a JSON error body instead of the 429 error page
+            methods: HTTP methods that count against the limit
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if not current_app.config.get('RATELIMIT_ENABLED', True) or request.method not in methods:
+                    return view(*args, **kwargs)
+
+                result = self.check(request.endpoint)
+                if result.allowed:
+                    return view(*args, **kwargs)
+
+                if json_response:
+                    response = jsonify({
+                        'status': 'error',
+                        'message': 'Too many requests. Please try again later.'
+                    })
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(result.retry_after)
+                    return response
+                raise TooManyRequests(retry_after=result.retry_after)
+            return wrapped
+        return decorator
+
+# Shared limiter, bound to the app in app.py
+limiter = RateLimiter()
@@ -0,0 +1,110 @@
+"""
+Read/write routing between the primary database and read replicas
+
+Replicas are the ``SQLALCHEMY_BINDS`` whose key starts with ``replica``.
+Views decorated with ``@read_replica`` send their plain SELECTs to one of
+them; everything else uses the primary: writes, ``SELECT ... FOR UPDATE``,
+reads after the current transaction wrote, and all code outside such views
+(background jobs, forms, session loading).
+
+Read-your-writes: once a request commits a write, that user's requests stay
+on the primary for ``REPLICA_STICKY_SECONDS`` (remembered in their session),
+which should exceed the replicas' replication lag.
+"""
+
+import time
+import random
+import sqlite3
+from functools import wraps
+from flask import g, current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+from utils.background import register_worker
+
+REPLICA_PREFIX = 'replica'
+_STICKY_KEY = '_primary_until'
+
+def replica_engines() -> list:
+    """Engines of the current app's replica binds"""
+    engines = current_app.extensions['sqlalchemy'].engines
+    return [engine for key, engine in engines.items() if key and key.startswith(REPLICA_PREFIX)]
+
+class RoutingSession(Session):
+    """Session that sends eligible reads to the request's replica"""
+
+    # Callables (session, mapper, clause) -> engine or None, consulted first (see utils/sharding.py)
+    routers = []
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            for router in self.routers:
+                engine = router(self, mapper, clause)
+                if engine is not None:
+                    return engine
+        if bind is None and clause is not None:
+            if isinstance(clause, Select) and clause._for_update_arg is None:
+                replica = self._replica()
+                if replica is not None:
+                    return replica
+            elif getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica(self):
+        if self._flushing or self.info.get('wrote') or not has_request_context():
+            return None
+        if g.get('primary_until'):
+            return None
+        return g.get('replica_engine')
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    if session.info.pop('wrote', False) and has_request_context() and replica_engines():
+        g.primary_until = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_writes(session):
+    session.info.pop('wrote', None)
+
+def read_replica(view):
+    """Let a view's reads go to a replica unless the user recently wrote"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        engines = replica_engines()
+        if engines and flask_session.get(_STICKY_KEY, 0) <= time.time():
+            g.replica_engine = random.choice(engines)
+        return view(*args, **kwargs)
+    return wrapper
+
+def sync_sqlite_replicas():
+    """
+    Copy the SQLite primary over every SQLite replica
+
+    Stands in for replication when trying a replica setup locally: run
+    periodically, it gives the replicas a lag of up to one interval.
+    """
+    primary = current_app.extensions['sqlalchemy'].engines[None]
+    with sqlite3.connect(primary.url.database) as source:
+        for engine in replica_engines():
+            target = sqlite3.connect(engine.url.database)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+
+def init_replication(app):
+    """Remember sticky writes in the session and start simulated replication if configured"""
+    @app.after_request
+    def remember_primary(response):
+        if g.get('primary_until'):
+            flask_session[_STICKY_KEY] = g.primary_until
+        return response
+
+    interval = app.config.get('REPLICA_SYNC_INTERVAL')
+    if interval:
+        register_worker(app, 'replica-sync', interval, sync_sqlite_replicas)
@@ -0,0 +1,74 @@
+"""
+Password rotation policies and reminders
+
+An entry with a policy of N days is due N days after its password was last
+set. Two indexed columns keep this cheap at any number of entries:
+
+- ``next_rotation_at``: the due time. The dashboard lists a user's overdue
+  and soon-due entries with one range scan of ``(user_id, next_rotation_at)``.
+- ``rotation_reminder_at``: the due time while the reminder is still to be
+  sent. The ``rotation-scheduler`` worker claims entries whose time has come
+  with one range scan per database, clearing the column in the same UPDATE,
+  and records a ``rotation_due`` event in the owner's activity log. Claimed
+  rows leave the range, so each run only touches newly due entries, and
+  several processes never send the same reminder twice.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, PasswordEntry
+from utils.auditlog import audit
+from utils.background import register_worker
+from utils.metrics import metrics
+from utils.sharding import all_engines
+
+# Policies offered in the password forms (days, label); 0 turns reminders off
+ROTATION_CHOICES = (
+    (0, 'Never'),
+    (30, 'Every 30 days'),
+    (90, 'Every 90 days'),
+    (180, 'Every 6 months'),
+    (365, 'Every year'),
+)
+
+def due_rotations(user_id: int, limit: int = 10) -> list:
+    """A user's entries due within ``ROTATION_WARNING_DAYS``, most overdue first"""
+    horizon = datetime.utcnow() + timedelta(days=current_app.config.get('ROTATION_WARNING_DAYS', 14))
+    return PasswordEntry.query.filter(
+        PasswordEntry.user_id == user_id,
+        PasswordEntry.next_rotation_at <= horizon
+    ).order_by(PasswordEntry.next_rotation_at).limit(limit).all()
+
+def send_due_reminders(batch_size: int = 500) -> int:
+    """Record a reminder for every entry that became due; returns how many"""
+    entries = PasswordEntry.__table__
+    now = datetime.utcnow()
+    sent = 0
+    for engine in all_engines():
+        while True:
+            # Entries in the trash keep their reminder until they are restored
+            due = (
+                db.select(entries.c.id)
+                .where(entries.c.rotation_reminder_at <= now, entries.c.deleted_at.is_(None))
+                .limit(batch_size)
+            )
+            claim = (
+                entries.update()
+                .where(entries.c.id.in_(due), entries.c.rotation_reminder_at <= now)
+                .values(rotation_reminder_at=None)
+                .returning(entries.c.user_id, entries.c.service_name)
+            )
+            with engine.begin() as connection:
+                claimed = connection.execute(claim).all()
+            for user_id, service_name in claimed:
+                audit('rotation_due', service_name, user_id=user_id)
+            sent += len(claimed)
+            if len(claimed) < batch_size:
+                break
+    metrics.inc('rotation_reminders_total', sent)
+    return sent
+
+def init_rotation(app):
+    """Check for newly due entries in the background"""
+    return register_worker(app, 'rotation-scheduler', app.config.get('ROTATION_CHECK_INTERVAL', 3600),
+                           send_due_reminders)
@@ -0,0 +1,250 @@
+"""
+Per-user trigram index over password entry service names for fuzzy search and autocomplete
+
+Each worker keeps the indexes of recently active users in memory. Every ORM
+write to a password entry bumps ``User.search_version``; the writing worker
+patches its cached index after commit, while other workers see the version
+change on their next lookup and rebuild that user's index from the database.
+"""
+
+import re
+import heapq
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import db, User, PasswordEntry
+
+# Number of users whose index each worker keeps in memory
+INDEX_CACHE_SIZE = 256
+
+_WORD_RE = re.compile(r'[^\W_]+')
+_PENDING_KEY = 'search_index_changes'
+
+def trigrams(text: str, prefix: bool = False) -> set:
+    """
+    Split text into padded, lowercased word trigrams
+
+    Args:
+        text: Text to index or search for
+        prefix: Treat the last word as incomplete (no trailing padding)
+
+    Returns:
+        Set of three-character strings
+    """
+    words = _WORD_RE.findall((text or '').lower())
+    grams = set()
+    for i, word in enumerate(words):
+        padded = f'  {word}' if prefix and i == len(words) - 1 else f'  {word} '
+        for j in range(len(padded) - 2):
+            grams.add(padded[j:j + 3])
+    return grams
+
+def _normalize(text: str) -> str:
+    """Lowercase text and collapse punctuation to single spaces"""
+    return ' '.join(_WORD_RE.findall((text or '').lower()))
+
+class TrigramIndex:
+    """Trigram postings for one user's service names"""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.lock = threading.Lock()
+        self.postings = defaultdict(set)
+        # entry id -> (service name, normalized name, trigram set)
+        self.entries = {}
+
+    def add(self, entry_id: int, service_name: str):
+        """Index (or re-index) an entry's service name"""
+        self.remove(entry_id)
+        grams = trigrams(service_name)
+        self.entries[entry_id] = (service_name, _normalize(service_name), grams)
+        for gram in grams:
+            self.postings[gram].add(entry_id)
+
+    def remove(self, entry_id: int):
+        """Drop an entry from the index"""
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for gram in entry[2]:
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def search(self, query: str, limit: int = 50, min_similarity: float = 0.15) -> list:
+        """
+        Rank entries by service-name similarity to a query
+
+        Similarity is the Jaccard index of the trigram sets; entries whose
+        service name contains the query verbatim rank ahead of fuzzy matches.
+
+        Args:
+            query: Search text, possibly partial or misspelled
+            limit: Maximum number of entry ids to return (None for all matches)
+            min_similarity: Drop fuzzy matches scoring below this
+
+        Returns:
+            List of entry ids, best match first
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        needle = _normalize(query)
+
+        with self.lock:
+            hits = Counter()
+            for gram in grams:
+                ids = self.postings.get(gram)
+                if ids:
+                    hits.update(ids)
+
+            ranked = []
+            for entry_id, shared in hits.items():
+                service_name, normalized, entry_grams = self.entries[entry_id]
+                similarity = shared / (len(grams) + len(entry_grams) - shared)
+                if needle in normalized:
+                    similarity += 1.0
+                if similarity >= min_similarity:
+                    ranked.append((-similarity, service_name.lower(), entry_id))
+
+        best = sorted(ranked) if limit is None else heapq.nsmallest(limit, ranked)
+        return [entry_id for _, _, entry_id in best]
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        """
+        Complete service names where a word starts with the given prefix
+
+        Args:
+            prefix: Text typed so far
+            limit: Maximum number of suggestions
+
+        Returns:
+            List of distinct service names in alphabetical order
+        """
+        grams = trigrams(prefix, prefix=True)
+        needle = f' {_normalize(prefix)}'
+        if not grams or not needle.strip():
+            return []
+
+        with self.lock:
+            postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            names = {}
+            for entry_id in candidates:
+                service_name, normalized, _ = self.entries[entry_id]
+                if needle in f' {normalized}':
+                    names.setdefault(service_name.lower(), service_name)
+
+        return [names[key] for key in heapq.nsmallest(limit, names)]
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def get_index(user_id: int) -> TrigramIndex:
+    """
+    Return an up-to-date trigram index for a user, building it if needed
+
+    Args:
+        user_id: Owner of the password entries
+
+    Returns:
+        The user's TrigramIndex
+    """
+    version = db.session.execute(
+        db.select(User.search_version).where(User.id == user_id)
+    ).scalar() or 0
+
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(user_id)
+            return index
+
+    index = TrigramIndex(version)
+    rows = db.session.execute(
+        db.select(PasswordEntry.id, PasswordEntry.service_name).where(PasswordEntry.user_id == user_id)
+    )
+    for entry_id, service_name in rows:
+        index.add(entry_id, service_name)
+
+    with _indexes_lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+def reset_indexes():
+    """Forget every cached index, so each is rebuilt from the database on next use"""
+    with _indexes_lock:
+        _indexes.clear()
+
+def fuzzy_search(user_id: int, query: str, limit: int = 50) -> list:
+    """Rank a user's password entry ids by service-name similarity to a query"""
+    return get_index(user_id).search(query, limit=limit)
+
+def suggest_service_names(user_id: int, prefix: str, limit: int = 10) -> list:
+    """Autocomplete a user's service names from a typed prefix"""
+    return get_index(user_id).suggest(prefix, limit=limit)
+
+def _record_change(target, service_name):
+    """Bump the owner's search version and queue the index patch for commit"""
+    session = object_session(target)
+    # The entry may live on a shard; the user row is always on the primary
+    connection = session.connection(bind_arguments={'mapper': User.__mapper__})
+    users = User.__table__
+    connection.execute(
+        users.update()
+        .where(users.c.id == target.user_id)
+        .values(search_version=users.c.search_version + 1)
+    )
+    version = connection.execute(
+        db.select(users.c.search_version).where(users.c.id == target.user_id)
+    ).scalar()
+
+    session.info.setdefault(_PENDING_KEY, []).append((target.user_id, version, target.id, service_name))
+
+@event.listens_for(PasswordEntry, 'after_insert')
+def _entry_inserted(mapper, connection, target):
+    _record_change(target, target.service_name)
+
+@event.listens_for(PasswordEntry, 'after_update')
+def _entry_updated(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    if attrs.deleted_at.history.has_changes():
+        # Entries leave the index when trashed and come back when restored
+        _record_change(target, None if target.deleted_at else target.service_name)
+    elif attrs.service_name.history.has_changes():
+        _record_change(target, target.service_name)
+
+@event.listens_for(PasswordEntry, 'after_delete')
+def _entry_deleted(mapper, connection, target):
+    _record_change(target, None)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for user_id, version, entry_id, service_name in session.info.pop(_PENDING_KEY, ()):
+        with _indexes_lock:
+            index = _indexes.get(user_id)
+        if index is None:
+            continue
+
+        with index.lock:
+            if index.version == version - 1:
+                if service_name is None:
+                    index.remove(entry_id)
+                else:
+                    index.add(entry_id, service_name)
+                index.version = version
+                continue
+
+        # Another worker wrote in between; rebuild on next lookup
+        with _indexes_lock:
+            _indexes.pop(user_id, None)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -9,6 +9,20 @@ from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
+from utils.strength import estimate_strength
+
+SYMBOLS = "!@#$%^&*()_+-=[]{}|;:,.<>?"
+
+# Maps every character to its class letter (l, u, d, s); anything else becomes 'o'
+_CLASS_TABLE = {code: 'o' for code in range(128)}
+_CLASS_TABLE.update({ord(c): 'l' for c in string.ascii_lowercase})
+_CLASS_TABLE.update({ord(c): 'u' for c in string.ascii_uppercase})
+_CLASS_TABLE.update({ord(c): 'd' for c in string.digits})
+_CLASS_TABLE.update({ord(c): 's' for c in SYMBOLS})
+
+def character_classes(password: str) -> set:
+    """Classes present in a password ('l', 'u', 'd', 's'), found in a single pass"""
+    return set(password.translate(_CLASS_TABLE))
 
 class PasswordEncryption:
     """Handle password encryption and decryption for password entries"""
@@ -26,16 +40,18 @@ class PasswordEncryption:
         return key
     
     @staticmethod
-    def encrypt_password(password: str, user_id: int) -> str:
+    def get_cipher(user_id: int) -> Fernet:
         """
-        Encrypt a password using user-specific key derivation
+        Build the Fernet cipher for a user's password entries
+        
+        Key derivation is deliberately slow, so code handling many entries
+        should build the cipher once and pass it to encrypt/decrypt.
         
         Args:
-            password: Plain text password to encrypt
             user_id: User ID for salt generation
             
         Returns:
-            Base64 encoded encrypted password with salt
+            Fernet cipher keyed for the user
         """
         # Generate salt based on user_id for consistency
         salt = f"user_{user_id}_salt".encode()[:16].ljust(16, b'0')
@@ -44,8 +60,22 @@ class PasswordEncryption:
         master_key = os.environ.get('MASTER_KEY', 'default-master-key-change-in-production')
         key = PasswordEncryption._derive_key(master_key, salt)
         
-        # Create Fernet cipher
-        fernet = Fernet(key)
+        return Fernet(key)
+    
+    @staticmethod
+    def encrypt_password(password: str, user_id: int, cipher: Fernet = None) -> str:
+        """
+        Encrypt a password using user-specific key derivation
+        
+        Args:
+            password: Plain text password to encrypt
+            user_id: User ID for salt generation
+            cipher: Previously built cipher for this user (optional)
+            
+        Returns:
+            Base64 encoded encrypted password with salt
+        """
+        fernet = cipher or PasswordEncryption.get_cipher(user_id)
         
         # Encrypt password
         encrypted_password = fernet.encrypt(password.encode())
@@ -54,27 +84,21 @@ class PasswordEncryption:
         return base64.urlsafe_b64encode(encrypted_password).decode()
     
     @staticmethod
-    def decrypt_password(encrypted_password: str, user_id: int) -> str:
+    def decrypt_password(encrypted_password: str, user_id: int, cipher: Fernet = None) -> str:
         """
         Decrypt a password using user-specific key derivation
         
         Args:
             encrypted_password: Base64 encoded encrypted password
             user_id: User ID for salt generation
+            cipher: Previously built cipher for this user (optional)
             
         Returns:
             Decrypted plain text password
         """
         try:
-            # Generate same salt as encryption
-            salt = f"user_{user_id}_salt".encode()[:16].ljust(16, b'0')
-            
-            # Derive same key
-            master_key = os.environ.get('MASTER_KEY', 'default-master-key-change-in-production')
-            key = PasswordEncryption._derive_key(master_key, salt)
-            
-            # Create Fernet cipher
-            fernet = Fernet(key)
+            # Derive same key (unless the caller already has the cipher)
+            fernet = cipher or PasswordEncryption.get_cipher(user_id)
             
             # Decode and decrypt
             encrypted_bytes = base64.urlsafe_b64decode(encrypted_password.encode())
@@ -106,7 +130,7 @@ class PasswordGenerator:
         lowercase = string.ascii_lowercase
         uppercase = string.ascii_uppercase
         digits = string.digits
-        symbols = "!@#$%^&*()_+-=[]{}|;:,.<>?" if include_symbols else ""
+        symbols = SYMBOLS if include_symbols else ""
         
         # Ensure at least one character from each required set
         password = [
@@ -129,50 +153,30 @@ class PasswordGenerator:
         return ''.join(password)
     
     @staticmethod
-    def check_password_strength(password: str) -> dict:
+    def check_password_strength(password: str, user_inputs=()) -> dict:
         """
         Check password strength and return analysis
         
+        The score (0-4) comes from the number of guesses an attacker would
+        need, estimated from dictionary words, keyboard walks, repeats,
+        sequences and dates (see utils.strength).
+        
         Args:
             password: Password to analyze
+            user_inputs: Strings tied to the user, such as their email
             
         Returns:
             Dictionary with strength analysis
         """
+        classes = character_classes(password)
         analysis = {
             'length': len(password),
-            'has_lowercase': any(c.islower() for c in password),
-            'has_uppercase': any(c.isupper() for c in password),
-            'has_digits': any(c.isdigit() for c in password),
-            'has_symbols': any(c in "!@#$%^&*()_+-=[]{}|;:,.<>?" for c in password),
-            'score': 0,
-            'strength': 'Very Weak'
+            'has_lowercase': 'l' in classes,
+            'has_uppercase': 'u' in classes,
+            'has_digits': 'd' in classes,
+            'has_symbols': 's' in classes,
         }
-        
-        # Calculate strength score
-        if analysis['length'] >= 8:
-            analysis['score'] += 1
-        if analysis['length'] >= 12:
-            analysis['score'] += 1
-        if analysis['has_lowercase']:
-            analysis['score'] += 1
-        if analysis['has_uppercase']:
-            analysis['score'] += 1
-        if analysis['has_digits']:
-            analysis['score'] += 1
-        if analysis['has_symbols']:
-            analysis['score'] += 1
-        
-        # Determine strength level
-        if analysis['score'] >= 5:
-            analysis['strength'] = 'Strong'
-        elif analysis['score'] >= 4:
-            analysis['strength'] = 'Good'
-        elif analysis['score'] >= 3:
-            analysis['strength'] = 'Fair'
-        elif analysis['score'] >= 2:
-            analysis['strength'] = 'Weak'
-        
+        analysis.update(estimate_strength(password, user_inputs))
         return analysis
 
 def generate_csrf_token() -> str:
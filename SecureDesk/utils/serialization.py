@@ -0,0 +1,26 @@
+"""
+Fast JSON encoding for API responses
+
+Uses ``orjson`` when installed (several times faster than the standard
+library and native datetime support); otherwise ``json`` with compact
+separators and ISO 8601 datetimes, producing the same documents.
+"""
+
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library
+    orjson = None
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value) -> bytes:
+    """Encode a value as compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
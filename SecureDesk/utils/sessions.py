@@ -0,0 +1,212 @@
+"""
+Server-side sessions stored in the database behind a compact session-id cookie
+
+The cookie holds only a random session id. Session data is fetched on first
+access (together with the logged-in user, so Flask-Login needs no extra query)
+and written back only when it changed or its expiry needs extending.
+"""
+
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from flask import session as current_session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from flask_login import user_logged_in
+from models import db, User, ServerSession
+from utils.background import register_worker
+
+_serializer = TaggedJSONSerializer()
+
+def _hash_sid(sid: str) -> str:
+    return hashlib.sha256(sid.encode()).hexdigest()
+
+class LazySession(SessionMixin):
+    """Session mapping that is only loaded from the database when first used"""
+
+    def __init__(self, sid: str = None, loader=None):
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        # Set by the loader: user row fetched alongside the session, stored expiry
+        self.user = None
+        self.expires_at = None
+        self.previous_sid = None
+        self._loader = loader
+        self._data = None if loader else {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def _mapping(self) -> dict:
+        self.accessed = True
+        if self._data is None:
+            self._data = self._loader(self)
+        return self._data
+
+    def __getitem__(self, key):
+        return self._mapping()[key]
+
+    def __setitem__(self, key, value):
+        self._mapping()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._mapping()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._mapping())
+
+    def __len__(self):
+        return len(self._mapping())
+
+    def clear(self):
+        self._data = {}
+        self.accessed = True
+        self.modified = True
+
+    def regenerate(self):
+        """Move the session data to a fresh id (prevents session fixation)"""
+        self._mapping()
+        if self.sid is not None:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.new = True
+        self.modified = True
+
+class DatabaseSessionInterface(SessionInterface):
+    """Flask session interface backed by the ``sessions`` table"""
+
+    # An unmodified session's expiry is pushed back at most this often
+    refresh_interval = timedelta(minutes=1)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or len(sid) > 128:
+            return LazySession()
+        return LazySession(sid, loader=self._load)
+
+    def _load(self, session) -> dict:
+        row = db.session.execute(
+            db.select(ServerSession.data, ServerSession.expires_at, User)
+            .outerjoin(User, User.id == ServerSession.user_id)
+            .where(
+                ServerSession.id == _hash_sid(session.sid),
+                ServerSession.expires_at > datetime.utcnow()
+            )
+        ).first()
+
+        if row is None:
+            # Unknown, expired or revoked: continue under a brand new id
+            session.sid = None
+            session.new = True
+            return {}
+
+        data, session.expires_at, session.user = row
+        try:
+            return _serializer.loads(data)
+        except ValueError:
+            return {}
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.loaded:
+            return
+
+        cookie = {
+            'domain': self.get_cookie_domain(app),
+            'path': self.get_cookie_path(app),
+            'secure': self.get_cookie_secure(app),
+            'samesite': self.get_cookie_samesite(app),
+            'httponly': self.get_cookie_httponly(app),
+        }
+        name = self.get_cookie_name(app)
+        now = datetime.utcnow()
+        expires_at = now + app.permanent_session_lifetime
+        table = ServerSession.__table__
+
+        if session.previous_sid:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.id == _hash_sid(session.previous_sid)))
+
+        if not session:
+            if session.modified and session.sid:
+                with db.engine.begin() as conn:
+                    conn.execute(table.delete().where(table.c.id == _hash_sid(session.sid)))
+                response.delete_cookie(name, **cookie)
+            return
+
+        if session.modified or session.new:
+            user_id = session.get('_user_id')
+            values = {
+                'data': _serializer.dumps(dict(session)),
+                'user_id': int(user_id) if user_id else None,
+                'expires_at': expires_at,
+                'updated_at': now,
+            }
+            with db.engine.begin() as conn:
+                updated = 0
+                if not session.new:
+                    updated = conn.execute(
+                        table.update().where(table.c.id == _hash_sid(session.sid)).values(**values)
+                    ).rowcount
+                if not updated:
+                    session.sid = session.sid or secrets.token_urlsafe(32)
+                    conn.execute(table.insert().values(id=_hash_sid(session.sid), **values))
+
+        elif session.expires_at and expires_at - session.expires_at > self.refresh_interval:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    table.update().where(table.c.id == _hash_sid(session.sid)).values(expires_at=expires_at)
+                )
+            if not session.permanent:
+                return
+        else:
+            return
+
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session), **cookie)
+
+def revoke_user_sessions(user_id: int) -> int:
+    """
+    Delete every server-side session belonging to a user (logout everywhere)
+
+    Returns:
+        Number of sessions revoked
+    """
+    table = ServerSession.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(table.delete().where(table.c.user_id == user_id)).rowcount
+
+def sweep_expired_sessions(batch_size: int = 500) -> int:
+    """
+    Delete expired sessions in small batches to keep write locks short
+
+    Returns:
+        Number of sessions deleted
+    """
+    table = ServerSession.__table__
+    now = datetime.utcnow()
+    deleted = 0
+    while True:
+        expired = db.select(table.c.id).where(table.c.expires_at <= now).limit(batch_size)
+        with db.engine.begin() as conn:
+            count = conn.execute(table.delete().where(table.c.id.in_(expired))).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+def _regenerate_on_login(sender, user, **extra):
+    if isinstance(current_session._get_current_object(), LazySession):
+        current_session.regenerate()
+
+def init_sessions(app):
+    """Install the database session interface and its expiry sweeper"""
+    if app.config.get('SESSION_BACKEND', 'database') != 'database':
+        return
+    app.session_interface = DatabaseSessionInterface()
+    user_logged_in.connect(_regenerate_on_login, app)
+    register_worker(app, 'session-sweeper', app.config.get('SESSION_SWEEP_INTERVAL', 300), sweep_expired_sessions)
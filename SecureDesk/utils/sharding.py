@@ -0,0 +1,412 @@
+"""
+Horizontal sharding of user data across several databases
+
+Shards are the ``SQLALCHEMY_BINDS`` whose key starts with ``shard``. Each
+user's notes (with their chunks and revisions) and password entries live in
+exactly one of them; accounts, sessions, tags, attachments and jobs stay on
+the primary.
+
+Placement: a consistent-hash ring picks the shard of a new user, and the
+choice is pinned in the ``shard_directory`` table on the primary. Users
+without a directory entry (created before sharding was enabled) still have
+their data on the primary. Because the directory, not the ring, is the
+source of truth, adding a shard moves nobody until ``rebalance()`` moves the
+roughly 1/N of users the ring now places elsewhere.
+
+Routing: ``RoutingSession`` asks ``_route`` for the engine of every query.
+Queries on sharded tables go to the shard of the user set with
+``use_user_shard()`` or, inside a request, of ``current_user``. Queries span
+a single user; a transaction that writes to the primary and a shard commits
+on each separately.
+
+Row ids stay unique across shards so that moved rows keep their ids (tags
+and attachments on the primary refer to them): each shard hands out ids from
+its own range of ``SHARD_ID_STRIDE`` values, reserved in blocks from its
+``shard_id_blocks`` table within the writing transaction.
+"""
+
+import time
+import bisect
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+import click
+from flask import g, current_app, has_app_context, has_request_context
+from flask.cli import AppGroup
+from flask_login import current_user
+from sqlalchemy import event, inspect, select, tuple_, MetaData, Table, Column, String, BigInteger
+from sqlalchemy.orm import object_session
+from sqlalchemy.sql import Select
+from werkzeug.exceptions import ServiceUnavailable
+from models import db, User, Note, NoteRevision, PasswordEntry, ShardDirectory
+from utils.replication import RoutingSession
+
+SHARD_PREFIX = 'shard'
+# Parents before children: copies insert in this order and delete in reverse
+SHARDED_TABLES = ('notes', 'note_chunks', 'note_revisions', 'password_entries')
+# Points per shard on the hash ring; more points spread users more evenly
+VNODES = 64
+# Shard N allocates ids in [(N + 1) * STRIDE, (N + 2) * STRIDE); the primary keeps ids below STRIDE
+SHARD_ID_STRIDE = 1 << 40
+ID_BLOCK = 100
+
+_ID_BLOCKS_KEY = 'shard_id_blocks'
+
+_metadata = MetaData()
+id_blocks = Table(
+    'shard_id_blocks', _metadata,
+    Column('table_name', String(50), primary_key=True),
+    Column('next_id', BigInteger, nullable=False),
+)
+
+_scope = ContextVar('shard_scope', default=None)
+
+class ShardMoving(ServiceUnavailable):
+    """Write attempted while the user's data is being moved to another shard"""
+    description = "Your data is being moved to another server. Please try again in a few seconds."
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """Consistent-hash ring mapping user ids onto shard keys"""
+
+    def __init__(self, keys, vnodes: int = VNODES):
+        points = sorted((_hash(f'{key}#{i}'), key) for key in keys for i in range(vnodes))
+        if not points:
+            raise ValueError("Hash ring needs at least one shard")
+        self._hashes = [h for h, _ in points]
+        self._keys = [key for _, key in points]
+
+    def shard_for(self, user_id: int) -> str:
+        """Shard key the ring places a user on"""
+        i = bisect.bisect(self._hashes, _hash(str(user_id))) % len(self._hashes)
+        return self._keys[i]
+
+class ShardMap:
+    """Shard engines of an app, the ring over them and directory access"""
+
+    def __init__(self, engines: dict, primary):
+        self.engines = engines
+        self.primary = primary
+        self.ring = HashRing(engines)
+        self._keys_by_engine = {id(engine): key for key, engine in engines.items()}
+
+    def key_of(self, engine):
+        """Shard key of an engine, or None for any other database"""
+        return self._keys_by_engine.get(id(engine))
+
+    def engine(self, key):
+        """Engine holding the data of a shard key (None: the primary)"""
+        return self.engines[key] if key else self.primary
+
+    def entry(self, session, user_id: int) -> tuple:
+        """
+        (shard key, locked) of a user, cached for the request or scope
+
+        Read through the session's own primary connection so the lookup also
+        works in the middle of a flush.
+        """
+        cache = _entry_cache()
+        if cache is not None and user_id in cache:
+            return cache[user_id]
+        directory = ShardDirectory.__table__
+        connection = session.connection(bind_arguments={'mapper': inspect(ShardDirectory)})
+        row = connection.execute(
+            select(directory.c.shard, directory.c.locked).where(directory.c.user_id == user_id)
+        ).first()
+        entry = (row.shard, row.locked) if row else (None, False)
+        if cache is not None:
+            cache[user_id] = entry
+        return entry
+
+    def current_key(self, user_id: int):
+        """Shard key of a user read straight from the primary (None: the primary)"""
+        directory = ShardDirectory.__table__
+        with self.primary.connect() as connection:
+            return connection.execute(
+                select(directory.c.shard).where(directory.c.user_id == user_id)
+            ).scalar()
+
+    def set_entry(self, user_id: int, key, locked: bool = False):
+        """Point a user's directory entry at a shard"""
+        directory = ShardDirectory.__table__
+        with self.primary.begin() as connection:
+            updated = connection.execute(
+                directory.update().where(directory.c.user_id == user_id).values(shard=key, locked=locked)
+            ).rowcount
+            if not updated:
+                connection.execute(directory.insert().values(user_id=user_id, shard=key, locked=locked))
+
+    def next_id(self, session, connection, key: str, table: str) -> int:
+        """Next id for a row of ``table`` inserted on shard ``key``"""
+        blocks = session.info.setdefault(_ID_BLOCKS_KEY, {})
+        next_id, end = blocks.get((key, table), (0, 0))
+        if next_id == end:
+            # The reservation commits or rolls back with the rows using it
+            connection.execute(
+                id_blocks.update().where(id_blocks.c.table_name == table)
+                .values(next_id=id_blocks.c.next_id + ID_BLOCK)
+            )
+            end = connection.execute(
+                select(id_blocks.c.next_id).where(id_blocks.c.table_name == table)
+            ).scalar_one()
+            next_id = end - ID_BLOCK
+        blocks[(key, table)] = (next_id + 1, end)
+        return next_id
+
+def get_shards():
+    """ShardMap of the current app, or None when sharding is off"""
+    return current_app.extensions.get('shards')
+
+def all_engines() -> list:
+    """Engines that can hold sharded tables: the primary and every shard"""
+    shards = get_shards()
+    return [db.engine] + (list(shards.engines.values()) if shards is not None else [])
+
+def _entry_cache():
+    scope = _scope.get()
+    if scope is not None:
+        return scope[1]
+    if has_request_context():
+        return g.setdefault('shard_entries', {})
+    return None
+
+@contextmanager
+def use_user_shard(user_id: int):
+    """Route sharded queries by ``user_id`` (for code running outside that user's request)"""
+    token = _scope.set((user_id, {}))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def routing_user_id():
+    """User whose shard sharded queries go to"""
+    scope = _scope.get()
+    if scope is not None:
+        return scope[0]
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.id
+    return None
+
+def _is_sharded(mapper, clause) -> bool:
+    if mapper is not None:
+        return inspect(mapper).local_table.name in SHARDED_TABLES
+    table = getattr(clause, 'table', None)
+    if table is not None:
+        return getattr(table, 'name', None) in SHARDED_TABLES
+    if isinstance(clause, Select):
+        return any(getattr(table, 'name', None) in SHARDED_TABLES for table in clause.get_final_froms())
+    return False
+
+def _route(session, mapper, clause):
+    """Engine of the routing user's shard for queries on sharded tables"""
+    shards = get_shards()
+    if shards is None or not _is_sharded(mapper, clause):
+        return None
+    user_id = routing_user_id()
+    if user_id is None:
+        raise RuntimeError("Sharded query without a user; wrap it in use_user_shard()")
+    key, locked = shards.entry(session, user_id)
+    if locked and (session._flushing or getattr(clause, 'is_dml', False)):
+        raise ShardMoving(retry_after=max(1, round(current_app.config.get('SHARD_LOCK_GRACE', 2))))
+    return shards.engines[key] if key else None
+
+RoutingSession.routers.append(_route)
+
+@event.listens_for(User, 'after_insert')
+def _pin_new_user(mapper, connection, target):
+    shards = get_shards() if has_app_context() else None
+    if shards is not None:
+        connection.execute(ShardDirectory.__table__.insert().values(
+            user_id=target.id, shard=shards.ring.shard_for(target.id), locked=False
+        ))
+
+def _assign_id(mapper, connection, target):
+    shards = get_shards() if has_app_context() else None
+    if shards is None or target.id is not None:
+        return
+    key = shards.key_of(connection.engine)
+    if key is not None:
+        target.id = shards.next_id(object_session(target), connection, key, mapper.local_table.name)
+
+for _model in (Note, NoteRevision, PasswordEntry):
+    event.listen(_model, 'before_insert', _assign_id)
+
+@event.listens_for(RoutingSession, 'after_commit')
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _forget_id_blocks(session, *args):
+    session.info.pop(_ID_BLOCKS_KEY, None)
+
+def _tables() -> list:
+    return [db.metadata.tables[name] for name in SHARDED_TABLES]
+
+def _user_filter(table, user_id: int):
+    if 'user_id' in table.c:
+        return table.c.user_id == user_id
+    notes = db.metadata.tables['notes']
+    return table.c.note_id.in_(select(notes.c.id).where(notes.c.user_id == user_id))
+
+def _key_filter(table, keys: list):
+    columns = list(table.primary_key.columns)
+    if len(columns) == 1:
+        return columns[0].in_([key[0] for key in keys])
+    return tuple_(*columns).in_(keys)
+
+def _digest(row) -> bytes:
+    return hashlib.blake2b(repr(tuple(row)).encode(), digest_size=16).digest()
+
+def _sync_table(source, target, table, user_id: int, batch_size: int) -> list:
+    """
+    Make the target's copy of a user's rows match the source's
+
+    Rows are compared by a hash of their values, so a repeated sync only
+    writes what changed since the last one. Returns the keys of target rows
+    that no longer exist in the source, for the caller to delete.
+    """
+    width = len(table.primary_key.columns)
+    where = _user_filter(table, user_id)
+    existing = {tuple(row[:width]): _digest(row) for row in target.execute(select(table).where(where))}
+
+    def flush(changed, stale):
+        if stale:
+            target.execute(table.delete().where(_key_filter(table, stale)))
+        if changed:
+            target.execute(table.insert(), changed)
+
+    changed, stale = [], []
+    rows = source.execution_options(yield_per=batch_size).execute(select(table).where(where))
+    for row in rows:
+        key = tuple(row[:width])
+        digest = existing.pop(key, None)
+        if digest == _digest(row):
+            continue
+        if digest is not None:
+            stale.append(key)
+        changed.append(row._asdict())
+        if len(changed) >= batch_size:
+            flush(changed, stale)
+            changed, stale = [], []
+    flush(changed, stale)
+    return list(existing)
+
+def _sync_user(source_engine, target_engine, user_id: int, batch_size: int):
+    with source_engine.connect() as source, target_engine.begin() as target:
+        removed = [(table, _sync_table(source, target, table, user_id, batch_size)) for table in _tables()]
+        # Children go first so their filter still sees the notes they belonged to
+        for table, keys in reversed(removed):
+            for i in range(0, len(keys), batch_size):
+                target.execute(table.delete().where(_key_filter(table, keys[i:i + batch_size])))
+
+def _delete_user_rows(engine, user_id: int):
+    with engine.begin() as connection:
+        for table in reversed(_tables()):
+            connection.execute(table.delete().where(_user_filter(table, user_id)))
+
+def move_user(user_id: int, target: str, batch_size: int = 500, grace: float = None) -> bool:
+    """
+    Move a user's data to another shard while they keep using the app
+
+    1. Copy every row while the user reads and writes as usual.
+    2. Lock the directory entry: writes now fail with ``ShardMoving`` (503
+       with Retry-After) while reads continue. After ``grace`` seconds, which
+       lets requests that saw the unlocked entry commit, copy what changed
+       during step 1.
+    3. Point the entry at the target and unlock it.
+    4. After another ``grace`` period for in-flight reads, delete the old copy.
+
+    Args:
+        user_id: User to move
+        target: Destination shard key
+        batch_size: Rows per read and insert batch
+        grace: Seconds to wait for in-flight requests (default: SHARD_LOCK_GRACE)
+
+    Returns:
+        False if the user already lives on ``target``
+    """
+    shards = get_shards()
+    if shards is None or target not in shards.engines:
+        raise ValueError(f"Unknown shard: {target}")
+    if grace is None:
+        grace = current_app.config.get('SHARD_LOCK_GRACE', 2)
+
+    source = shards.current_key(user_id)
+    if source == target:
+        return False
+    source_engine, target_engine = shards.engine(source), shards.engines[target]
+
+    _sync_user(source_engine, target_engine, user_id, batch_size)
+    shards.set_entry(user_id, source, locked=True)
+    try:
+        time.sleep(grace)
+        _sync_user(source_engine, target_engine, user_id, batch_size)
+        shards.set_entry(user_id, target)
+    except BaseException:
+        shards.set_entry(user_id, source)
+        _delete_user_rows(target_engine, user_id)
+        raise
+
+    time.sleep(grace)
+    _delete_user_rows(source_engine, user_id)
+    return True
+
+def rebalance(limit: int = None, **kwargs) -> list:
+    """
+    Move users whose shard differs from their place on the ring
+
+    Run after adding a shard (or to migrate users still on the primary).
+    Returns (user_id, old shard, new shard) for every user moved.
+    """
+    shards = get_shards()
+    directory = ShardDirectory.__table__
+    with shards.primary.connect() as connection:
+        placed = dict(connection.execute(select(directory.c.user_id, directory.c.shard)).all())
+        user_ids = connection.execute(select(User.__table__.c.id).order_by(User.__table__.c.id)).scalars().all()
+
+    moved = []
+    for user_id in user_ids:
+        target = shards.ring.shard_for(user_id)
+        if placed.get(user_id) != target:
+            if limit is not None and len(moved) >= limit:
+                break
+            move_user(user_id, target, **kwargs)
+            moved.append((user_id, placed.get(user_id), target))
+    return moved
+
+shards_cli = AppGroup('shards', help="Inspect and rebalance user shards.")
+
+@shards_cli.command('move')
+@click.argument('user_id', type=int)
+@click.argument('shard')
+def move_command(user_id, shard):
+    """Move one user's data to SHARD."""
+    moved = move_user(user_id, shard)
+    click.echo(f"Moved user {user_id} to {shard}" if moved else f"User {user_id} is already on {shard}")
+
+@shards_cli.command('rebalance')
+@click.option('--limit', type=int, help="Move at most this many users.")
+def rebalance_command(limit):
+    """Move users to the shard the hash ring places them on."""
+    for user_id, source, target in rebalance(limit=limit):
+        click.echo(f"Moved user {user_id} from {source or 'primary'} to {target}")
+
+def init_sharding(app):
+    """Create the sharded tables on every shard and enable routing to them"""
+    app.cli.add_command(shards_cli)
+    keys = [key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith(SHARD_PREFIX)]
+    if not keys:
+        return
+
+    with app.app_context():
+        engines = {key: db.engines[key] for key in keys}
+        for key, engine in engines.items():
+            db.metadata.create_all(engine, tables=_tables())
+            _metadata.create_all(engine)
+            base = (int(key[len(SHARD_PREFIX):]) + 1) * SHARD_ID_STRIDE
+            with engine.begin() as connection:
+                known = set(connection.execute(select(id_blocks.c.table_name)).scalars())
+                for table in _tables():
+                    if 'id' in table.c and table.name not in known:
+                        connection.execute(id_blocks.insert().values(table_name=table.name, next_id=base))
+        app.extensions['shards'] = ShardMap(engines, db.engines[None])
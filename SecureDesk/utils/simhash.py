@@ -0,0 +1,106 @@
+"""
+SimHash fingerprints for near-duplicate note detection
+
+A note's fingerprint is the 64-bit SimHash of its word bigrams. Notes whose
+fingerprints differ in at most ``MAX_DISTANCE`` bits are treated as near
+duplicates. The fingerprint is split into four 16-bit bands stored in
+indexed columns: by the pigeonhole principle two fingerprints within three
+bits of each other agree on at least one band, so candidates are found with
+four index lookups instead of a scan over every note.
+"""
+
+import re
+import hashlib
+from collections import Counter
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+MAX_DISTANCE = BANDS - 1
+# Only the start of very large notes is fingerprinted
+MAX_TEXT = 64 * 1024
+
+_MASK = (1 << BITS) - 1
+_WORD = re.compile(r'\w+')
+
+# Per-bit counters are packed into 16-bit lanes of one big integer, so adding
+# a feature is a single addition instead of a loop over its 64 bits. A text of
+# MAX_TEXT characters has fewer than 2 ** 15 words, so lanes cannot overflow.
+_LANE = 16
+_SPREAD = [sum((byte >> i & 1) << (i * _LANE) for i in range(8)) for byte in range(256)]
+
+def _spread_hash(feature: str) -> int:
+    digest = hashlib.blake2b(feature.encode(), digest_size=BITS // 8).digest()
+    return sum(_SPREAD[byte] << (i * 8 * _LANE) for i, byte in enumerate(digest))
+
+def fingerprint(text: str) -> int:
+    """64-bit SimHash of a text's word bigrams (unsigned)"""
+    words = _WORD.findall(text[:MAX_TEXT].lower())
+    if len(words) > 1:
+        features = Counter(f'{a} {b}' for a, b in zip(words, words[1:]))
+    else:
+        features = Counter(words)
+    if not features:
+        return 0
+
+    counts = sum(_spread_hash(feature) * weight for feature, weight in features.items())
+    total = sum(features.values())
+    lane_mask = (1 << _LANE) - 1
+    result = 0
+    for bit in range(BITS):
+        # A bit is set when the features having it outweigh those that do not
+        if 2 * (counts >> (bit * _LANE) & lane_mask) > total:
+            result |= 1 << bit
+    return result
+
+def bands(value: int) -> list:
+    """Split a fingerprint into its BANDS band values"""
+    return [(value >> (i * BAND_BITS)) & ((1 << BAND_BITS) - 1) for i in range(BANDS)]
+
+def distance(a: int, b: int) -> int:
+    """Number of differing bits between two fingerprints"""
+    return ((a ^ b) & _MASK).bit_count()
+
+def to_signed(value: int) -> int:
+    """Store an unsigned 64-bit fingerprint in a signed INTEGER column"""
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+def to_unsigned(value: int) -> int:
+    return value & _MASK
+
+def group_near_duplicates(items) -> list:
+    """
+    Group fingerprints into clusters of near duplicates
+
+    Candidate pairs come from shared band values, so the cost grows with the
+    number of colliding pairs rather than with the square of the item count.
+
+    Args:
+        items: Iterable of (id, unsigned fingerprint) pairs
+
+    Returns:
+        Lists of ids with two or more members, each list sorted
+    """
+    items = list(items)
+    parent = {item_id: item_id for item_id, _ in items}
+
+    def find(item_id):
+        while parent[item_id] != item_id:
+            parent[item_id] = parent[parent[item_id]]
+            item_id = parent[item_id]
+        return item_id
+
+    for band in range(BANDS):
+        buckets = {}
+        for item_id, value in items:
+            buckets.setdefault(bands(value)[band], []).append((item_id, value))
+        for bucket in buckets.values():
+            for i, (a, value_a) in enumerate(bucket):
+                for b, value_b in bucket[i + 1:]:
+                    if distance(value_a, value_b) <= MAX_DISTANCE:
+                        parent[find(a)] = find(b)
+
+    groups = {}
+    for item_id, _ in items:
+        groups.setdefault(find(item_id), []).append(item_id)
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
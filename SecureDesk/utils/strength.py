@@ -0,0 +1,436 @@
+"""
+Password strength estimation from guessable patterns
+
+Instead of counting character classes, a password is split into the
+cheapest sequence of patterns an attacker would try: common passwords and
+dictionary words (also reversed, capitalized or with l33t substitutions),
+keyboard walks, repeats, sequences and dates, with brute force for whatever
+is left. The estimate is the number of guesses that sequence needs.
+
+Dictionaries are ranked word lists compiled into a flat trie. The compiled
+file is written once under the instance folder and memory-mapped, so every
+worker process reads the same pages instead of building its own copy.
+"""
+
+import os
+import re
+import math
+import mmap
+import struct
+import hashlib
+import tempfile
+from array import array
+from datetime import date
+from functools import lru_cache
+from flask import current_app, has_app_context
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+# Dictionary name -> ranked word list (most common first)
+DICTIONARIES = {
+    'passwords': os.path.join(DATA_DIR, 'passwords.txt'),
+    'english': os.path.join(DATA_DIR, 'words.txt'),
+}
+
+# Minimum log10(guesses) for scores 1 to 4
+SCORE_THRESHOLDS = (3, 6, 8, 10)
+STRENGTH_LABELS = ('Very Weak', 'Weak', 'Fair', 'Good', 'Strong')
+# Only this many characters are matched against patterns; the rest count as brute force
+MAX_CHECKED = 64
+
+_TRIE_HEADER = struct.Struct('<4sI')  # magic, node count
+_TRIE_MAGIC = b'TRI1'
+_BYTES = [bytes((i,)) for i in range(128)]
+
+def compile_trie(words) -> bytes:
+    """
+    Compile ranked ASCII words into the flat trie format
+
+    Nodes are numbered breadth first so the children of a node are
+    contiguous and sorted by label. The file holds four parallel arrays in
+    native byte order (it is a per-machine cache): word rank (0 when no word
+    ends at the node), first child, child count and label.
+    """
+    root = {}
+    for rank, word in enumerate(words, 1):
+        node = root
+        for byte in word.encode('ascii'):
+            node = node.setdefault(byte, {})
+        node.setdefault(None, rank)
+
+    nodes = [root]
+    labels = bytearray(1)
+    ranks = array('I', [0])
+    first = array('I')
+    counts = array('H')
+    for node in nodes:
+        keys = sorted(key for key in node if key is not None)
+        first.append(len(labels))
+        counts.append(len(keys))
+        for key in keys:
+            nodes.append(node[key])
+            labels.append(key)
+            ranks.append(node[key].get(None, 0))
+    return b''.join([_TRIE_HEADER.pack(_TRIE_MAGIC, len(nodes)),
+                     ranks.tobytes(), first.tobytes(), counts.tobytes(), bytes(labels)])
+
+class Trie:
+    """Read-only view of a compiled trie held in bytes or a memory map"""
+
+    def __init__(self, buffer):
+        magic, count = _TRIE_HEADER.unpack_from(buffer)
+        if magic != _TRIE_MAGIC:
+            raise ValueError("Not a compiled trie")
+        view = memoryview(buffer)
+        offset = _TRIE_HEADER.size
+        self._ranks = view[offset:offset + 4 * count].cast('I')
+        offset += 4 * count
+        self._first = view[offset:offset + 4 * count].cast('I')
+        offset += 4 * count
+        self._counts = view[offset:offset + 2 * count].cast('H')
+        self._labels = offset + 2 * count
+        self._buffer = buffer
+
+    def prefixes(self, text: str, start: int = 0):
+        """Yield (end, rank) for every word equal to text[start:end]"""
+        node = 0
+        for end in range(start, len(text)):
+            code = ord(text[end])
+            if code >= 128:
+                return
+            low = self._labels + self._first[node]
+            found = self._buffer.find(_BYTES[code], low, low + self._counts[node])
+            if found < 0:
+                return
+            node = found - self._labels
+            if self._ranks[node]:
+                yield end + 1, self._ranks[node]
+
+def _read_words(path):
+    with open(path, encoding='utf-8') as f:
+        words = (line.strip().lower() for line in f)
+        return [word for word in words if word and word.isascii()]
+
+def load_trie(path: str, cache_dir: str = None) -> Trie:
+    """
+    Trie of a ranked word list, memory-mapped from cache_dir when given
+
+    The compiled file is named after a hash of the source list, so editing
+    the list produces a new file and concurrent workers never see a partial
+    one (it is renamed into place).
+    """
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    if cache_dir is None:
+        return Trie(compile_trie(_read_words(path)))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    compiled = os.path.join(cache_dir, f'{name}-{digest}.trie')
+    if not os.path.exists(compiled):
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compile_trie(_read_words(path)))
+        os.replace(tmp, compiled)
+    with open(compiled, 'rb') as f:
+        return Trie(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+# --- Pattern tables ---------------------------------------------------------
+
+_L33T = str.maketrans({'4': 'a', '@': 'a', '8': 'b', '(': 'c', '{': 'c', '3': 'e', '6': 'g',
+                       '9': 'g', '1': 'i', '!': 'i', '|': 'l', '0': 'o', '$': 's', '5': 's',
+                       '7': 't', '+': 't', '2': 'z', '%': 'x'})
+
+def _layout(rows, offsets, diagonal):
+    """Key -> (row, x) positions and adjacency test for a keyboard layout"""
+    positions = {}
+    for r, (row_keys, offset) in enumerate(zip(rows, offsets)):
+        for variant in row_keys:
+            for c, key in enumerate(variant):
+                if key != ' ':
+                    positions[key] = (r, c + offset)
+
+    def adjacent(a, b):
+        (ra, xa), (rb, xb) = positions[a], positions[b]
+        if ra == rb:
+            return abs(xa - xb) == 1
+        return abs(ra - rb) == 1 and abs(xa - xb) <= (1 if diagonal else 0.75)
+
+    keys = {key for row in rows for key in row[0] if key != ' '}
+    degree = sum(adjacent(a, b) for a in keys for b in keys if a != b) / len(keys)
+    return positions, adjacent, len(keys), degree
+
+_KEYBOARDS = {
+    'qwerty': _layout(
+        [('`1234567890-=', '~!@#$%^&*()_+'), ('qwertyuiop[]\\', 'QWERTYUIOP{}|'),
+         ("asdfghjkl;'", 'ASDFGHJKL:"'), ('zxcvbnm,./', 'ZXCVBNM<>?')],
+        [0, 1.5, 1.75, 2.25], diagonal=False),
+    'keypad': _layout([(' /*-',), ('789+',), ('456',), ('123',), ('0 .',)], [0] * 5, diagonal=True),
+}
+_SHIFTED = set('~!@#$%^&*()_+QWERTYUIOP{}|ASDFGHJKL:"ZXCVBNM<>?')
+
+_SEPARATORS = r'[-/._ ]'
+_DATE_DMY = re.compile(rf'(\d{{1,2}})({_SEPARATORS}?)(\d{{1,2}})\2(\d{{4}}|\d{{2}})')
+_DATE_YMD = re.compile(rf'(\d{{4}})({_SEPARATORS}?)(\d{{1,2}})\2(\d{{1,2}})')
+_YEAR = re.compile(r'(?=((?:19|20)\d\d))')
+_REPEAT = re.compile(r'(.+?)\1+')
+
+_MESSAGES = {
+    'passwords': 'Contains a commonly used password',
+    'english': 'Contains a common word',
+    'user_inputs': 'Contains your email or name',
+    'keyboard': 'Contains a keyboard pattern',
+    'repeat': 'Contains repeated characters',
+    'sequence': 'Contains a predictable sequence like abc or 123',
+    'date': 'Contains a date or year',
+}
+
+def _choose(n, k):
+    return math.comb(n, k)
+
+def _variations(upper: int, lower: int) -> int:
+    """Ways to place `upper` marked characters among the others, as guessed by an attacker"""
+    if not upper or not lower:
+        return 2 if upper else 1
+    return sum(_choose(upper + lower, i) for i in range(1, min(upper, lower) + 1))
+
+def _l33t_variations(token: str, unleeted: str) -> int:
+    """Ways to choose which letters of a word were substituted (1 when none were)"""
+    variations = 1
+    for letter in {b for a, b in zip(token, unleeted) if a != b}:
+        substituted = sum(a != b and b == letter for a, b in zip(token, unleeted))
+        variations *= _variations(substituted, token.count(letter))
+    return variations
+
+def _uppercase_variations(token: str) -> int:
+    if token == token.lower():
+        return 1
+    if token.isupper() or (token[0].isupper() and token[1:] == token[1:].lower()) \
+            or (token[-1].isupper() and token[:-1] == token[:-1].lower()):
+        return 2
+    return _variations(sum(c.isupper() for c in token), sum(c.islower() for c in token))
+
+def _brute_force_log10(char: str) -> float:
+    if char.isdigit():
+        return 1.0
+    if char.isascii() and char.isalpha():
+        return math.log10(26)
+    if char.isascii():
+        return math.log10(33)
+    return 2.0
+
+def score_for(guesses_log10: float) -> int:
+    """Score from 0 (trivially guessable) to 4 for a log10 guess count"""
+    return sum(guesses_log10 >= threshold for threshold in SCORE_THRESHOLDS)
+
+class StrengthEstimator:
+    """Estimates how many guesses a password needs, given ranked dictionaries"""
+
+    def __init__(self, dictionaries: dict):
+        self.dictionaries = dictionaries
+
+    def estimate(self, password: str, user_inputs=()) -> dict:
+        """
+        Estimate the guesses needed for a password
+
+        Args:
+            password: Password to check
+            user_inputs: Strings tied to the user (email, name) that an
+                attacker would try first
+
+        Returns:
+            Dictionary with guesses_log10, entropy (bits), score (0-4),
+            strength (label) and feedback (list of messages)
+        """
+        checked = password[:MAX_CHECKED]
+        guesses_log10, patterns = self._most_guessable(checked, user_inputs)
+        guesses_log10 += sum(_brute_force_log10(c) for c in password[MAX_CHECKED:])
+        score = score_for(guesses_log10)
+
+        feedback = list(dict.fromkeys(_MESSAGES[p] for p in patterns if p in _MESSAGES))
+        if patterns == ['passwords']:
+            feedback = ['This is a commonly used password']
+        return {
+            'guesses_log10': round(guesses_log10, 2),
+            'entropy': round(guesses_log10 / math.log10(2), 1),
+            'score': score,
+            'strength': STRENGTH_LABELS[score],
+            'feedback': feedback,
+        }
+
+    def _most_guessable(self, password, user_inputs=(), allow_repeats=True):
+        """Cheapest split of the password into matches: (log10 guesses, pattern names)"""
+        n = len(password)
+        if not n:
+            return 0.0, []
+        matches = [[] for _ in range(n + 1)]
+        for start, end, guesses, pattern in self._matches(password, user_inputs, allow_repeats):
+            minimum = 10 if end - start == 1 else 50
+            matches[end].append((start, math.log10(max(guesses, minimum)), pattern))
+
+        best = [0.0] * (n + 1)
+        back = [None] * (n + 1)
+        for end in range(1, n + 1):
+            best[end] = best[end - 1] + _brute_force_log10(password[end - 1])
+            back[end] = (end - 1, 'bruteforce')
+            for start, cost, pattern in matches[end]:
+                if best[start] + cost < best[end]:
+                    best[end] = best[start] + cost
+                    back[end] = (start, pattern)
+
+        patterns = []
+        position = n
+        while position:
+            position, pattern = back[position]
+            if pattern != 'bruteforce':
+                patterns.append(pattern)
+        return best[n], patterns[::-1]
+
+    def _matches(self, password, user_inputs, allow_repeats):
+        """Yield (start, end, guesses, pattern) for every pattern found"""
+        yield from self._dictionary_matches(password, user_inputs)
+        yield from self._sequence_matches(password)
+        yield from self._keyboard_matches(password)
+        yield from self._date_matches(password)
+        if allow_repeats:
+            yield from self._repeat_matches(password, user_inputs)
+
+    def _dictionary_matches(self, password, user_inputs):
+        n = len(password)
+        lower = password.lower()
+        unleeted = lower.translate(_L33T)
+        reversed_lower = lower[::-1]
+        sources = [(name, trie.prefixes) for name, trie in self.dictionaries.items()]
+        if user_inputs:
+            sources.append(('user_inputs', _user_input_finder(user_inputs)))
+
+        for name, prefixes in sources:
+            for start in range(n):
+                for end, rank in prefixes(lower, start):
+                    yield start, end, rank * _uppercase_variations(password[start:end]), name
+                if unleeted != lower:
+                    for end, rank in prefixes(unleeted, start):
+                        variations = _l33t_variations(lower[start:end], unleeted[start:end])
+                        if variations > 1:
+                            yield start, end, rank * _uppercase_variations(password[start:end]) * variations, name
+                for end, rank in prefixes(reversed_lower, start):
+                    if end - start > 2:
+                        original = password[n - end:n - start]
+                        yield n - end, n - start, 2 * rank * _uppercase_variations(original), name
+
+    def _sequence_matches(self, password):
+        n = len(password)
+        start = 0
+        while start < n - 2:
+            delta = ord(password[start + 1]) - ord(password[start])
+            end = start + 1
+            while end < n and ord(password[end]) - ord(password[end - 1]) == delta \
+                    and _char_class(password[end]) == _char_class(password[start]):
+                end += 1
+            if end - start >= 3 and 1 <= abs(delta) <= 3 and _char_class(password[start]):
+                first = password[start]
+                base = 4 if first in 'aAzZ019' else 10 if first.isdigit() else 26
+                yield start, end, base * (end - start) * (1 if delta > 0 else 2), 'sequence'
+                start = end - 1
+            else:
+                start += 1
+
+    def _keyboard_matches(self, password):
+        n = len(password)
+        for name, (positions, adjacent, keys, degree) in _KEYBOARDS.items():
+            start = 0
+            while start < n - 2:
+                end = start + 1
+                turns, direction = 0, None
+                while end < n and password[end - 1] in positions and password[end] in positions \
+                        and adjacent(password[end - 1], password[end]):
+                    (ra, xa), (rb, xb) = positions[password[end - 1]], positions[password[end]]
+                    step = (rb - ra, round(xb - xa))
+                    if step != direction:
+                        turns, direction = turns + 1, step
+                    end += 1
+                length = end - start
+                if length >= 3:
+                    guesses = sum(_choose(i - 1, j - 1) * keys * degree ** j
+                                  for i in range(2, length + 1) for j in range(1, min(turns, i - 1) + 1))
+                    shifted = sum(c in _SHIFTED for c in password[start:end])
+                    if name == 'qwerty' and shifted:
+                        guesses *= _variations(shifted, length - shifted)
+                    yield start, end, guesses, 'keyboard'
+                    start = end - 1
+                else:
+                    start += 1
+
+    def _date_matches(self, password):
+        this_year = date.today().year
+        for found in _YEAR.finditer(password):
+            year = int(found.group(1))
+            yield found.start(1), found.end(1), max(abs(year - this_year), 20), 'date'
+
+        for start in range(len(password)):
+            for pattern, order in ((_DATE_DMY, 'dmy'), (_DATE_YMD, 'ymd')):
+                found = pattern.match(password, start)
+                if not found:
+                    continue
+                if order == 'dmy':
+                    a, b, year = int(found.group(1)), int(found.group(3)), found.group(4)
+                else:
+                    year, a, b = found.group(1), int(found.group(3)), int(found.group(4))
+                year = int(year) if len(year) == 4 else int(year) + (1900 if int(year) > 50 else 2000)
+                valid_day_month = (1 <= a <= 31 and 1 <= b <= 12) or (1 <= a <= 12 and 1 <= b <= 31)
+                if 1900 <= year <= this_year + 30 and valid_day_month:
+                    guesses = 365 * max(abs(year - this_year), 20) * (4 if found.group(2) else 1)
+                    yield start, found.end(), guesses, 'date'
+
+    def _repeat_matches(self, password, user_inputs):
+        for found in _REPEAT.finditer(password):
+            base = found.group(1)
+            base_log10, _ = self._most_guessable(base, user_inputs, allow_repeats=False)
+            count = len(found.group(0)) // len(base)
+            yield found.start(), found.end(), 10 ** base_log10 * count, 'repeat'
+
+def _char_class(char):
+    if char.isdigit():
+        return 'digit'
+    if char.isascii() and char.islower():
+        return 'lower'
+    if char.isascii() and char.isupper():
+        return 'upper'
+    return None
+
+def _user_input_finder(user_inputs):
+    """prefixes()-style matcher over a few user-specific words"""
+    words = []
+    for value in user_inputs:
+        for word in re.split(r'[^a-z0-9]+', (value or '').lower()):
+            if len(word) >= 3 and word not in words:
+                words.append(word)
+
+    def prefixes(text, start):
+        for rank, word in enumerate(words, 1):
+            if text.startswith(word, start):
+                yield start + len(word), rank
+    return prefixes
+
+@lru_cache(maxsize=1)
+def _default_estimator() -> StrengthEstimator:
+    """In-memory estimator for code running outside an app"""
+    return StrengthEstimator({name: load_trie(path) for name, path in DICTIONARIES.items()})
+
+def get_estimator() -> StrengthEstimator:
+    """Estimator of the current app (or a shared in-memory one)"""
+    if has_app_context() and 'strength_estimator' in current_app.extensions:
+        return current_app.extensions['strength_estimator']
+    return _default_estimator()
+
+def init_strength(app):
+    """Compile (once) and memory-map the strength dictionaries for the app"""
+    cache_dir = app.config.get('STRENGTH_DICTIONARY_DIR')
+    if cache_dir is not None and not os.path.isabs(cache_dir):
+        cache_dir = os.path.join(app.instance_path, cache_dir)
+    estimator = StrengthEstimator({name: load_trie(path, cache_dir) for name, path in DICTIONARIES.items()})
+    app.extensions['strength_estimator'] = estimator
+    return estimator
+
+def estimate_strength(password: str, user_inputs=()) -> dict:
+    """Estimate a password's strength with the current estimator"""
+    return get_estimator().estimate(password, user_inputs)
@@ -0,0 +1,207 @@
+"""
+Synthetic users, notes and password entries for scaling and load tests
+
+``flask synthetic load`` fills the configured database (pick it with
+``FLASK_ENV``/``DATABASE_URL``) with realistic-looking data: notes of varied
+length drawn from a vocabulary, password entries for common services, and
+creation times spread over the past year. Rows are built from a seeded RNG,
+so the same options always produce the same data.
+
+Rows bypass the ORM. Each table gets one ``executemany`` INSERT per batch of
+``batch_size`` rows, with ids assigned up front from the tables' current
+maxima, so millions of rows load in seconds; load into a database nobody else
+is writing to. Password entries are really encrypted with their owner's key,
+so they can be revealed, but each user's key is derived once and their
+entries share a small pool of ciphertexts. Sharding is not supported.
+
+Every synthetic user's password is ``SYNTHETIC_PASSWORD``, which is what
+``benchmarks/loadtest_app.py`` logs in with.
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from werkzeug.security import generate_password_hash
+from models import db, User, Note, NoteChunk, PasswordEntry
+from utils import simhash
+from utils.security import PasswordEncryption, PasswordGenerator
+from utils.sharding import get_shards
+
+SYNTHETIC_PASSWORD = 'Synthetic-Load-1'
+
+# Distinct ciphertexts per user; entries pick one at random
+PASSWORD_POOL = 8
+
+WORDS = (
+    'account', 'agenda', 'budget', 'call', 'client', 'contract', 'deadline', 'design', 'draft',
+    'email', 'estimate', 'feedback', 'follow', 'goal', 'invoice', 'issue', 'launch', 'meeting',
+    'milestone', 'notes', 'order', 'plan', 'priority', 'project', 'proposal', 'quarter', 'release',
+    'report', 'review', 'risk', 'roadmap', 'schedule', 'server', 'sprint', 'status', 'summary',
+    'task', 'team', 'ticket', 'timeline', 'travel', 'update', 'vendor', 'weekly', 'the', 'and',
+    'for', 'with', 'about', 'after', 'before', 'next', 'this', 'our', 'new', 'final', 'open',
+    'recipe', 'garden', 'book', 'movie', 'birthday', 'gift', 'doctor', 'insurance', 'tax', 'car',
+)
+TITLES = (
+    '{} notes', 'Meeting: {}', '{} ideas', 'TODO {}', '{} checklist', 'Draft {}', '{} summary',
+    'Weekly {} review', '{} plan', 'Reading list: {}',
+)
+SERVICES = (
+    'Gmail', 'Outlook', 'GitHub', 'GitLab', 'Amazon', 'AWS Console', 'Netflix', 'Spotify',
+    'Dropbox', 'Slack', 'Zoom', 'PayPal', 'Stripe', 'Chase Bank', 'Coinbase', 'Reddit', 'Discord',
+    'Steam', 'Jira', 'Notion', 'Figma', 'LinkedIn', 'Facebook', 'Instagram', 'Cloudflare', 'Heroku',
+)
+SERVICE_SUFFIXES = ('', '', '', ' Work', ' Personal', ' Staging', ' Admin', ' Backup')
+
+def _sentences(rng: random.Random, count: int = 4096) -> list:
+    """Pool of sentences that note contents are assembled from"""
+    return [' '.join(rng.choices(WORDS, k=rng.randint(6, 16))).capitalize() + '.' for _ in range(count)]
+
+def _content(rng: random.Random, sentences: list) -> str:
+    """Note text of a few hundred characters, occasionally tens of thousands"""
+    count = int(rng.lognormvariate(2.3, 1.0)) + 1
+    return '\n'.join(rng.choices(sentences, k=count))[:Note.MAX_LENGTH]
+
+def _timestamps(rng: random.Random, now: datetime) -> tuple:
+    created = now - timedelta(seconds=rng.randrange(365 * 86400))
+    updated = created + timedelta(seconds=rng.randrange(max(int((now - created).total_seconds()), 1)))
+    return created, updated
+
+def note_rows(rng: random.Random, sentences: list, note_id: int, user_id: int, now: datetime,
+              fingerprints: bool = False) -> tuple:
+    """
+    One synthetic note as insert parameters
+
+    Returns:
+        (notes row, list of note_chunks rows)
+    """
+    title = rng.choice(TITLES).format(' '.join(rng.choices(WORDS, k=rng.randint(1, 3))))
+    content = _content(rng, sentences)
+    created, updated = _timestamps(rng, now)
+    size = NoteChunk.CHUNK_SIZE
+    chunks = [{'note_id': note_id, 'seq': seq, 'data': content[start:start + size]}
+              for seq, start in enumerate(range(0, len(content), size))]
+    row = {
+        'id': note_id, 'title': title[:200], 'snippet': content[:120], 'size': len(content),
+        'created_at': created, 'updated_at': updated, 'user_id': user_id, 'revision_count': 0,
+        'simhash': None, 'simhash_b0': None, 'simhash_b1': None, 'simhash_b2': None, 'simhash_b3': None,
+    }
+    # Fingerprinting costs more than generating the note, so it is optional
+    if fingerprints:
+        value = simhash.fingerprint(f'{title}\n{content[:size]}')
+        row['simhash'] = simhash.to_signed(value)
+        for i, band in enumerate(simhash.bands(value)):
+            row[f'simhash_b{i}'] = band
+    return row, chunks
+
+def entry_row(rng: random.Random, entry_id: int, user_id: int, now: datetime, ciphertexts: list) -> dict:
+    """One synthetic password entry as insert parameters"""
+    service = rng.choice(SERVICES) + rng.choice(SERVICE_SUFFIXES)
+    created, updated = _timestamps(rng, now)
+    return {
+        'id': entry_id, 'service_name': service, 'username': f"{rng.choice(WORDS)}{rng.randrange(1000)}@example.com",
+        'encrypted_password': rng.choice(ciphertexts), 'created_at': created, 'updated_at': updated,
+        'user_id': user_id,
+    }
+
+def _next_id(model) -> int:
+    query = db.select(db.func.max(model.id)).execution_options(include_deleted=True)
+    return (db.session.execute(query).scalar() or 0) + 1
+
+def load(users: int, notes_per_user: int, entries_per_user: int, batch_size: int = 10000,
+         seed: int = 0, email_prefix: str = 'synthetic', fingerprints: bool = False, progress=None) -> dict:
+    """
+    Bulk-insert synthetic users with their notes and password entries
+
+    Args:
+        users: Users to create (emails ``<prefix><n>@example.com``)
+        notes_per_user: Notes per user
+        entries_per_user: Password entries per user
+        batch_size: Rows per executemany INSERT and transaction
+        seed: RNG seed
+        email_prefix: Start of the users' email addresses
+        fingerprints: Compute note SimHashes (for duplicate detection)
+        progress: Called with the counts so far after each transaction
+
+    Returns:
+        Number of rows inserted per table
+    """
+    if get_shards() is not None:
+        raise RuntimeError("Synthetic data cannot be loaded while sharding is enabled")
+
+    rng = random.Random(seed)
+    sentences = _sentences(rng)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+    user_id, note_id, entry_id = _next_id(User), _next_id(Note), _next_id(PasswordEntry)
+    db.session.commit()
+    first_user = user_id
+    tables = {'users': [], 'notes': [], 'note_chunks': [], 'password_entries': []}
+    counts = dict.fromkeys(tables, 0)
+
+    def flush():
+        # Parents first; one transaction per batch keeps write locks short
+        with db.engine.begin() as connection:
+            for name, rows in tables.items():
+                if rows:
+                    connection.execute(db.metadata.tables[name].insert(), rows)
+                    counts[name] += len(rows)
+                    rows.clear()
+        if progress is not None:
+            progress(counts)
+
+    for user_id in range(first_user, first_user + users):
+        tables['users'].append({
+            'id': user_id, 'email': f'{email_prefix}{user_id}@example.com', 'password_hash': password_hash,
+            'created_at': now - timedelta(days=366), 'search_version': 0,
+        })
+        for _ in range(notes_per_user):
+            row, chunks = note_rows(rng, sentences, note_id, user_id, now, fingerprints)
+            tables['notes'].append(row)
+            tables['note_chunks'].extend(chunks)
+            note_id += 1
+            if len(tables['note_chunks']) >= batch_size:
+                flush()
+
+        if entries_per_user:
+            cipher = PasswordEncryption.get_cipher(user_id)
+            ciphertexts = [PasswordEncryption.encrypt_password(PasswordGenerator.generate_password(16), user_id, cipher=cipher)
+                           for _ in range(min(PASSWORD_POOL, entries_per_user))]
+            for _ in range(entries_per_user):
+                tables['password_entries'].append(entry_row(rng, entry_id, user_id, now, ciphertexts))
+                entry_id += 1
+                if len(tables['password_entries']) >= batch_size:
+                    flush()
+    flush()
+    return counts
+
+synthetic_cli = AppGroup('synthetic', help="Generate synthetic data for load tests.")
+
+@synthetic_cli.command('load')
+@click.option('--users', default=100, show_default=True, help="Users to create.")
+@click.option('--notes', 'notes_per_user', default=1000, show_default=True, help="Notes per user.")
+@click.option('--passwords', 'entries_per_user', default=200, show_default=True, help="Password entries per user.")
+@click.option('--batch-size', default=10000, show_default=True, help="Rows per INSERT and transaction.")
+@click.option('--seed', default=0, show_default=True, help="Random seed.")
+@click.option('--email-prefix', default='synthetic', show_default=True, help="Start of the users' emails.")
+@click.option('--fingerprints', is_flag=True, help="Compute note SimHashes (much slower).")
+def load_command(users, notes_per_user, entries_per_user, batch_size, seed, email_prefix, fingerprints):
+    """Bulk-load synthetic users, notes and password entries."""
+    db.create_all()
+    start = time.perf_counter()
+
+    def report(counts):
+        click.echo(f"\r{counts['notes']} notes, {counts['password_entries']} password entries "
+                   f"({time.perf_counter() - start:.1f}s)", nl=False)
+
+    try:
+        counts = load(users, notes_per_user, entries_per_user, batch_size=batch_size, seed=seed,
+                      email_prefix=email_prefix, fingerprints=fingerprints, progress=report)
+    except RuntimeError as e:
+        raise click.UsageError(str(e))
+    elapsed = time.perf_counter() - start
+    rows = sum(counts.values())
+    click.echo(f"\nLoaded {counts['users']} users, {counts['notes']} notes and {counts['password_entries']} "
+               f"password entries in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s); "
+               f"they log in with {SYNTHETIC_PASSWORD!r}")
@@ -0,0 +1,140 @@
+"""
+Tags and folders for notes and password entries
+
+Each tag keeps its members as compressed bitmaps of row ids (one for notes,
+one for password entries). Filtering by several tags is then an in-memory
+bitmap AND/OR followed by a single ``id IN (...)`` condition that composes
+with search and pagination, instead of one join per tag. The ids are inlined
+into the SQL when the statement runs, so the condition works on every
+database and is not bound by their limits on the number of parameters.
+"""
+
+from functools import reduce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, Tag, Folder
+from utils.bitmap import Bitmap
+
+# Bitmap column holding each kind of item
+_COLUMNS = {'notes': 'note_ids', 'passwords': 'entry_ids'}
+
+def parse_tags(text: str) -> list:
+    """Split a comma-separated string into normalized, unique tag names"""
+    names = []
+    for part in (text or '').split(','):
+        name = ' '.join(part.split()).lower()[:50]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def tag_bitmap(tag: Tag, kind: str) -> Bitmap:
+    """Ids of the items of a kind ('notes' or 'passwords') carrying a tag"""
+    return Bitmap.from_bytes(getattr(tag, _COLUMNS[kind]))
+
+def user_tag_names(user_id: int) -> list:
+    """All of a user's tag names, sorted"""
+    return db.session.execute(
+        db.select(Tag.name).where(Tag.user_id == user_id).order_by(Tag.name)
+    ).scalars().all()
+
+def item_tags(user_id: int, kind: str, item_id: int) -> list:
+    """Names of the tags on one item"""
+    tags = Tag.query.filter_by(user_id=user_id).order_by(Tag.name).all()
+    return [tag.name for tag in tags if item_id in tag_bitmap(tag, kind)]
+
+def set_item_tags(user_id: int, kind: str, item_id: int, names: list, attempts: int = 3):
+    """
+    Replace the tags on an item and commit
+
+    Missing tags are created and tags left without any items are deleted.
+    Conflicting concurrent updates are retried.
+    """
+    for attempt in range(attempts):
+        try:
+            _apply_item_tags(user_id, kind, item_id, set(names))
+            db.session.commit()
+            return
+        except (StaleDataError, IntegrityError):
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+
+def _apply_item_tags(user_id, kind, item_id, wanted):
+    column = _COLUMNS[kind]
+    tags = {tag.name: tag for tag in Tag.query.filter_by(user_id=user_id)}
+    for name in wanted - tags.keys():
+        tags[name] = Tag(user_id=user_id, name=name)
+        db.session.add(tags[name])
+
+    for name, tag in tags.items():
+        bitmap = tag_bitmap(tag, kind)
+        if name in wanted and item_id not in bitmap:
+            bitmap.add(item_id)
+        elif name not in wanted and item_id in bitmap:
+            bitmap.discard(item_id)
+        else:
+            continue
+        setattr(tag, column, bitmap.to_bytes() if bitmap else None)
+        if tag.id is not None and not tag.note_ids and not tag.entry_ids:
+            db.session.delete(tag)
+
+def forget_item(user_id: int, kind: str, item_id: int):
+    """Remove a deleted item from every tag"""
+    set_item_tags(user_id, kind, item_id, [])
+
+def forget_items(user_id: int, kind: str, item_ids: list, attempts: int = 3):
+    """Remove several deleted items from every tag with one commit"""
+    column = _COLUMNS[kind]
+    for attempt in range(attempts):
+        try:
+            for tag in Tag.query.filter_by(user_id=user_id):
+                bitmap = tag_bitmap(tag, kind)
+                if not any(item_id in bitmap for item_id in item_ids):
+                    continue
+                for item_id in item_ids:
+                    bitmap.discard(item_id)
+                setattr(tag, column, bitmap.to_bytes() if bitmap else None)
+                if not tag.note_ids and not tag.entry_ids:
+                    db.session.delete(tag)
+            db.session.commit()
+            return
+        except StaleDataError:
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+
+def tagged_ids(user_id: int, kind: str, names: list, match_all: bool = True) -> Bitmap:
+    """
+    Ids of the items carrying all (or any) of the given tags
+
+    Args:
+        user_id: Owner of the tags
+        kind: 'notes' or 'passwords'
+        names: Tag names to combine
+        match_all: Intersect the tags (AND) instead of uniting them (OR)
+    """
+    names = set(names)
+    tags = Tag.query.filter(Tag.user_id == user_id, Tag.name.in_(names)).all()
+    bitmaps = sorted((tag_bitmap(tag, kind) for tag in tags), key=len)
+    if match_all:
+        if not bitmaps or len(tags) < len(names):
+            return Bitmap()
+        return reduce(lambda a, b: a & b, bitmaps)
+    return reduce(lambda a, b: a | b, bitmaps, Bitmap())
+
+def id_filter(column, ids):
+    """SQL condition keeping rows whose ``column`` is in a bitmap (or other iterable) of integer ids"""
+    return column.in_(db.bindparam(None, [int(i) for i in ids], type_=column.type,
+                                   expanding=True, literal_execute=True))
+
+def folder_for_name(user_id: int, name: str):
+    """Find or create a user's folder by name (None for an empty name)"""
+    name = ' '.join((name or '').split())[:50]
+    if not name:
+        return None
+    folder = Folder.query.filter_by(user_id=user_id, name=name).first()
+    if folder is None:
+        folder = Folder(user_id=user_id, name=name)
+        db.session.add(folder)
+        db.session.flush()
+    return folder
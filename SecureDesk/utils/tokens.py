@@ -0,0 +1,206 @@
+"""
+Personal access tokens for API clients
+
+Clients send ``Authorization: Bearer <token>`` to ``/api/v1`` instead of
+logging in. Tokens are random, so they are stored as an HMAC-SHA256 under a
+server key rather than with the deliberately slow password hash; verifying one
+costs a keyed hash plus, once cached, a dictionary lookup in ``TokenCache``
+(an LRU of ``TOKEN_CACHE_SIZE`` entries per process).
+
+Revocation deletes the row and clears the cache of the revoking process. Other
+processes notice through ``TOKEN_REVOCATION_PATH``: every revocation appends a
+byte to that file, and each lookup compares its size and mtime (one ``stat``)
+with what the cache last saw, dropping every cached token when they differ.
+
+Each token carries scopes naming the endpoint groups it may call; endpoints
+check them with ``require_scope``. Browser sessions are not limited by scopes.
+
+A token-authenticated request's ``current_user`` is a ``TokenUser`` built from
+the cached entry, so a cache hit authenticates without a query; the user row
+is loaded only if a view reads more than the id.
+"""
+
+import os
+import hmac
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, g, abort
+from flask_login import UserMixin
+from models import db, User, AccessToken
+from utils.metrics import metrics
+
+TOKEN_PREFIX = 'sdp_'
+
+# Endpoint groups a token can be granted
+SCOPES = {
+    'notes': 'Read notes',
+    'passwords': 'Read password entries (never the passwords themselves)',
+}
+
+CachedToken = namedtuple('CachedToken', 'id user_id scopes expires_at')
+
+class TokenUser(UserMixin):
+    """current_user of a token-authenticated request"""
+
+    def __init__(self, entry: CachedToken):
+        self.id = entry.user_id
+        self.scopes = entry.scopes
+        self._user = None
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set above: fall back to the user row
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+            if self._user is None:
+                raise AttributeError(name)
+        return getattr(self._user, name)
+
+class TokenCache:
+    """LRU of verified token hashes, invalidated by the revocation file"""
+
+    def __init__(self, key: bytes, max_size: int = 10000, revocation_path: str = None):
+        self.max_size = max_size
+        self.revocation_path = revocation_path
+        self._key = key
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = self._revocation_stamp()
+
+    def hash(self, token: str) -> str:
+        """Stored form of a token"""
+        return hmac.new(self._key, token.encode(), hashlib.sha256).hexdigest()
+
+    def _revocation_stamp(self):
+        if not self.revocation_path:
+            return None
+        try:
+            stat = os.stat(self.revocation_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def lookup(self, token: str):
+        """The CachedToken for a valid token, or None"""
+        if not token.startswith(TOKEN_PREFIX):
+            return None
+        digest = self.hash(token)
+        stamp = self._revocation_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._entries.clear()
+                self._stamp = stamp
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+
+        if entry is None:
+            metrics.inc('token_cache_misses_total')
+            row = db.session.execute(
+                db.select(AccessToken.id, AccessToken.user_id, AccessToken.scopes, AccessToken.expires_at)
+                .where(AccessToken.token_hash == digest)
+            ).first()
+            # Unknown tokens are not cached, so guessing cannot flood the cache
+            if row is None:
+                return None
+            entry = CachedToken(row.id, row.user_id, frozenset(row.scopes.split(',')), row.expires_at)
+            with self._lock:
+                self._entries[digest] = entry
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        else:
+            metrics.inc('token_cache_hits_total')
+
+        if entry.expires_at is not None and entry.expires_at <= datetime.utcnow():
+            return None
+        return entry
+
+    def revoked(self):
+        """Forget cached tokens here and, through the revocation file, in every other process"""
+        with self._lock:
+            self._entries.clear()
+        if self.revocation_path:
+            with open(self.revocation_path, 'ab') as f:
+                f.write(b'.')
+
+def get_token_cache() -> TokenCache:
+    """Token cache of the current app"""
+    return current_app.extensions['access_tokens']
+
+def issue_token(user_id: int, name: str, scopes: list, expires_in_days: int = None) -> tuple:
+    """
+    Create a token (added to the session, not committed)
+
+    Returns:
+        (AccessToken row, the token itself, which is not stored anywhere)
+    """
+    unknown = set(scopes) - set(SCOPES)
+    if unknown or not scopes:
+        raise ValueError(f"Invalid scopes: {', '.join(sorted(unknown)) or '(none)'}")
+    token = TOKEN_PREFIX + secrets.token_urlsafe(32)
+    row = AccessToken(
+        user_id=user_id,
+        name=name,
+        token_hash=get_token_cache().hash(token),
+        hint=token[-4:],
+        scopes=','.join(scope for scope in SCOPES if scope in scopes),
+        expires_at=datetime.utcnow() + timedelta(days=expires_in_days) if expires_in_days else None,
+    )
+    db.session.add(row)
+    return row, token
+
+def revoke_token(token_id: int, user_id: int) -> bool:
+    """Delete one of a user's tokens; it stops working immediately in every process"""
+    deleted = AccessToken.query.filter_by(id=token_id, user_id=user_id).delete()
+    db.session.commit()
+    if deleted:
+        get_token_cache().revoked()
+    return bool(deleted)
+
+def require_scope(scope: str):
+    """Refuse token-authenticated requests whose token lacks ``scope``"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            scopes = g.get('token_scopes')
+            if scopes is not None and scope not in scopes:
+                abort(403, description=f"This token lacks the '{scope}' scope")
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def init_tokens(app, login_manager):
+    """Accept bearer tokens on the API blueprint"""
+    revocation_path = app.config.get('TOKEN_REVOCATION_PATH')
+    if revocation_path and not os.path.isabs(revocation_path):
+        os.makedirs(app.instance_path, exist_ok=True)
+        revocation_path = os.path.join(app.instance_path, revocation_path)
+    key = app.config.get('TOKEN_HASH_KEY') or app.config['SECRET_KEY']
+    cache = TokenCache(
+        # Separate the token key from other uses of SECRET_KEY
+        key=hmac.new(key.encode(), b'access-tokens', hashlib.sha256).digest(),
+        max_size=app.config.get('TOKEN_CACHE_SIZE', 10000),
+        revocation_path=revocation_path,
+    )
+    app.extensions['access_tokens'] = cache
+
+    @login_manager.request_loader
+    def _load_user_from_token(request):
+        # Tokens only open the API, never the HTML pages and their forms
+        if request.blueprint != 'api':
+            return None
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            return None
+        entry = cache.lookup(token.strip())
+        if entry is None:
+            return None
+        g.token_scopes = entry.scopes
+        return TokenUser(entry)
+
+    return cache
@@ -0,0 +1,205 @@
+"""
+Trash for notes and password entries, and batched deletion
+
+Deleting a note or password entry sets its ``deleted_at``. A
+``do_orm_execute`` hook adds ``deleted_at IS NULL`` to every ORM SELECT of
+either model, so trashed items disappear from lists, search, tags, the API
+and rotation reminders without each query saying so; statements with the
+execution option ``include_deleted=True`` still see them. Restoring clears
+the column, so tags, revisions and attachments come back untouched.
+
+The ``trash-purger`` worker deletes items trashed more than
+``TRASH_RETENTION_DAYS`` ago. It finds them with a scan of the ``deleted_at``
+index on each database and deletes ``TRASH_PURGE_BATCH`` at a time, each
+batch in its own short transaction, so SQLite's single write lock is never
+held for long and requests keep writing between batches. Items are deleted
+through the ORM, which removes their chunks, revisions, attachments and
+search index entries just as an immediate delete did.
+
+Deleting an account uses the same batches (``delete_account_data``): the
+request marks the user deleted and signs them out everywhere, and a
+background job removes their rows a batch at a time before the user row.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import with_loader_criteria
+from models import (db, User, Note, PasswordEntry, Tag, Folder, Vault, VaultMember, VaultEntry,
+                    AuditEvent, AccessToken, BackgroundJob, ServerSession, ShardDirectory)
+from utils.auditlog import get_audit_log
+from utils.background import register_worker
+from utils.metrics import metrics
+from utils.replication import RoutingSession
+from utils.sharding import all_engines, use_user_shard
+from utils.tags import forget_items
+
+# Models with a trash, by the item kind used for tags
+TRASHABLE = {'notes': Note, 'passwords': PasswordEntry}
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _hide_trashed(state):
+    if (state.is_select and not state.is_column_load and not state.is_relationship_load
+            and not state.execution_options.get('include_deleted', False)):
+        state.statement = state.statement.options(*(
+            with_loader_criteria(model, model.deleted_at.is_(None), include_aliases=True)
+            for model in TRASHABLE.values()
+        ))
+
+def move_to_trash(item):
+    """Trash a note or password entry (not committed)"""
+    item.deleted_at = datetime.utcnow()
+
+def restore(item):
+    """Take an item out of the trash (not committed)"""
+    item.deleted_at = None
+
+def trashed(model, user_id: int):
+    """Query of a user's trashed items of a model, most recently trashed first"""
+    return model.query.execution_options(include_deleted=True).filter(
+        model.user_id == user_id,
+        model.deleted_at.isnot(None)
+    ).order_by(model.deleted_at.desc())
+
+def trashed_item(model, item_id: int, user_id: int):
+    """One of a user's trashed items, or None"""
+    return trashed(model, user_id).filter(model.id == item_id).first()
+
+def _batch_size(batch_size: int = None) -> int:
+    return batch_size or current_app.config.get('TRASH_PURGE_BATCH', 100)
+
+def _delete_items(model, user_id: int, item_ids: list, trashed_only: bool = True) -> int:
+    """Delete some of a user's items through the ORM in one transaction"""
+    with use_user_shard(user_id):
+        query = model.query.execution_options(include_deleted=True).filter(
+            model.user_id == user_id,
+            model.id.in_(item_ids)
+        )
+        if trashed_only:
+            # Restored since it was found
+            query = query.filter(model.deleted_at.isnot(None))
+        items = query.all()
+        for item in items:
+            db.session.delete(item)
+        db.session.commit()
+    return len(items)
+
+def purge_trash(user_id: int = None, older_than: timedelta = None, batch_size: int = None) -> int:
+    """
+    Delete trashed items in small transactions
+
+    Args:
+        user_id: Only this user's items (default: everyone's)
+        older_than: Minimum time in the trash (default: TRASH_RETENTION_DAYS)
+        batch_size: Items per transaction (default: TRASH_PURGE_BATCH)
+
+    Returns:
+        Number of items deleted
+    """
+    if older_than is None:
+        older_than = timedelta(days=current_app.config.get('TRASH_RETENTION_DAYS', 30))
+    batch_size = _batch_size(batch_size)
+    cutoff = datetime.utcnow() - older_than
+    purged = 0
+
+    for kind, model in TRASHABLE.items():
+        table = model.__table__
+        expired = db.select(table.c.id, table.c.user_id).where(table.c.deleted_at <= cutoff)
+        if user_id is not None:
+            expired = expired.where(table.c.user_id == user_id)
+        for engine in all_engines():
+            while True:
+                with engine.connect() as connection:
+                    rows = connection.execute(expired.order_by(table.c.deleted_at).limit(batch_size)).all()
+                owners = {}
+                for item_id, owner_id in rows:
+                    owners.setdefault(owner_id, []).append(item_id)
+                deleted = 0
+                for owner_id, item_ids in owners.items():
+                    deleted += _delete_items(model, owner_id, item_ids)
+                    forget_items(owner_id, kind, item_ids)
+                purged += deleted
+                # Stop early if nothing in a full batch could be deleted, rather than retry it forever
+                if len(rows) < batch_size or not deleted:
+                    break
+
+    metrics.inc('trash_purged_total', purged)
+    return purged
+
+def delete_in_batches(table, condition, batch_size: int, engine=None) -> int:
+    """Delete the rows of a table matching ``condition``, each batch in its own transaction"""
+    key, = table.primary_key.columns
+    engine = engine or db.engine
+    deleted = 0
+    while True:
+        with engine.begin() as connection:
+            count = connection.execute(
+                table.delete().where(key.in_(db.select(key).where(condition).limit(batch_size)))
+            ).rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+def delete_account_data(user_id: int, batch_size: int = None, progress=None) -> dict:
+    """
+    Delete a user and everything they own, a batch at a time
+
+    Args:
+        user_id: User to delete
+        batch_size: Rows per transaction (default: TRASH_PURGE_BATCH)
+        progress: Called as ``progress(done, total, message)`` after each step
+
+    Returns:
+        Number of rows deleted per kind
+    """
+    batch_size = _batch_size(batch_size)
+    counts = {}
+    steps = len(TRASHABLE) + 3
+
+    def report(done, message):
+        if progress is not None:
+            progress(done, steps, message)
+
+    # Notes and entries go through the ORM, which cleans up their children
+    for step, (kind, model) in enumerate(TRASHABLE.items()):
+        counts[kind] = 0
+        while True:
+            with use_user_shard(user_id):
+                item_ids = db.session.execute(
+                    db.select(model.id).where(model.user_id == user_id).order_by(model.id).limit(batch_size)
+                    .execution_options(include_deleted=True)
+                ).scalars().all()
+            if not item_ids:
+                break
+            counts[kind] += _delete_items(model, user_id, item_ids, trashed_only=False)
+        report(step + 1, f'Deleted {kind}')
+
+    # Vaults owned by the user disappear for every member
+    vaults = 0
+    for vault_id in db.session.execute(db.select(Vault.id).where(Vault.owner_id == user_id)).scalars().all():
+        delete_in_batches(VaultEntry.__table__, VaultEntry.vault_id == vault_id, batch_size)
+        with db.engine.begin() as connection:
+            connection.execute(VaultMember.__table__.delete().where(VaultMember.vault_id == vault_id))
+            vaults += connection.execute(Vault.__table__.delete().where(Vault.id == vault_id)).rowcount
+    counts['vaults'] = vaults
+    with db.engine.begin() as connection:
+        connection.execute(VaultMember.__table__.delete().where(VaultMember.user_id == user_id))
+        connection.execute(VaultEntry.__table__.update().where(VaultEntry.created_by == user_id).values(created_by=None))
+    report(steps - 2, 'Deleted vaults')
+
+    # Write out queued activity events first so none arrive after their table is cleared
+    get_audit_log().flush()
+    for model in (Tag, Folder, AuditEvent, AccessToken, ServerSession, BackgroundJob):
+        counts[model.__tablename__] = delete_in_batches(model.__table__, model.user_id == user_id, batch_size)
+    report(steps - 1, 'Deleted account data')
+
+    # The shard directory entry routes the deletes above, so it goes last with the user
+    with db.engine.begin() as connection:
+        connection.execute(ShardDirectory.__table__.delete().where(ShardDirectory.user_id == user_id))
+        connection.execute(User.__table__.delete().where(User.id == user_id))
+    report(steps, 'Account deleted')
+    return counts
+
+def init_trash(app):
+    """Purge expired trash in the background"""
+    return register_worker(app, 'trash-purger', app.config.get('TRASH_PURGE_INTERVAL', 3600), purge_trash)
@@ -0,0 +1,73 @@
+"""
+Shared password vaults
+
+Each vault has a random Fernet key, and its entries are encrypted once under
+that key. Every member holds a copy of the key wrapped (encrypted) with their
+own password-entry key. Adding a member unwraps the key with the adding
+member's copy and wraps it for the new member; removing a member deletes
+their copy. Neither touches the vault's entries.
+
+Vault tables live on the primary database. When a user's own entries do too
+(always, unless sharding is enabled), ``list_passwords`` merges personal and
+shared entries with a single UNION query; membership is one indexed join on
+``vault_members (user_id, vault_id)``.
+"""
+
+from cryptography.fernet import Fernet
+from models import db, Vault, VaultMember, VaultEntry
+from utils.security import PasswordEncryption
+from utils.sharding import get_shards
+
+def _wrap(key: bytes, user_id: int) -> str:
+    return PasswordEncryption.get_cipher(user_id).encrypt(key).decode()
+
+def _unwrap(wrapped_key: str, user_id: int) -> bytes:
+    return PasswordEncryption.get_cipher(user_id).decrypt(wrapped_key.encode())
+
+def membership(vault_id: int, user_id: int):
+    """A user's VaultMember row of a vault, or None"""
+    return db.session.get(VaultMember, (vault_id, user_id))
+
+def vault_cipher(member: VaultMember) -> Fernet:
+    """Cipher of a vault's entries, from a member's wrapped key"""
+    return Fernet(_unwrap(member.wrapped_key, member.user_id))
+
+def create_vault(owner_id: int, name: str) -> Vault:
+    """New vault (added to the session) whose only member is its owner"""
+    vault = Vault(name=name, owner_id=owner_id)
+    vault.members.append(VaultMember(user_id=owner_id, wrapped_key=_wrap(Fernet.generate_key(), owner_id)))
+    db.session.add(vault)
+    return vault
+
+def add_member(granting: VaultMember, user_id: int) -> VaultMember:
+    """Give a user access to the vault of ``granting`` with one key wrap"""
+    key = _unwrap(granting.wrapped_key, granting.user_id)
+    member = VaultMember(vault_id=granting.vault_id, user_id=user_id, wrapped_key=_wrap(key, user_id))
+    db.session.add(member)
+    return member
+
+def encrypt_entry(member: VaultMember, password: str) -> str:
+    """Encrypt a password for a vault's entries"""
+    return PasswordEncryption.encrypt_password(password, member.user_id, cipher=vault_cipher(member))
+
+def decrypt_entry(member: VaultMember, entry: VaultEntry) -> str:
+    """Decrypt a vault entry's password"""
+    return PasswordEncryption.decrypt_password(entry.encrypted_password, member.user_id, cipher=vault_cipher(member))
+
+def user_vaults(user_id: int):
+    """Query of the vaults a user belongs to"""
+    return Vault.query.join(VaultMember, VaultMember.vault_id == Vault.id).filter(VaultMember.user_id == user_id)
+
+def shared_entries(user_id: int, *columns):
+    """SELECT of ``columns`` over the entries of every vault the user belongs to"""
+    return (
+        db.select(*columns)
+        .select_from(VaultEntry)
+        .join(VaultMember, (VaultMember.vault_id == VaultEntry.vault_id) & (VaultMember.user_id == user_id))
+        .join(Vault, Vault.id == VaultEntry.vault_id)
+    )
+
+def entries_share_database(user_id: int) -> bool:
+    """Whether a user's own entries are on the primary, next to the vaults"""
+    shards = get_shards()
+    return shards is None or shards.entry(db.session, user_id)[0] is None
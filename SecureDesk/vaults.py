@@ -0,0 +1,187 @@
+"""
+Shared vault routes and logic
+"""
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort
+from flask_login import login_required, current_user
+from models import db, User, Vault, VaultMember, VaultEntry
+from utils.forms import VaultForm, VaultMemberForm, PasswordEntryForm, DeleteConfirmationForm
+from utils.vaults import membership, create_vault, add_member, encrypt_entry, decrypt_entry, user_vaults
+from utils.ratelimit import limiter
+from utils.auditlog import audit
+
+# Create vaults blueprint
+vaults_bp = Blueprint('vaults', __name__, url_prefix='/vaults')
+
+def _membership_or_404(vault_id: int) -> VaultMember:
+    """The current user's membership of a vault; other users get a 404"""
+    member = membership(vault_id, current_user.id)
+    if member is None:
+        abort(404)
+    return member
+
+def _owned_or_404(vault_id: int) -> VaultMember:
+    member = _membership_or_404(vault_id)
+    if member.vault.owner_id != current_user.id:
+        abort(404)
+    return member
+
+@vaults_bp.route('/', methods=['GET', 'POST'])
+@login_required
+def list_vaults():
+    """List the user's shared vaults and create new ones"""
+    form = VaultForm()
+    
+    if form.validate_on_submit():
+        try:
+            vault = create_vault(current_user.id, form.name.data.strip())
+            db.session.commit()
+            flash('Vault created. Add members to share its passwords.', 'success')
+            return redirect(url_for('vaults.view_vault', vault_id=vault.id))
+        except Exception as e:
+            db.session.rollback()
+            flash('An error occurred while creating the vault. Please try again.', 'error')
+    
+    vaults = user_vaults(current_user.id).order_by(Vault.name).all()
+    return render_template('vaults.html', vaults=vaults, form=form)
+
+@vaults_bp.route('/<int:vault_id>')
+@login_required
+def view_vault(vault_id):
+    """Entries and members of a vault"""
+    member = _membership_or_404(vault_id)
+    page = request.args.get('page', 1, type=int)
+    entries = member.vault.entries.paginate(page=page, per_page=25, error_out=False, max_per_page=100)
+    
+    return render_template('vault_detail.html',
+                         vault=member.vault,
+                         entries=entries,
+                         is_owner=member.vault.owner_id == current_user.id,
+                         entry_form=PasswordEntryForm(formdata=None),
+                         member_form=VaultMemberForm(formdata=None),
+                         delete_form=DeleteConfirmationForm(formdata=None))
+
+@vaults_bp.route('/<int:vault_id>/entries', methods=['POST'])
+@login_required
+def add_entry(vault_id):
+    """Add a password entry, encrypted once for every member"""
+    member = _membership_or_404(vault_id)
+    form = PasswordEntryForm()
+    
+    if form.validate_on_submit():
+        try:
+            db.session.add(VaultEntry(
+                vault_id=vault_id,
+                service_name=form.service_name.data.strip(),
+                username=form.username.data.strip(),
+                encrypted_password=encrypt_entry(member, form.password.data),
+                created_by=current_user.id
+            ))
+            db.session.commit()
+            flash('Password entry added to the vault.', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash('An error occurred while adding the password entry. Please try again.', 'error')
+    else:
+        for errors in form.errors.values():
+            flash(errors[0], 'error')
+    
+    return redirect(url_for('vaults.view_vault', vault_id=vault_id))
+
+@vaults_bp.route('/<int:vault_id>/entries/<int:entry_id>/reveal', methods=['POST'])
+@login_required
+@limiter.limit(json_response=True)
+def reveal_entry(vault_id, entry_id):
+    """Reveal a vault entry's password via AJAX"""
+    member = _membership_or_404(vault_id)
+    entry = VaultEntry.query.filter_by(id=entry_id, vault_id=vault_id).first_or_404()
+    
+    try:
+        password = decrypt_entry(member, entry)
+        audit('password_revealed', f'{entry.service_name} ({member.vault.name})')
+        return jsonify({'status': 'success', 'password': password})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': 'Failed to decrypt password'}), 500
+
+@vaults_bp.route('/<int:vault_id>/entries/<int:entry_id>/delete', methods=['POST'])
+@login_required
+def delete_entry(vault_id, entry_id):
+    """Delete a vault entry for every member"""
+    member = _membership_or_404(vault_id)
+    entry = VaultEntry.query.filter_by(id=entry_id, vault_id=vault_id).first_or_404()
+    form = DeleteConfirmationForm()
+    
+    if form.validate_on_submit():
+        db.session.delete(entry)
+        db.session.commit()
+        audit('vault_entry_deleted', f'{entry.service_name} ({member.vault.name})')
+        flash('Password entry deleted from the vault.', 'success')
+    
+    return redirect(url_for('vaults.view_vault', vault_id=vault_id))
+
+@vaults_bp.route('/<int:vault_id>/members', methods=['POST'])
+@login_required
+def add_vault_member(vault_id):
+    """Share the vault with another user (owner only)"""
+    member = _owned_or_404(vault_id)
+    form = VaultMemberForm()
+    
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=form.email.data.lower().strip()).first()
+        if user is None:
+            flash('No user with that email address.', 'error')
+        elif membership(vault_id, user.id) is not None:
+            flash(f'{user.email} is already a member.', 'info')
+        else:
+            add_member(member, user.id)
+            db.session.commit()
+            audit('vault_member_added', f'{user.email} ({member.vault.name})')
+            flash(f'{user.email} can now use this vault.', 'success')
+    else:
+        for errors in form.errors.values():
+            flash(errors[0], 'error')
+    
+    return redirect(url_for('vaults.view_vault', vault_id=vault_id))
+
+@vaults_bp.route('/<int:vault_id>/members/<int:user_id>/remove', methods=['POST'])
+@login_required
+def remove_vault_member(vault_id, user_id):
+    """Remove a member (owner), or leave the vault (any other member)"""
+    member = _membership_or_404(vault_id)
+    vault = member.vault
+    if user_id != current_user.id and vault.owner_id != current_user.id:
+        abort(404)
+    if user_id == vault.owner_id:
+        flash('The owner cannot leave the vault; delete it instead.', 'error')
+        return redirect(url_for('vaults.view_vault', vault_id=vault_id))
+    
+    removed = membership(vault_id, user_id)
+    form = DeleteConfirmationForm()
+    if removed is not None and form.validate_on_submit():
+        email = removed.user.email
+        db.session.delete(removed)
+        db.session.commit()
+        audit('vault_member_removed', f'{email} ({vault.name})')
+        if user_id == current_user.id:
+            flash('You left the vault.', 'info')
+            return redirect(url_for('vaults.list_vaults'))
+        flash(f'{email} no longer has access to this vault.', 'info')
+    
+    return redirect(url_for('vaults.view_vault', vault_id=vault_id))
+
+@vaults_bp.route('/<int:vault_id>/delete', methods=['POST'])
+@login_required
+def delete_vault(vault_id):
+    """Delete a vault with all its entries (owner only)"""
+    member = _owned_or_404(vault_id)
+    vault = member.vault
+    form = DeleteConfirmationForm()
+    
+    if form.validate_on_submit():
+        db.session.delete(vault)
+        db.session.commit()
+        audit('vault_deleted', vault.name)
+        flash('Vault deleted.', 'success')
+        return redirect(url_for('vaults.list_vaults'))
+    
+    return redirect(url_for('vaults.view_vault', vault_id=vault_id))